@@ -10,40 +10,128 @@ https://github.com/anssilaukkarinen/bfty
 
 """
 
+import itertools
 import os
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 
+import data_cache
+import plots
+import sky_models
+import solar_geometry
+import psychrometrics
+import instrumentation
+import stations
 
-def main(data_all, year_names, year_name_titles):
+
+def main(data_all, year_names, year_name_titles, make_plots=True, \
+         n_workers=1, export_csv=True, sky_model_names=None):
     
     d = {}
     
     for year_name in year_names:
         
-        if 'jok' in year_name:
-            # jok as in Jokioinen
-            latitude = 60.81
-            longitude = 23.50
-        elif 'van' in year_name:
-            # van as in Vantaa
-            latitude = 60.33
-            longitude = 24.96
-        elif 'hol' in year_name:
-            # hol as in Holzkirchen
-            latitude = 47.88
-            longitude = 11.70
-        else:
-            print('Error in location!')
-            
-        year_name_title = year_name_titles[year_name]
+        # Location from the station registry, see stations.py
+        station = stations.get_station(year_name)
+        
+        year_name_title = year_name_titles.get(year_name, year_name)
         
-        obj = LWrad(data_all[year_name], latitude, longitude, \
-                    year_name, year_name_title)
+        with instrumentation.stage('LWrad', year_name):
+            obj = LWrad(data_all[year_name], station['latitude'], \
+                        station['longitude'], year_name, year_name_title, \
+                        plot=False, export_csv=export_csv, \
+                        sky_model_names=sky_model_names, \
+                        time_zone=station['time_zone'])
         d[year_name] = obj
+    
+    # The figures of all years are rendered at the end, in parallel if
+    # n_workers > 1 (None = number of CPUs)
+    if make_plots:
+        jobs = itertools.chain.from_iterable( \
+                    [d[year_name].get_plot_jobs() for year_name in year_names])
+        with instrumentation.stage('LWrad_plots'):
+            plots.render_plots(jobs, n_workers)
         
     return(d)
+
+
+def get_half_hour_buffers(shape):
+    """
+    Returns the arrays of LWrad.calc_half_hour_air() for inputs of the
+    given shape. The same buffers can be reused for many calls, e.g. for
+    the batches of an ensemble, see ensemble.py.
+    """
+    
+    return({key: np.empty(shape) for key in ['T_air', 'T_dew', 've', \
+                                              've_half_hour', 'work']})
+
+
+def interpolate_half_hour(x, out):
+    # Values at the middle of the hours, the last value is kept
+    np.subtract(x[...,1:], x[...,0:-1], out=out[...,0:-1])
+    np.multiply(out[...,0:-1], 0.5, out=out[...,0:-1])
+    np.add(x[...,0:-1], out[...,0:-1], out=out[...,0:-1])
+    out[...,-1] = x[...,-1]
+    return(out)
+
+
+def calc_stations(data_all, year_names):
+    """
+    Calculates the longwave radiation of many stations at once. The solar
+    geometry, clearness index, sky emissivity and LWdn are (n_stations,
+    n_steps) arrays, instead of one LWrad object per station. The
+    locations are read from the station registry (stations.py), and all
+    test years must have the same time axis.
+    
+    Returns a dictionary with the keys 'names' (year_names) and e.g.
+    'I_0', 'K_t', 'T_air', 'T_dew', 'epsilon_sky', 'LWdn', 'T_sky' and
+    'dT_sky'. The rows are the same as the attributes of the LWrad objects.
+    """
+    
+    dfs = [data_all[year_name] for year_name in year_names]
+    n_steps = len(dfs[0].index)
+    for year_name, df in zip(year_names, dfs):
+        if len(df.index) != n_steps:
+            raise ValueError('The test years have different lengths: ' \
+                             + year_names[0] + ', ' + year_name)
+    
+    time_index = None
+    if isinstance(dfs[0].index, pd.DatetimeIndex):
+        time_index = dfs[0].index
+    
+    station_list = [stations.get_station(year_name) for year_name in year_names]
+    location = {key: np.array([x[key] for x in station_list])[:, None] \
+                for key in ['latitude', 'longitude', 'time_zone']}
+    
+    def stack(col_name):
+        return(np.vstack([df.loc[:, col_name].values for df in dfs]))
+    
+    res = {'names': list(year_names)}
+    
+    # One set of buffers for all stations
+    buffers = get_half_hour_buffers((len(year_names), n_steps))
+    res['T_air'], res['T_dew'] = LWrad.calc_half_hour_air(stack('Te'), \
+                                                          stack('RHe_water'), \
+                                                          buffers)
+    
+    geometry = solar_geometry.calc_solar_geometry(location['latitude'], \
+                                                  location['longitude'], \
+                                                  n_steps, time_index, \
+                                                  location['time_zone'])
+    res['I_0'] = geometry['I_0']
+    
+    res['K_t'], K_t_days = LWrad.calc_clearness_index(res['I_0'], \
+                                                      stack('Rglob'))
+    
+    res['epsilon_sky'] = sky_models.emissivity_mundt_petersen(res['T_dew'], \
+                                                              res['T_air'], \
+                                                              res['K_t'])
+    sigma_SB = 5.67e-8
+    res['LWdn'] = res['epsilon_sky'] * sigma_SB * res['T_air']**4
+    res['T_sky'] = (res['LWdn']/sigma_SB)**0.25
+    res['dT_sky'] = res['T_sky'] - res['T_air']
+    
+    return(res)
     
     
     
@@ -57,42 +145,40 @@ class LWrad():
     """
     
     
-    def __init__(self, data, latitude, longitude, year_name, year_name_title):
+    def __init__(self, data, latitude, longitude, year_name, year_name_title, \
+                 plot=True, export_csv=True, sky_model_names=None, \
+                 time_zone=2.0):
         """
         "data" is a pandas dataframe of one building physical test year
+        If "plot" is False, the figures are not created, but they can be
+        created later with make_plots() or get_plot_jobs()
+        If "export_csv" is False, the results are not written to the 
+        LWrad folder, but they are available as attributes, e.g. self.LWdn
+        "sky_model_names" is a list of the sky emissivity models in 
+        sky_models.py that are calculated for comparison, or None
+        "time_zone" is the time zone of the data, h from UTC
         """
         
         # Imports and preparations
         self.data = data
+        self.latitude_deg = latitude
         self.latitude_rad = latitude * (np.pi/180)
         self.longitude_deg = longitude
+        self.time_zone = time_zone
         self.year_name = year_name
         self.year_name_title = year_name_title
         self.sigma_SB = 5.67e-8
         
         self.n_steps = len(self.data.index)
         
-        # T and RH in the input data are instantaneous values, but the 
-        # radiation values are average values for the preceding hour.
-        # The radiation values are kept intact, but the T and RH are 
-        # interpolated so that there is a better match of the timestamps.
-        Te_on_hour = data.loc[:,'Te'].values
-        Te_half_hour = np.zeros(len(Te_on_hour))
-        Te_half_hour[0:-1] = Te_on_hour[0:-1] + 0.5*(Te_on_hour[1:] - Te_on_hour[0:-1])
-        Te_half_hour[-1] = Te_on_hour[-1]
-        
-        RHe_on_hour = data.loc[:,'RHe_water'].values
-        ve_on_hour = self.calc_v(Te_on_hour, RHe_on_hour)
-        ve_half_hour = np.zeros(len(ve_on_hour))
-        ve_half_hour[0:-1] = ve_on_hour[0:-1] + 0.5*(ve_on_hour[1:]-ve_on_hour[0:-1])
-        ve_half_hour[-1] = ve_on_hour[-1]
-        
-        vesat_half_hour = self.calc_v(Te_half_hour, 100.0)
-        RHe_half_hour = 100.0 * (ve_half_hour/vesat_half_hour)
-        
+        if isinstance(self.data.index, pd.DatetimeIndex):
+            self.time_index = self.data.index
+        else:
+            self.time_index = None
         
-        self.T_dew = self.calc_T_dew(Te_half_hour, RHe_half_hour)
-        self.T_air = Te_half_hour + 273.15
+        self.T_air, self.T_dew = self.calc_half_hour_air( \
+                                        data.loc[:,'Te'].values, \
+                                        data.loc[:,'RHe_water'].values)
         self.I_glob = data.loc[:,'Rglob'].values
         
         
@@ -100,10 +186,9 @@ class LWrad():
         # Calculations
         self.calc_K_t()
         
-        self.epsilon_sky = 1.5357 \
-                    + 0.5981*(self.T_dew/100) \
-                    - 0.5687*(self.T_air/273.15) \
-                    - 0.2799*self.K_t
+        self.epsilon_sky = sky_models.emissivity_mundt_petersen(self.T_dew, \
+                                                               self.T_air, \
+                                                               self.K_t)
         
         self.LWdn = self.epsilon_sky * self.sigma_SB * self.T_air**4
         
@@ -111,48 +196,93 @@ class LWrad():
         
         self.dT_sky = self.T_sky - self.T_air
         
+        if sky_model_names is not None:
+            self.calc_sky_models(sky_model_names)
+        
         
         # Export results
-        if not os.path.exists('LWrad'):
-            os.makedirs('LWrad')
+        if plot or export_csv:
+            if not os.path.exists('LWrad'):
+                os.makedirs('LWrad', exist_ok=True)
+        
+        if plot:
+            self.make_plots()
+        
+        if export_csv:
+            self.export_intermediate_results_to_csv()
+            self.export_final_results_to_csv()
+    
+    
+    @staticmethod
+    def calc_half_hour_air(Te_on_hour, RHe_on_hour, buffers=None):
+        """
+        Returns the air temperature (K) and dew point temperature (degC)
+        at the middle of the hours.
+        
+        T and RH in the input data are instantaneous values, but the 
+        radiation values are average values for the preceding hour.
+        The radiation values are kept intact, but the T and RH are 
+        interpolated so that there is a better match of the timestamps.
+        The time is the last axis, so the inputs can also be
+        (n_members, n_steps) arrays, see ensemble.py.
+        buffers is the dictionary of get_half_hour_buffers(), or None. The
+        returned arrays are the buffers 'T_air' and 'T_dew', which are
+        overwritten by the next call with the same buffers.
+        """
+        
+        Te_on_hour = np.asarray(Te_on_hour, dtype=float)
+        if buffers is None:
+            buffers = get_half_hour_buffers(Te_on_hour.shape)
+        work = buffers['work']
+        
+        Te_half_hour = interpolate_half_hour(Te_on_hour, buffers['T_air'])
+        
+        ve_on_hour = psychrometrics.vapour_content(Te_on_hour, RHe_on_hour, \
+                                                   buffers['ve'], work)
+        ve_half_hour = interpolate_half_hour(ve_on_hour, buffers['ve_half_hour'])
+        
+        # RHe_half_hour = 100.0 * (ve_half_hour/vesat_half_hour)
+        RHe_half_hour = psychrometrics.vapour_content(Te_half_hour, 100.0, \
+                                                      buffers['ve'], work)
+        np.divide(ve_half_hour, RHe_half_hour, out=RHe_half_hour)
+        np.multiply(RHe_half_hour, 100.0, out=RHe_half_hour)
         
-        self.make_plots()
+        T_dew = psychrometrics.dew_point(Te_half_hour, RHe_half_hour, \
+                                         buffers['T_dew'], work)
+        T_air = np.add(Te_half_hour, 273.15, out=Te_half_hour)
         
-        self.export_intermediate_results_to_csv()
-        self.export_final_results_to_csv()
+        return(T_air, T_dew)
     
     
     @staticmethod
-    def calc_v(T, RH):
+    def calc_v(T, RH, out=None, work=None):
         """
         Calculate the water vapour concentration from T and RH, kg/m3
         RH is given with respect to liquid water
-        CIMO guide measurement of humidity
+        CIMO guide measurement of humidity, see psychrometrics.py
         """
         
-        psat = 611.2 * np.exp((17.62*T) / (243.12+T))
-        v = (RH/100.0) * psat / (461.5*(273.15+T))
-        return(v)
+        return(psychrometrics.vapour_content(T, RH, out, work))
     
     
-    def calc_T_dew(self, T, RH):
+    def calc_T_dew(self, T, RH, out=None, work=None):
         """
         Calculates the dew point temperature from air temperature
-        and relative humidity
+        and relative humidity, see psychrometrics.py
         """
-        psat = (RH/100.0) * 611.2 * np.exp((17.62*T)/(234.12+T))
-        
-        theta_dew = np.log(psat/611.2)*234.12 / (17.62 - np.log(psat/611.2))
-        
-        return(theta_dew)
+        return(psychrometrics.dew_point(T, RH, out, work))
         
     
     def calc_K_t(self):
         """
         Calculates the clearness index
         
-        It is assumed that the data starts from Jan 1st 00:00
-        and lasts for 8760 hours
+        It is assumed that the data starts from midnight and that the
+        number of time steps is an integer multiple of 24. If the data has
+        a pandas DatetimeIndex, it is used to get the time from the
+        beginning of the year and the length of each year. Otherwise the
+        data is assumed to start from Jan 1st 00:00 and every year is
+        assumed to be 8760 hours long.
         
         The measured solar radiation is the mean flux from the previous hour,
         so dt = 0.5 hours has been added to time stamps to align the 
@@ -162,138 +292,146 @@ class LWrad():
         idx = 0 -> 00:30, idx = 1 -> 01:30, etc
         """
         
-        t = np.arange(self.n_steps) + 0.5
-        
-        # Declination angle
-        self.declination_rad = 23.45 * (np.pi/180) \
-                                * np.sin(2*np.pi * (t-1944)/8760)
-        
-        # Time of day
-        self.CL = np.tile(np.arange(24)+0.5, int(self.n_steps/24))
+        # The solar geometry is shared by the test years of the same
+        # location, see solar_geometry.py
+        geometry = solar_geometry.get_solar_geometry(self.latitude_deg, \
+                                                     self.longitude_deg, \
+                                                     self.n_steps, \
+                                                     self.time_index, \
+                                                     self.time_zone)
+        
+        self.year_hours = geometry['year_hours']
+        self.declination_rad = geometry['declination_rad']
+        self.CL = geometry['CL']
+        self.Gamma = geometry['Gamma']
+        self.ET = geometry['ET']
+        self.AST = geometry['AST']
+        self.omega_rad = geometry['omega_rad']
+        self.I_sc = solar_geometry.I_sc
+        self.r = geometry['r']
+        self.I_0 = geometry['I_0']
         
-        # Equation of time
-        self.Gamma = 2*np.pi * (t/8760.0)
-        dummy1 = 0.0075 \
-                + 0.1868*np.cos(self.Gamma) \
-                - 3.2077*np.sin(self.Gamma) \
-                - 1.4615*np.cos(2*self.Gamma) \
-                -4.089*np.sin(2*self.Gamma)
-        self.ET = 2.2918*dummy1
-        
-        # Apparent solar time
-        self.AST = self.CL + self.ET/60.0 + (self.longitude_deg-30)/15.0
-        
-        # Hour angle
-        self.omega_rad = (np.pi/180) * 15 * (self.AST - 12.0)
+        # Clearness index
+        self.K_t, self.K_t_days = self.calc_clearness_index(self.I_0, \
+                                                            self.I_glob)
+    
+    
+    @staticmethod
+    def calc_clearness_index(I_0, I_glob):
+        """
+        Returns the hourly clearness index and the (n_halves, 2) array of
+        the time (h) and clearness index of the half days.
+        
+        The days are divided to morning (00-13) and evening (13-24) halves.
+        The clearness index of each half is placed to the middle of the
+        hours with the sun above the horizon. If the sun does not rise
+        during a half, K_t = 0.5 and the position of the previous day
+        is used.
+        The time is the last axis, so the inputs can also be
+        (n_stations, n_steps) arrays, see calc_stations().
+        """
         
-        # Solar constant
-        self.I_sc = 1367.0
+        n_steps = I_0.shape[-1]
+        n_days = n_steps // 24
+        shape = I_0.shape[:-1]
+        I_0_days = I_0.reshape(shape + (n_days, 24))
+        I_glob_days = I_glob.reshape(shape + (n_days, 24))
+        
+        is_up = I_0_days > 0
+        I_0_sums = np.zeros(shape + (n_days, 2))
+        I_glob_sums = np.zeros(shape + (n_days, 2))
+        n_up = np.zeros(shape + (n_days, 2))
+        for idx, hours in enumerate([slice(0, 13), slice(13, 24)]):
+            I_0_sums[..., idx] = np.where(is_up[..., hours], \
+                                          I_0_days[..., hours], 0.0).sum(axis=-1)
+            I_glob_sums[..., idx] = np.where(is_up[..., hours], \
+                                             I_glob_days[..., hours], 0.0).sum(axis=-1)
+            n_up[..., idx] = is_up[..., hours].sum(axis=-1)
+        
+        has_sun = I_0_sums > 0.0
+        
+        K_t_halves = np.full(shape + (n_days, 2), 0.5)
+        np.divide(I_glob_sums, I_0_sums, out=K_t_halves, where=has_sun)
+        
+        # Position of the mid-point within the half day, which is carried
+        # over from the previous day when the sun does not rise
+        t_half = np.stack((13 - n_up[..., 0]/2, n_up[..., 1]/2), axis=-1)
+        t_half_first = np.array([9.0, 3.0])
+        idx_last_sun = np.where(has_sun, np.arange(n_days)[:, None], -1)
+        idx_last_sun = np.maximum.accumulate(idx_last_sun, axis=-2)
+        t_half = np.where(idx_last_sun >= 0, \
+                          np.take_along_axis(t_half, np.maximum(idx_last_sun, 0), axis=-2), \
+                          t_half_first)
+        
+        t_days = np.arange(n_days)[:, None]*24 + np.array([0.0, 13.0]) + t_half
+        
+        K_t_days = np.stack((t_days.reshape(shape + (-1,)), \
+                             K_t_halves.reshape(shape + (-1,))), axis=-1)
+        
+        # The times of the half days differ between the stations
+        K_t = np.empty(I_0.shape)
+        for idx in np.ndindex(shape):
+            K_t[idx] = np.interp(np.arange(n_steps), K_t_days[idx][:,0], \
+                                 K_t_days[idx][:,1])
+        
+        return(K_t, K_t_days)
         
-        # Eccentricity factor
-        self.r = 1 + 0.033 * np.cos(2*np.pi*(t-3*24)/8760)
+    
+    def calc_sky_models(self, model_names=None):
+        """
+        Calculates the effective sky emissivity and LWdn with several 
+        models (see sky_models.py) using the same T_air, T_dew and K_t.
+        The results are (n_models, n_steps) arrays in the order of
+        self.sky_model_names.
+        """
         
-        # Solar radiation to horizontal surface without atmosphere
-        dummy2 = np.cos(self.latitude_rad) \
-                * np.cos(self.declination_rad) \
-                * np.cos(self.omega_rad) \
-                + np.sin(self.latitude_rad) * np.sin(self.declination_rad)
-        self.I_0 = self.r * self.I_sc * dummy2
+        if model_names is None:
+            model_names = list(sky_models.models.keys())
         
-        # Clearness index
-        self.K_t_days = np.zeros(( int(self.n_steps/24)*2, 2))
-        t_half_morning = 9
-        t_half_evening = 3
-        
-        for day in range(int(self.n_steps/24)):
-            # Loop through all the days
-            
-            # Morning
-            I_0_morning = self.I_0[(day*24):(day*24+13)]
-            I_glob_morning = self.I_glob[(day*24):(day*24+13)]
-            
-            I_0_morning_sum = np.sum(I_0_morning[I_0_morning > 0])
-            I_glob_morning_sum = np.sum(I_glob_morning[I_0_morning > 0])
-            
-            if I_0_morning_sum > 0.0:
-                t_half_morning = 13 - np.sum(I_0_morning > 0)/2
-                self.K_t_days[day*2, 1] = I_glob_morning_sum/I_0_morning_sum
-            else:
-                self.K_t_days[day*2, 1] = 0.5
-            
-            self.K_t_days[day*2, 0] = day*24 + t_half_morning
-        
-            
-            # Evening
-            I_0_evening = self.I_0[(day*24+13):((day+1)*24)]
-            I_glob_evening = self.I_glob[(day*24+13):((day+1)*24)]
-            
-            I_0_evening_sum = np.sum(I_0_evening[I_0_evening > 0])
-            I_glob_evening_sum = np.sum(I_glob_evening[I_0_evening > 0])
-            
-            if I_0_evening_sum > 0.0:
-                t_half_evening = np.sum(I_0_evening > 0)/2
-                self.K_t_days[day*2+1, 1] = I_glob_evening_sum/I_0_evening_sum
-            else:
-                self.K_t_days[day*2+1, 1] = 0.5
-                
-            self.K_t_days[day*2+1, 0] = day*24 + 13 + t_half_evening
-        
-        
-        self.K_t = np.interp(np.arange(self.n_steps), self.K_t_days[:,0], \
-                             self.K_t_days[:,1])
+        self.sky_model_names = list(model_names)
+        self.epsilon_sky_models = sky_models.calc_emissivities(self.T_air, \
+                                        self.T_dew, self.K_t, self.sky_model_names)
+        self.LWdn_models = sky_models.calc_LWdn(self.epsilon_sky_models, \
+                                                self.T_air, self.sigma_SB)
         
     
-    def make_plots(self):
+    def get_plot_jobs(self):
         """
-        This function creates plots from LWdn, emissivity_sky and dT_sky
+        This function returns the plot jobs (see plots.py) of LWdn,
+        emissivity_sky, T_sky and dT_sky
         Temperature difference between air and sky is defined as:
         LWdn = emissivity_sky * sigma * T_air**4 = 1 * sigma * T_sky**4
         """
         
+        xlabel = 'Time from the beginning of the year, h'
+        xlim = (0, self.n_steps)
+        
+        jobs = [plots.line_plot_job('./LWrad/LWdn_' + self.year_name + '.png', \
+                                    self.LWdn, self.year_name_title, xlabel, \
+                                    'LWdn, W/m$^2$', \
+                                    xlim=xlim, ylim=(125, 450), figsize=(4,3)), \
+                plots.line_plot_job('./LWrad/Emissivity_' + self.year_name + '.png', \
+                                    self.epsilon_sky, self.year_name_title, xlabel, \
+                                    'Effective sky emissivity, -', \
+                                    xlim=xlim, ylim=(0.60, 1.05), figsize=(4,3)), \
+                plots.line_plot_job('./LWrad/Tskyeff_' + self.year_name + '.png', \
+                                    self.T_sky, self.year_name_title, xlabel, \
+                                    'Tsky,eff, K', \
+                                    xlim=xlim, ylim=(220, 300), figsize=(4,3)), \
+                plots.line_plot_job('./LWrad/dTsky_' + self.year_name + '.png', \
+                                    self.dT_sky, self.year_name_title, xlabel, \
+                                    'dT = Tsky - Tair, $\\degree$C', \
+                                    xlim=xlim, ylim=(-30, 5), figsize=(4,3))]
+        
+        return(jobs)
+    
+    
+    def make_plots(self):
+        """
+        This function creates plots from LWdn, emissivity_sky and dT_sky
+        """
         
-        plt.figure(figsize=(4,3))
-        plt.plot(self.LWdn)
-        plt.title(self.year_name_title)
-        plt.xlabel('Time from the beginning of the year, h')
-        plt.ylabel('LWdn, W/m$^2$')
-        plt.axis([0, self.n_steps, 125, 450])
-        plt.grid()
-        plt.savefig('./LWrad/LWdn_' + self.year_name + '.png', \
-                    dpi=200, bbox_inches='tight')
-        plt.close()
-        
-        plt.figure(figsize=(4,3))
-        plt.plot(self.epsilon_sky)
-        plt.title(self.year_name_title)
-        plt.xlabel('Time from the beginning of the year, h')
-        plt.ylabel('Effective sky emissivity, -')
-        plt.axis([0, self.n_steps, 0.60, 1.05])
-        plt.grid()
-        plt.savefig('./LWrad/Emissivity_' + self.year_name + '.png', \
-                    dpi=200, bbox_inches='tight')
-        plt.close()
-        
-        plt.figure(figsize=(4,3))
-        plt.plot(self.T_sky)
-        plt.title(self.year_name_title)
-        plt.xlabel('Time from the beginning of the year, h')
-        plt.ylabel('Tsky,eff, K')
-        plt.axis([0, self.n_steps, 220, 300])
-        plt.grid()
-        plt.savefig('./LWrad/Tskyeff_' + self.year_name + '.png', \
-                    dpi=200, bbox_inches='tight')
-        plt.close()
-        
-        plt.figure(figsize=(4,3))
-        plt.plot(self.dT_sky)
-        plt.title(self.year_name_title)
-        plt.xlabel('Time from the beginning of the year, h')
-        plt.ylabel('dT = Tsky - Tair, $\degree$C')
-        plt.axis([0, self.n_steps, -30, 5])
-        plt.grid()
-        plt.savefig('./LWrad/dTsky_' + self.year_name + '.png', \
-                    dpi=200, bbox_inches='tight')
-        plt.close()
+        plots.render_plots(self.get_plot_jobs())
         
         
     def export_intermediate_results_to_csv(self):
@@ -304,10 +442,12 @@ class LWrad():
         
         dummy = np.array((self.T_air, self.T_dew, \
                           self.I_glob, self.I_0, self.K_t)).T
-        np.savetxt('./LWrad/'+self.year_name+'_Tair_Tdew_Iglob_I0_Kt.csv', \
+        fname = './LWrad/'+self.year_name+'_Tair_Tdew_Iglob_I0_Kt.csv'
+        np.savetxt(fname, \
                    dummy, \
                    fmt='%-10.3f', \
                    header='Tair(K)   Tdew(degC) Iglob(W/m2)  I0(W/m2)   Kt(-)')
+        instrumentation.record_output(fname)
         
         
         
@@ -319,9 +459,11 @@ class LWrad():
         
         dummy = np.array((self.LWdn, self.epsilon_sky, \
                           self.T_sky, self.dT_sky)).T
-        np.savetxt('./LWrad/'+self.year_name + '_LWdn_emissivity_Tsky_dTsky.csv', \
+        fname = './LWrad/'+self.year_name + '_LWdn_emissivity_Tsky_dTsky.csv'
+        np.savetxt(fname, \
                    dummy, fmt=['%10.2f', '%10.3f', '%15.2f', '%15.2f'], \
                    header='LWdn(W/m2)  emis_sky(-)     T_sky(K)       dTsky(degC)')
+        instrumentation.record_output(fname)
         
 
         
@@ -341,14 +483,14 @@ if __name__ == '__main__':
                     'van2050':'Vantaa 2050', \
                     'van2100':'Vantaa 2100'}
     
-    fname = './input/bf_test_years_2020-04-20.xlsx'
+    input_folder = './input'
     
     
     
     ##
     
     
-    data_all = pd.read_excel(fname, sheet_name=year_names)
+    data_all = data_cache.load_test_years(year_names, input_folder)
     
     output = main(data_all, year_names, year_name_titles)
     
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the per-line Delphin .ccd writer that was used earlier in
+climate_files.py with writers.write_ccd(). The output files are checked
+to be identical.
+
+Run from the root folder of the repository:
+python benchmarks/bench_ccd_writer.py
+
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import data_cache
+import writers
+
+
+def write_ccd_per_line(fname, header, x, is_WDR):
+    # The earlier implementation in climate_files.py
+    with open(fname, 'w') as f:
+        f.write(header + '\n')
+        for t in range(len(x)):
+            hour = t % 24
+            day = int((t-hour)/24)
+            val = x[t]
+            
+            if is_WDR:
+                linetowrite = '{:<4d} {:02d}:00:00 {:.2e}'.format(day, hour, val)
+            else:
+                linetowrite = '{:<4d} {:02d}:00:00 {:.2f}'.format(day, hour, val)
+            
+            f.writelines(linetowrite + '\n')
+
+
+def run_writer(folder, data, use_bulk_writer):
+    # 8 data columns and one WDR-like column per year, two Delphin versions
+    t_start = time.perf_counter()
+    
+    for year, df in data.items():
+        for version in ['D5', 'D6']:
+            for col_name in list(df.columns) + ['WDR']:
+                if col_name == 'WDR':
+                    x = df.loc[:, 'precip'].values * 1e-4
+                else:
+                    x = df.loc[:, col_name].values
+                fname = os.path.join(folder, version + '_' + year + '_' + col_name + '.ccd')
+                
+                if use_bulk_writer:
+                    if col_name == 'WDR':
+                        writers.write_ccd(fname, 'header', x, '%.2e')
+                    else:
+                        writers.write_ccd(fname, 'header', x, '%.2f')
+                else:
+                    write_ccd_per_line(fname, 'header', x, col_name == 'WDR')
+    
+    return(time.perf_counter() - t_start)
+
+
+if __name__ == '__main__':
+    
+    input_folder = os.path.join(os.path.dirname(__file__), '..', 'input')
+    data = data_cache.load_test_years(input_folder=input_folder)
+    
+    with tempfile.TemporaryDirectory() as folder_old, \
+            tempfile.TemporaryDirectory() as folder_new:
+        
+        dt_old = run_writer(folder_old, data, use_bulk_writer=False)
+        dt_new = run_writer(folder_new, data, use_bulk_writer=True)
+        
+        fnames = sorted(os.listdir(folder_old))
+        n_diff = 0
+        for fname in fnames:
+            with open(os.path.join(folder_old, fname), 'rb') as f:
+                b_old = f.read()
+            with open(os.path.join(folder_new, fname), 'rb') as f:
+                b_new = f.read()
+            if b_old != b_new:
+                n_diff += 1
+    
+    print('Files written:', len(fnames))
+    print('Per-line writer, s:', round(dt_old, 3))
+    print('Bulk writer, s:', round(dt_new, 3))
+    print('Speedup:', round(dt_old/dt_new, 1))
+    print('Files that differ:', n_diff)
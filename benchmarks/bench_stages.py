@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Times each stage of LWrad.py and climate_files.py separately and reports
+the time and the peak memory of each stage. The results are compared
+with a stored baseline (benchmarks/baseline.json), and the stages that
+are slower or use more memory than --tolerance times the baseline are
+reported. The comparison only reports the regressions and does not fail.
+
+The suites are:
+bundled     the eight test years in the folder input
+30years     one test year repeated 30 times (262800 hours)
+100stations one test year at 100 different locations
+
+The time is the fastest of --repeat runs. The peak memory is the increase
+of the peak resident set size during the first run. It is read from
+/proc/self/status on Linux, elsewhere it is measured with tracemalloc in
+a separate run (only the memory allocated by Python and numpy).
+The writer stages are timed as process_year() writing only the files of
+one format, minus process_year() writing nothing.
+
+Run from the root folder of the repository:
+python benchmarks/bench_stages.py
+python benchmarks/bench_stages.py --suites bundled --save-baseline
+
+The bundled baseline was saved on one computer and the results depend on
+the computer, so save the baseline again on the computer where the
+benchmarks are run before comparing.
+
+"""
+
+import argparse
+import contextlib
+import ctypes
+import ctypes.util
+import gc
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+
+root_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root_folder)
+
+import prn_files
+import data_cache
+import LWrad
+import climate_files
+import solar_geometry
+import plots
+import stations
+
+
+baseline_fname_default = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# The folders of the output formats, see climate_files.get_output_dependencies()
+format_folders = {'csv': '/csv/', \
+                  'Delphin5': '/Delphin5/', \
+                  'Delphin6': '/Delphin6/', \
+                  'WUFI': '/WUFI/'}
+
+def read_proc_status(key):
+    # Returns a memory value (MB) from /proc/self/status, e.g. VmRSS
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith(key + ':'):
+                return(float(line.split()[1]) / 1024)
+    raise KeyError(key)
+
+
+def release_free_memory():
+    # Returns the freed heap memory to the operating system (glibc), so
+    # that it is not reused silently by the next stage
+    gc.collect()
+    try:
+        ctypes.CDLL(ctypes.util.find_library('c')).malloc_trim(0)
+    except (OSError, AttributeError, TypeError):
+        pass
+
+
+def reset_peak_rss():
+    """
+    Resets the peak resident set size (VmHWM) of the process and returns
+    True, or False if it is not possible (other than Linux)
+    """
+    
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        read_proc_status('VmHWM')
+    except (OSError, KeyError):
+        return(False)
+    
+    return(True)
+
+
+def measure(func, repeat=1):
+    """
+    Returns the fastest run time (s) of func() and the peak memory
+    (MB) that is allocated during one run
+    """
+    
+    # The progress prints of the stages are not shown
+    with contextlib.redirect_stdout(io.StringIO()):
+        times = []
+        peak = None
+        for idx in range(repeat):
+            release_free_memory()
+            use_rss = idx == 0 and reset_peak_rss()
+            if use_rss:
+                rss_start = read_proc_status('VmRSS')
+            t_start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - t_start)
+            if use_rss:
+                peak = read_proc_status('VmHWM') - rss_start
+        
+        if peak is None:
+            gc.collect()
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+    
+    return(min(times), peak)
+
+
+def make_LWrad(data, year_names):
+    # LWrad objects without the cached solar geometry
+    solar_geometry.clear_cache()
+    objs = {}
+    for year_name in year_names:
+        station = stations.get_station(year_name)
+        objs[year_name] = LWrad.LWrad(data[year_name], station['latitude'], \
+                                      station['longitude'], year_name, \
+                                      year_name, plot=False, export_csv=False, \
+                                      time_zone=station['time_zone'])
+    return(objs)
+
+
+def calc_K_t(objs):
+    solar_geometry.clear_cache()
+    for obj in objs.values():
+        obj.calc_K_t()
+
+
+def calc_indoor_air(data):
+    for df in data.values():
+        climate_files.calc_indoor_air(df['Te'], df['RHe_water'], \
+                                      climate_files.window_width)
+
+
+def calc_dP(data):
+    for df in data.values():
+        Ti = climate_files.T_S2(df['Te'].rolling(24, min_periods=1).mean())
+        climate_files.calc_dP(df['Te'].values, Ti, 101325.0, \
+                              df['ws'].values, df['wd'].values, \
+                              climate_files.h, climate_files.orientation)
+
+
+def calculate_I_A(data):
+    for df in data.values():
+        climate_files.calculate_I_A_array(df['ws'].values, df['wd'].values, \
+                                          df['precip'].values, df['Te'].values, \
+                                          climate_files.Te_min, \
+                                          climate_files.orientation)
+
+
+def process_years(data, LWdn, output_format=None):
+    """
+    Runs climate_files.process_year() for all years, writing only the
+    files of output_format ('csv', 'Delphin5', ...) or nothing (None)
+    """
+    
+    for year_name, df in data.items():
+        outputs = set()
+        if output_format is not None:
+            fnames = climate_files.get_output_dependencies(year_name, False)
+            outputs = set([x for x in fnames \
+                           if format_folders[output_format] in x])
+        climate_files.process_year(year_name, df.copy(), year_name, \
+                                   LWdn[year_name], outputs)
+
+
+def render_plots(objs):
+    # One figure per year
+    jobs = [obj.get_plot_jobs()[0] for obj in objs.values()]
+    plots.render_plots(jobs)
+
+
+def run_suite(suite, data, repeat=1, include_xlsx=True):
+    """
+    Runs the stages of one suite and returns a dictionary from the
+    stage names to {'time_s': ..., 'peak_MB': ...}
+    """
+    
+    results = {}
+    year_names = list(data.keys())
+    
+    def add(stage, func, n_repeat=repeat):
+        t, peak = measure(func, n_repeat)
+        results[stage] = {'time_s': t, 'peak_MB': peak}
+        print('{:<12s} {:<16s} {:10.3f} s {:10.1f} MB'.format(suite, stage, \
+                                                               t, peak))
+    
+    if suite == 'bundled':
+        input_folder = os.path.join(root_folder, 'input')
+        add('read_prn', lambda: prn_files.read_test_years( \
+                                    input_folder=input_folder))
+        if include_xlsx:
+            add('read_xlsx', lambda: pd.read_excel( \
+                    os.path.join(input_folder, 'bf_test_years_2020-04-20.xlsx'), \
+                    sheet_name=year_names), n_repeat=1)
+        with tempfile.TemporaryDirectory() as cache_folder:
+            data_cache.load_test_years(input_folder=input_folder, \
+                                       cache_folder=cache_folder)
+            add('read_cache', lambda: data_cache.load_test_years( \
+                                    input_folder=input_folder, \
+                                    cache_folder=cache_folder))
+    
+    objs = make_LWrad(data, year_names)
+    LWdn = {year_name: objs[year_name].LWdn for year_name in year_names}
+    
+    add('LWrad', lambda: make_LWrad(data, year_names))
+    if suite == '100stations':
+        add('LWrad_batch', lambda: LWrad.calc_stations(data, year_names))
+    add('calc_K_t', lambda: calc_K_t(objs))
+    add('indoor_air', lambda: calc_indoor_air(data))
+    add('calc_dP', lambda: calc_dP(data))
+    add('calculate_I_A', lambda: calculate_I_A(data))
+    
+    if suite == 'bundled':
+        add('plots', lambda: render_plots(objs), n_repeat=1)
+    
+    add('process_year', lambda: process_years(data, LWdn))
+    t_base = results['process_year']['time_s']
+    
+    for output_format in format_folders.keys():
+        if suite == '100stations' and output_format != 'WUFI':
+            continue
+        stage = 'write_' + output_format
+        add(stage, lambda: process_years(data, LWdn, output_format))
+        results[stage]['time_s'] = max(results[stage]['time_s'] - t_base, 0.0)
+    
+    return(results)
+
+
+def get_suite_data(suite, data_bundled):
+    # Input data of the suite
+    
+    if suite == 'bundled':
+        return(data_bundled)
+    
+    elif suite == '30years':
+        df = pd.concat([data_bundled['jok2004']]*30, ignore_index=True)
+        return({'jok1991-2020': df})
+    
+    elif suite == '100stations':
+        data = {}
+        for idx in range(100):
+            name = 'van' + str(idx).zfill(3)
+            data[name] = data_bundled['van2007']
+            stations.add_station(name, 60.33 + 0.01*idx, 24.96 + 0.01*idx, 51)
+        return(data)
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Prints the ratios to the baseline and returns the number of stages
+    that are slower or use more memory than tolerance * baseline
+    """
+    
+    n_regressions = 0
+    for key, x in results.items():
+        if key not in baseline:
+            continue
+        for metric in ['time_s', 'peak_MB']:
+            ref = baseline[key][metric]
+            if ref <= 0.0:
+                continue
+            ratio = x[metric] / ref
+            if ratio > tolerance:
+                n_regressions += 1
+                print('REGRESSION', key, metric, \
+                      round(x[metric], 3), 'vs', round(ref, 3), \
+                      '({:.2f}x)'.format(ratio))
+    
+    return(n_regressions)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Stage-level benchmarks')
+    parser.add_argument('--suites', nargs='+', \
+                        default=['bundled', '30years', '100stations'], \
+                        choices=['bundled', '30years', '100stations'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-xlsx', action='store_true', \
+                        help='skip reading the xlsx workbook')
+    parser.add_argument('--baseline', default=baseline_fname_default)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=1.5, \
+                        help='reporting threshold as a ratio to the baseline')
+    args = parser.parse_args()
+    
+    data_bundled = data_cache.load_test_years( \
+                        input_folder=os.path.join(root_folder, 'input'))
+    
+    results = {}
+    with tempfile.TemporaryDirectory() as work_folder:
+        # process_year() writes to ./output
+        cwd = os.getcwd()
+        os.chdir(work_folder)
+        try:
+            for suite in args.suites:
+                data = get_suite_data(suite, data_bundled)
+                for stage, x in run_suite(suite, data, args.repeat, \
+                                          not args.no_xlsx).items():
+                    results[suite + '/' + stage] = x
+        finally:
+            os.chdir(cwd)
+    
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print('Baseline saved to', args.baseline)
+    
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        n_regressions = compare_to_baseline(results, baseline, args.tolerance)
+        print('Regressions:', n_regressions)
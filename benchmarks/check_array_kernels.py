@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that the array versions of the wind and driving-rain kernels in
+climate_files.py give the same results as the scalar code that loops
+over the hours, on all eight bundled test years and for facade
+orientations every 15 deg. The angle wrapping, the Te_min precipitation
+cutoff and the ice/water switch of pvsat_ice are also checked at their
+limits.
+
+cpe, cpi, the angles and dP must be identical. I_A and pvsat_ice may
+differ by rounding (relative tolerance rtol), because numpy can round the
+last bit of an array power differently from a scalar power, and
+psychrometrics.py calculates pvsat_ice in a different order.
+
+The script fails with exit status 1 if any result differs, so it can be
+used as a test, e.g. before a commit that changes the kernels.
+
+Run from the root folder of the repository:
+python benchmarks/check_array_kernels.py
+
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import data_cache
+import climate_files
+
+
+rtol = 1e-12
+
+
+def pvsat_ice_scalar(T):
+    # The earlier loop version of climate_files.pvsat_ice()
+    pvsat = np.empty(T.shape)
+    for idx,val in enumerate(T):
+        if val < 0:
+            pvsat[idx] = 611.2*np.exp(22.46*val/(272.62+val))
+        else:
+            pvsat[idx] = 611.2*np.exp(17.62*val/(243.12+val))
+    return(pvsat)
+
+
+def get_cpi_scalar(cpe):
+    # The earlier cpi loop of climate_files.calc_dP()
+    cpi = np.zeros(cpe.shape)
+    for idx, val in enumerate(cpe):
+        if val > 0.0:
+            cpi[idx] = -0.3
+        else:
+            cpi[idx] = 0.2
+    return(cpi)
+
+
+def calc_dP_scalar(Te, Ti, Pe, ws_local, wd_local, h, orientation):
+    # climate_files.calc_dP() with the scalar kernels
+    g = 9.81
+    Ra = 287.0
+    z = h/2.0
+    dPT = (g*z*Pe/Ra) * (1/(273.15+Te) - 1/(273.15+Ti))
+    Tave = (Te + Ti) / 2
+    rhoa = 101325.0 / (Ra * (273.15 + Tave))
+    cpe = climate_files.get_cpe1(wd_local, orientation)
+    cpi = get_cpi_scalar(cpe)
+    dPw = (cpi - cpe) * (0.5*rhoa*ws_local**2)
+    return(dPT, dPw, dPT + dPw)
+
+
+def check(name, x_scalar, x_array, exact=True):
+    """
+    Returns 1 if the results differ, otherwise 0, and prints the largest
+    difference
+    """
+    
+    x_scalar = np.asarray(x_scalar, dtype=float)
+    x_array = np.asarray(x_array, dtype=float)
+    
+    if exact:
+        ok = x_scalar.shape == x_array.shape and np.array_equal(x_scalar, x_array)
+    else:
+        ok = np.allclose(x_array, x_scalar, rtol=rtol, atol=0.0)
+    
+    if not ok:
+        print('DIFFERS', name, 'max abs difference:', \
+              np.max(np.abs(x_array - x_scalar)))
+        return(1)
+    return(0)
+
+
+def check_limits():
+    # The wrapping at +-180 deg, the Te_min cutoff and T = 0 degC
+    n_diff = 0
+    
+    angles = np.array([0.0, 45.0, 135.0, 180.0, 180.5, 225.0, 315.0, \
+                       359.9, 360.0, -180.0, -180.5])
+    for orientation in [0.0, 90.0, 180.0, 270.0, 359.9]:
+        a_scalar = [climate_files.get_smallest_angle(x, orientation) \
+                    for x in angles]
+        n_diff += check('angle limits', a_scalar, \
+                        climate_files.get_smallest_angle_array(angles, orientation))
+        n_diff += check('cpe limits', climate_files.get_cpe1(angles, orientation), \
+                        climate_files.get_cpe1_array(angles, orientation))
+    
+    T = np.array([-30.0, -1e-9, 0.0, 1e-9, 30.0])
+    n_diff += check('pvsat_ice limits', pvsat_ice_scalar(T), \
+                    climate_files.pvsat_ice_array(T), exact=False)
+    
+    Te_min = climate_files.Te_min
+    Te = np.array([Te_min - 1.0, Te_min - 1e-9, Te_min, Te_min + 1.0])
+    ones = np.ones(Te.shape)
+    n_diff += check('I_A limits', \
+                    climate_files.calculate_I_A(ones, 180.0*ones, ones, Te, \
+                                                Te_min, 180.0), \
+                    climate_files.calculate_I_A_array(ones, 180.0*ones, ones, \
+                                                      Te, Te_min, 180.0), \
+                    exact=False)
+    
+    return(n_diff)
+
+
+def check_year(year, df, orientations):
+    # All kernels of one test year
+    n_diff = 0
+    
+    Te = df.loc[:, 'Te'].values
+    ws = df.loc[:, 'ws'].values
+    wd = df.loc[:, 'wd'].values
+    precip = df.loc[:, 'precip'].values
+    Ti = climate_files.T_S2(df.loc[:, 'Te'].rolling(24, min_periods=1).mean().values)
+    Pe = 101325.0 * np.ones(len(Te))
+    
+    n_diff += check(year + ' pvsat_ice', pvsat_ice_scalar(Te), \
+                    climate_files.pvsat_ice_array(Te), exact=False)
+    
+    for orientation in orientations:
+        name = year + ' ' + str(orientation) + ' deg '
+        
+        a_scalar = [climate_files.get_smallest_angle(x, orientation) for x in wd]
+        n_diff += check(name + 'angle', a_scalar, \
+                        climate_files.get_smallest_angle_array(wd, orientation))
+        
+        cpe = climate_files.get_cpe1(wd, orientation)
+        n_diff += check(name + 'cpe', cpe, \
+                        climate_files.get_cpe1_array(wd, orientation))
+        n_diff += check(name + 'cpi', get_cpi_scalar(cpe), \
+                        climate_files.get_cpi_array(cpe))
+        
+        for x_scalar, x_array, key in zip( \
+                    calc_dP_scalar(Te, Ti, Pe, ws, wd, climate_files.h, orientation), \
+                    climate_files.calc_dP(Te, Ti, Pe, ws, wd, climate_files.h, orientation), \
+                    ['dPT', 'dPw', 'dP']):
+            n_diff += check(name + key, x_scalar, x_array)
+        
+        n_diff += check(name + 'I_A', \
+                        climate_files.calculate_I_A(ws, wd, precip, Te, \
+                                                    climate_files.Te_min, orientation), \
+                        climate_files.calculate_I_A_array(ws, wd, precip, Te, \
+                                                          climate_files.Te_min, orientation), \
+                        exact=False)
+    
+    return(n_diff)
+
+
+if __name__ == '__main__':
+
+    input_folder = os.path.join(os.path.dirname(__file__), '..', 'input')
+    data = data_cache.load_test_years(input_folder=input_folder)
+    orientations = [float(x) for x in range(0, 360, 15)]
+    
+    t_start = time.perf_counter()
+    n_diff = check_limits()
+    for year, df in data.items():
+        n_diff += check_year(year, df, orientations)
+    
+    print('Test years:', len(data), ', orientations:', len(orientations))
+    print('Time, s:', round(time.perf_counter() - t_start, 1))
+    print('Results that differ:', n_diff)
+    
+    if n_diff > 0:
+        sys.exit('FAILED: ' + str(n_diff) + ' results of the array kernels ' \
+                 + 'differ from the scalar code')
+    print('OK')
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Command line interface for creating the climate files.
+
+Only the stages that are needed for the requested output formats are
+run, e.g. the WUFI files of one test year without the figures:
+
+    python bfty.py build --years jok2004 --formats wufi --no-plots
+    python bfty.py build --orientation 90 --height 12 --workers 4
+    python bfty.py build --formats wufi columnar --columnar parquet
+    python bfty.py list
+
+The parameters that are not given are read from climate_files.py.
+The longwave radiation is calculated in memory as in pipeline.py.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import argparse
+import sys
+
+import climate_files
+import instrumentation
+import pipeline
+import prn_files
+
+
+# Command line names of the output formats, see climate_files.output_formats
+format_names = {'csv': 'csv', \
+                'delphin5': 'Delphin5', \
+                'delphin6': 'Delphin6', \
+                'wufi': 'WUFI', \
+                'columnar': 'columnar', \
+                'mmap': 'mmap'}
+
+
+def get_parser():
+
+    parser = argparse.ArgumentParser(prog='bfty', \
+                description='Building physical test years')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    p = subparsers.add_parser('build', \
+                help='calculate and write the climate files')
+    p.add_argument('--years', nargs='+', default=None, \
+                   choices=list(prn_files.prn_fnames.keys()), metavar='YEAR', \
+                   help='test years, e.g. jok2004 van2007 (default: all)')
+    p.add_argument('--formats', nargs='+', default=None, \
+                   choices=list(format_names.keys()), \
+                   help='output formats (default: all)')
+    p.add_argument('--no-plots', action='store_true', \
+                   help='do not render the figures')
+    p.add_argument('--orientation', type=float, default=climate_files.orientation, \
+                   help='facade orientation, deg, 0 = north, 90 = east')
+    p.add_argument('--height', type=float, default=climate_files.h, \
+                   help='height of the building, m')
+    p.add_argument('--terrain-category', default=climate_files.terrain_category, \
+                   choices=['I', 'II', 'III', 'IV'])
+    p.add_argument('--input-folder', default='./input')
+    p.add_argument('--workers', type=int, default=climate_files.n_workers, \
+                   help='number of processes, 0 = number of CPUs')
+    p.add_argument('--columnar', default=climate_files.columnar_format, \
+                   choices=['npz', 'parquet', 'hdf5'], \
+                   help='write also one columnar file per test year ' \
+                        + '(npz with --formats columnar)')
+    p.add_argument('--mmap', action='store_true', \
+                   default=climate_files.export_mmap_store, \
+                   help='write also the memory-mapped store ' \
+                        + '(also with --formats mmap)')
+    p.add_argument('--compression', default=climate_files.text_compression, \
+                   choices=['gzip', 'zstd'], \
+                   help='compress the csv, Delphin and WUFI files')
+    p.add_argument('--writer-threads', type=int, \
+                   default=climate_files.n_writer_threads, \
+                   help='threads that write the text files, 0 = no threads')
+    p.add_argument('--incremental', action='store_true', \
+                   default=climate_files.incremental_build, \
+                   help='write only the outdated files')
+    p.add_argument('--report', default=climate_files.run_report_fname, \
+                   help='write the run report to this json file, ' \
+                        + 'e.g. output/run_report.json')
+    p.add_argument('--profile-stage', default=climate_files.profile_stage, \
+                   help='stage to profile, e.g. write_csv')
+    p.add_argument('--profile-mode', default=climate_files.profile_mode, \
+                   choices=['cprofile', 'tracemalloc'])
+    
+    subparsers.add_parser('list', \
+                help='list the test years and output formats')
+    
+    return(parser)
+
+
+def build(args):
+    """
+    Runs the pipeline with the command line arguments
+    """
+    
+    climate_files.h = args.height
+    climate_files.orientation = args.orientation
+    climate_files.terrain_category = args.terrain_category
+    climate_files.n_writer_threads = args.writer_threads
+    climate_files.text_compression = args.compression
+    
+    if args.columnar is None and args.formats is not None \
+            and 'columnar' in args.formats:
+        args.columnar = 'npz'
+    climate_files.columnar_format = args.columnar
+    climate_files.export_mmap_store = args.mmap \
+            or (args.formats is not None and 'mmap' in args.formats)
+    
+    instrumentation.settings['profile_stage'] = args.profile_stage
+    instrumentation.settings['profile_mode'] = args.profile_mode
+    
+    formats = None
+    if args.formats is not None:
+        formats = [format_names[x] for x in args.formats]
+    
+    output = pipeline.run_pipeline(args.years, args.input_folder, \
+                                   args.workers, not args.no_plots, \
+                                   incremental_build=args.incremental, \
+                                   formats=formats)
+    
+    if args.report is not None:
+        instrumentation.write_report(args.report, \
+                                     climate_files.get_run_parameters())
+    
+    return(output)
+
+
+def main(argv=None):
+
+    args = get_parser().parse_args(argv)
+    
+    if args.command == 'build':
+        build(args)
+    
+    elif args.command == 'list':
+        print('Test years:')
+        for year, year_title in climate_files.test_year_titles.items():
+            print('  ' + year + '  ' + year_title)
+        print('Output formats:', ' '.join(format_names.keys()))
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
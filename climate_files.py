@@ -10,11 +10,28 @@ https://github.com/anssilaukkarinen/bfty
 
 import pandas as pd
 import os
+import sys
+import itertools
+import contextlib
 import numpy as np
-import matplotlib.pyplot as plt
 
-
-Rw = 461.5
+import data_cache
+import writers
+import parallel
+import plots
+import prn_files
+import incremental
+import psychrometrics
+import columnar
+import climate_store
+import instrumentation
+import indoor_climate
+import stations
+import writer_pool
+import compressed_io
+
+
+Rw = psychrometrics.Rw
 Te_min = -30.0 # WDR
 
 Pe_basevalue = 101325.0
@@ -22,28 +39,22 @@ Pe_basevalue = 101325.0
 
 # Height of building from ground surface to roof top, m
 h = 6.0
-print('h', h)
 
 # Direction of the facade being analysed: 0 deg = north, 90 deg = east
 orientation = 180.0
-print('orientation:', orientation)
 
 # Terran category, where the building is located
 # The classes are the same in SFS-EN 1991-1-4 and SFS-EN ISO 15927-3
 terrain_category = 'I'
-print('terrain_category:', terrain_category)
 
 # Topography coefficient, C_T = 1.0 for flat country
 C_T = 1.0
-print('C_T:', C_T)
 
 # Obstruction factor for wind-driven rain
 O = 0.8
-print('O:', O)
 
 # Wall factor for wind-driven rain
 W = 0.4
-print('W:', W)
 
 lwidth = 0.6
 
@@ -56,39 +67,100 @@ lwidth = 0.6
 # Averaging time for indoor air relative humidity
 window_width = 24
 
+# Number of parallel processes for the test years and figures,
+# None = number of CPUs
+n_workers = 1
+
+# Plot figures of the test years to output/figures
+make_plots = True
+
+# Rebuild only the output files whose input data, parameters or code
+# have changed since the previous run
+incremental_build = False
+
+# Write all variables of each test year also to one columnar file in
+# output/columnar: 'npz', 'parquet' (needs pyarrow), 'hdf5' (needs
+# PyTables) or None. If columnar_all_years is True, the years are also
+# combined to one file.
+columnar_format = None
+columnar_all_years = False
+
+# Write all variables of each test year also to the memory-mapped store
+# in output/mmap, see climate_store.py
+export_mmap_store = False
+
+# Write the wall and CPU times, written files and peak memory of the
+# stages to a json file, e.g. './output/run_report.json', None = no
+# report. One stage, e.g. 'write_csv', can be profiled with 'cprofile'
+# or 'tracemalloc', see instrumentation.py
+run_report_fname = None
+profile_stage = None
+profile_mode = 'cprofile'
+
+# Number of background threads that write the text files, so that the
+# next test year is calculated while the files are written,
+# 0 = write in the main thread, see writer_pool.py
+n_writer_threads = 2
+
+# Compress the csv, Delphin and WUFI files while writing: None, 'gzip' or
+# 'zstd' (needs the zstandard package). The file names get the extension
+# .gz or .zst, see compressed_io.py
+text_compression = None
+
 
 def pvsat_water(T):
-    # CIMO guide
-    pvsat = 611.2*np.exp((17.62*T)/(243.12+T))
-    return(pvsat)
+    # CIMO guide, see psychrometrics.py
+    return(psychrometrics.pvsat_water(T))
 
 def pvsat_ice(T):
-    # CIMO guide
-    pvsat = np.empty(T.shape)
-    for idx,val in enumerate(T):
-        if val < 0:
-            pvsat[idx] = 611.2*np.exp(22.46*val/(272.62+val))
-        else:
-            pvsat[idx] = 611.2*np.exp(17.62*val/(243.12+val))
-    return(pvsat)
+    # CIMO guide, see psychrometrics.py
+    return(psychrometrics.pvsat_ice(T))
+
+def pvsat_ice_array(T):
+    # Same as pvsat_ice(), kept for compatibility
+    return(psychrometrics.pvsat_ice(T))
     
 
 def dv(Te):
     # Finnish Association of Civil Engineers, guidebook 107-2012
-    # Moisture class 2
-    xp = (-30,5,15,30)
-    fp = (0.005,0.005,0.002,0.002)
+    # Moisture class 2, see indoor_climate.py
+    kind, xp, fp = indoor_climate.moisture_models['RIL107_2']
     vals = np.interp(Te,xp,fp)
     return(vals)
 
 def T_S2(Te):
-    # Finnish indoor classification, class S2
-    xp = (-30, 0, 20, 30)
-    fp = (21.5, 21.5, 25.5, 25.5)
+    # Finnish indoor classification, class S2, see indoor_climate.py
+    xp, fp = indoor_climate.temperature_models['S2']
     vals = np.interp(Te, xp, fp)
     return(vals)
 
 
+def calc_indoor_air(Te, RHe_water, window_width=24):
+    """
+    Calculates the indoor air temperature and humidity from the outdoor
+    air conditions. The moisture excess is from dv() and it is added to
+    the rolling mean of the outdoor air humidity. Other indoor climate
+    classes can be calculated with indoor_climate.py. The rolling means
+    are calculated with pandas, so that the files stay the same.
+    Returns a dictionary with the keys:
+    Ti_21, vi_Ti21, RHi_Ti21: Ti = constant 21 degC, hourly
+    Ti_S2, vi_TiS2, RHi_TiS2: Ti ~ S2, daily
+    """
+    
+    results = indoor_climate.calc_indoor_climate(Te, RHe_water, \
+                    [('21', 'RIL107_2'), ('S2', 'RIL107_2')], window_width, \
+                    rolling_method='pandas')
+    
+    indoor_air = {'Ti_21': results['Ti'][0, :], \
+                  'vi_Ti21': results['vi'][0, :], \
+                  'RHi_Ti21': results['RHi'][0, :], \
+                  'Ti_S2': results['Ti'][1, :], \
+                  'vi_TiS2': results['vi'][1, :], \
+                  'RHi_TiS2': results['RHi'][1, :]}
+    
+    return(indoor_air)
+
+
 def get_smallest_angle(source_angle_deg, target_angle_deg):
     # Calculate the smalles difference between two angles
     # e.g. 90 deg, not 270 deg
@@ -105,6 +177,19 @@ def get_smallest_angle(source_angle_deg, target_angle_deg):
     return(a)
 
 
+def get_smallest_angle_array(source_angle_deg, target_angle_deg):
+    # Array version of get_smallest_angle(), the wrapping is done only once
+    # in the same way as in the scalar version
+    
+    a = np.asarray(target_angle_deg, dtype=float) \
+        - np.asarray(source_angle_deg, dtype=float)
+    
+    a = np.where(a > 180.0, a - 360.0, \
+                 np.where(a < -180.0, a + 360.0, a))
+    
+    return(a)
+
+
 
 def get_cpe1(wd, orientation):
     # SFS-EN 1991-1-4, Moisio et al 2019
@@ -128,7 +213,30 @@ def get_cpe1(wd, orientation):
         
     
     return(cpe1)
+
+
+def get_cpe1_array(wd, orientation):
+    # SFS-EN 1991-1-4, Moisio et al 2019
+    # Array version of get_cpe1()
     
+    a_deg = np.abs(get_smallest_angle_array(wd, orientation))
+    
+    # Wind is blowing from the side by default, then towards the facade
+    # and from the opposite side of the building
+    cpe1 = np.full(a_deg.shape, -1.4)
+    cpe1[a_deg < 45.0] = +1.0
+    cpe1[a_deg >= 135.0] = -0.5
+    
+    return(cpe1)
+
+
+def get_cpi_array(cpe):
+    # Internal pressure coefficient, which is chosen according to
+    # the sign of the external pressure coefficient
+    
+    cpi = np.where(np.asarray(cpe) > 0.0, -0.3, 0.2)
+    
+    return(cpi)
 
 
 def calc_dP(Te, Ti, Pe, ws_local, wd_local, h, orientation):
@@ -156,18 +264,13 @@ def calc_dP(Te, Ti, Pe, ws_local, wd_local, h, orientation):
     Tave = (Te + Ti) / 2
     rhoa = 101325.0 / (Ra * (273.15 + Tave))
     
-    cpe = get_cpe1(wd_local, orientation)
+    cpe = get_cpe1_array(wd_local, orientation)
     
     use_recommendation = False
     if use_recommendation:
         cpi = -0.3
     else:
-        cpi = np.zeros(cpe.shape)
-        for idx, val in enumerate(cpe):
-            if val > 0.0:
-                cpi[idx] = -0.3
-            else:
-                cpi[idx] = 0.2
+        cpi = get_cpi_array(cpe)
                 
     
     dPw = (cpi - cpe) * (0.5*rhoa*ws_local**2)
@@ -201,9 +304,8 @@ def get_c_r(z, terrain_category='II', method='ISO_15927_3'):
             z_0 = 1.0
             z_min = 16.0
         else:
-            print('Error in terrain category!')
-            z_min = np.nan
-            z_0 = np.nan
+            raise ValueError('Unknown terrain category: ' \
+                             + str(terrain_category))
         
         z_calc = np.maximum(z, z_min)
         c_R = K_R * np.log(z_calc/z_0)
@@ -223,14 +325,16 @@ def get_c_r(z, terrain_category='II', method='ISO_15927_3'):
             z_0 = 1.0
             z_min = 10.0
         else:
-            print('Error in terrain category!')
-            z_min = np.nan
-            z_0 = np.nan
+            raise ValueError('Unknown terrain category: ' \
+                             + str(terrain_category))
         
         z_calc = np.maximum(z, z_min)
         z_0II = 0.05
         kr = 0.19 * (z_0/z_0II)**0.07
         c_R = kr * np.log(z_calc/z_0)
+    
+    else:
+        raise ValueError('Unknown roughness method: ' + str(method))
         
     return(c_R)
 
@@ -255,6 +359,136 @@ def calculate_I_A(ws, wd, precip, Te, Te_min, wall_orientation):
         I_A[idx] = (2/9) * ws[idx] * precip_val**(8/9) * cosine_term
         
     return(I_A)
+
+
+def calculate_I_A_array(ws, wd, precip, Te, Te_min, wall_orientation):
+    # Airfield spell index, array version of calculate_I_A()
+    # Precipitation is ignored when Te < Te_min
+    
+    ws = np.asarray(ws, dtype=float)
+    precip = np.asarray(precip, dtype=float)
+    Te = np.asarray(Te, dtype=float)
+    
+    d_rad = get_smallest_angle_array(wall_orientation, wd) * (np.pi/180)
+    cosine_term = np.maximum(np.cos(d_rad), 0.0)
+    
+    precip_val = np.where(Te >= Te_min, precip, 0.0)
+    
+    I_A = (2/9) * ws * precip_val**(8/9) * cosine_term
+    
+    return(I_A)
+
+
+def get_facade_varname(prefix, terrain_category, h, orientation):
+    # Variable name of a facade specific output, e.g. 'Pi_I_6.0m_180.0deg'
+    varname = prefix + '_' + terrain_category + '_' \
+            + str(h) + 'm_' \
+            + str(orientation) + 'deg'
+    return(varname)
+
+
+def calc_facade_sweep(Te, Ti, Pe, ws, wd, precip, \
+                      orientations, heights, terrain_categories, \
+                      C_T=1.0, O=0.8, W=0.4, Te_min=-30.0):
+    """
+    Calculates the indoor air pressure Pi (SFS-EN 1991-1-4) and the
+    wind-driven rain WDR (SFS-EN ISO 15927-3) for all combinations of
+    terrain categories, building heights and facade orientations
+    in one vectorized pass over the hourly data.
+    
+    Te outdoor air temperature, degC
+    Ti indoor air temperature, degC
+    Pe air pressure in the outdoor air, Pa
+    ws wind speed at the weather station, m/s
+    wd wind direction at the weather station, 0 = north, 90 = east
+    precip precipitation to a horizontal surface, l/(m2h)
+    orientations facade orientations, 0 = north, 90 = east-facing wall
+    heights building heights from ground surface to top of roof, m
+    terrain_categories terrain categories 'I', 'II', 'III' and/or 'IV'
+    
+    The cases are ordered as terrain category - height - orientation,
+    with the orientation changing fastest. The returned dictionary has
+    the case parameters, the variable names of the cases and the arrays
+    'Pi' and 'WDR', which have the shape (n_cases, n_steps).
+    """
+    
+    Te = np.asarray(Te, dtype=float)
+    Ti = np.asarray(Ti, dtype=float)
+    Pe = np.asarray(Pe, dtype=float)
+    ws = np.asarray(ws, dtype=float)
+    wd = np.asarray(wd, dtype=float)
+    precip = np.asarray(precip, dtype=float)
+    
+    orientations = np.atleast_1d(np.asarray(orientations, dtype=float))
+    heights = np.atleast_1d(np.asarray(heights, dtype=float))
+    terrain_categories = list(np.atleast_1d(terrain_categories))
+    
+    n_t = len(terrain_categories)
+    n_h = len(heights)
+    n_o = len(orientations)
+    n_steps = len(Te)
+    
+    # Roughness coefficients, shape (n_t, n_h)
+    C_R_dP = np.array([get_c_r(heights, tc, method='ISO_1991_1_4') \
+                       for tc in terrain_categories])
+    C_R_WDR = np.array([get_c_r(heights, tc, method='ISO_15927_3') \
+                        for tc in terrain_categories])
+    
+    
+    ## Pi, SFS-EN 1991-1-4
+    g = 9.81
+    Ra = 287.0
+    
+    # Stack effect depends only on the height, shape (n_h, n_steps)
+    z = heights[:, None]/2.0
+    dPT = (g*z*Pe/Ra) * (1/(273.15+Te) - 1/(273.15+Ti))
+    
+    # Pressure coefficients depend only on the orientation,
+    # shape (n_o, n_steps)
+    cpe = get_cpe1_array(wd, orientations[:, None])
+    cpi = get_cpi_array(cpe)
+    
+    # Local wind speed, shape (n_t, n_h, n_steps)
+    ws_local = ws * C_R_dP[:, :, None] * C_T
+    
+    Tave = (Te + Ti) / 2
+    rhoa = 101325.0 / (Ra * (273.15 + Tave))
+    
+    # Shape (n_t, n_h, n_o, n_steps)
+    dPw = (cpi - cpe) * (0.5*rhoa*ws_local[:, :, None, :]**2)
+    Pi = Pe + (dPT[None, :, None, :] + dPw)
+    
+    
+    ## WDR, SFS-EN ISO 15927-3
+    # Airfield spell index depends only on the orientation,
+    # shape (n_o, n_steps)
+    I_A = calculate_I_A_array(ws, wd, precip, Te, Te_min, orientations[:, None])
+    
+    # Shape (n_t, n_h, n_o, n_steps), l/(m2s)
+    WDR = I_A * C_R_WDR[:, :, None, None] * C_T * O * W / 3600
+    
+    
+    ## Case parameters and variable names
+    tc_cases = np.repeat(terrain_categories, n_h*n_o)
+    h_cases = np.tile(np.repeat(heights, n_o), n_t)
+    orientation_cases = np.tile(orientations, n_t*n_h)
+    
+    varnames_Pi = []
+    varnames_WDR = []
+    for tc, h_val, o_val in zip(tc_cases, h_cases, orientation_cases):
+        varnames_Pi.append(get_facade_varname('Pi', tc, h_val, o_val))
+        varnames_WDR.append(get_facade_varname('WDR', tc, h_val, o_val))
+    
+    
+    res = {'terrain_category': tc_cases,
+           'h': h_cases,
+           'orientation': orientation_cases,
+           'varnames_Pi': varnames_Pi,
+           'varnames_WDR': varnames_WDR,
+           'Pi': Pi.reshape((-1, n_steps)),
+           'WDR': WDR.reshape((-1, n_steps))}
+    
+    return(res)
     
 
 
@@ -301,306 +535,333 @@ test_year_names = ['Jokioinen 2004', 'Jokioinen 2030', \
                    'Vantaa 2007', 'Vantaa 2030', \
                    'Vantaa 2050', 'Vantaa 2100']
 
+test_year_titles = dict(zip(['jok2004', 'jok2030', 'jok2050', 'jok2100', \
+                             'van2007', 'van2030', 'van2050', 'van2100'], \
+                            test_year_names))
+
+
+wac_description_outdoor = 'A Finnish Building physical test year'
+wac_description_indoor = 'Indoor air conditions for a Finnish Building physical test year'
+
+# Variables that are plotted as such and their y-axis limits
+plot_ylims = {'Te': (-30, 35), \
+              'RHe_water': (-3, 103), \
+              'RHe_ice': (-3, 103), \
+              'Ti_21': (15, 30), \
+              'Ti_S2': (15, 30), \
+              'RHi_Ti21': (-3, 103), \
+              'RHi_TiS2': (-3, 103)}
+
+# Parameters, which the variables depend on in addition to the input data
+variable_parameters = {'Ti_21': ['window_width'], \
+                       'RHi_Ti21': ['window_width'], \
+                       'Ti_S2': ['window_width'], \
+                       'RHi_TiS2': ['window_width'], \
+                       'Pi': ['window_width', 'h', 'orientation', \
+                              'terrain_category', 'C_T'], \
+                       'WDR': ['h', 'orientation', 'terrain_category', \
+                               'C_T', 'O', 'W', 'Te_min']}
+
+
+def get_run_parameters():
+    # The building and terrain parameters of the module level variables
+    parameters = {'window_width': window_width, \
+                  'h': h, \
+                  'orientation': orientation, \
+                  'terrain_category': terrain_category, \
+                  'C_T': C_T, \
+                  'O': O, \
+                  'W': W, \
+                  'Te_min': Te_min}
+    return(parameters)
+
+
+def set_run_parameters(parameters):
+    # Sets the module level variables from get_run_parameters()
+    for key, value in parameters.items():
+        if key not in globals():
+            raise KeyError('Unknown parameter: ' + key)
+        globals()[key] = value
+
+
+def get_text_fname(fname):
+    # Adds the extension of text_compression to the name of a text file
+    return(compressed_io.add_extension(fname, text_compression))
+
+
+def get_columnar_fname(year):
+    # File name of the columnar output, year can also be 'all_years'
+    return('./output/columnar/' + year \
+           + columnar.file_extensions[columnar_format])
+
+
+def get_output_table(data_year):
+    # All variables of a processed test year for the columnar file and
+    # the memory-mapped store, and the time stamps if there are any
+    table = {col_name: data_year.loc[:,col_name].values \
+             for col_name in data_year.columns}
+    if isinstance(data_year.index, pd.DatetimeIndex):
+        table['time'] = data_year.index.values
+    return(table)
+
+
+def get_columnar_metadata(year, year_title, data_year):
+    """
+    Returns the metadata of the columnar output of one test year:
+    title, station, parameters and the units of the exported variables
+    """
+    
+    varname_Pi = get_facade_varname('Pi', terrain_category, h, orientation)
+    varname_WDR = get_facade_varname('WDR', terrain_category, h, orientation)
+    file_col_names = {'Pi': varname_Pi, 'WDR': varname_WDR}
+    
+    units = {}
+    for col_name, D6_name in zip(col_names, D6_names):
+        units[file_col_names.get(col_name, col_name)] = D6_name
+    
+    metadata = {'year': year, \
+                'title': year_title, \
+                'station': stations.get_station(year), \
+                'n_steps': len(data_year.index), \
+                'parameters': get_run_parameters(), \
+                'units': units}
+    
+    return(metadata)
 
-WUFI_wac_headers_outdoor_jok = ['WUFI®_WAC_02', \
-                             "10	Line Offset to 'Number of Data Columns'", \
-                             '', \
-                             'A Finnish Building physical test year', \
-                             '23.50	Longitude [°]; East is positive', \
-                             "60.81	Latitude [°]; North is positive", \
-                             '104	HeightAMSL [m]', \
-                             '2.0	Time Zone [h from UTC]; East is positive', \
-                             '1	Time Step [h]', \
-                             '8760	Number of DataLines', 
-                             '9	Number of DataColumns', \
-                             'TA HREL ISDH ISD ILAH RN WD WS PMSL']
-
-WUFI_wac_headers_outdoor_van = ['WUFI®_WAC_02', \
-                             "10	Line Offset to 'Number of Data Columns'", \
-                             '', \
-                             'A Finnish Building physical test year', \
-                             '24.96	Longitude [°]; East is positive', \
-                             "60.33	Latitude [°]; North is positive", \
-                             '51	HeightAMSL [m]', \
-                             '2.0	Time Zone [h from UTC]; East is positive', \
-                             '1	Time Step [h]', \
-                             '8760	Number of DataLines', 
-                             '9	Number of DataColumns', \
-                             'TA HREL ISDH ISD ILAH RN WD WS PMSL']
-
-
-
-
-WUFI_wac_headers_indoor_jok = ['WUFI®_WAC_02', \
-                             "10	Line Offset to 'Number of Data Columns'", \
-                             '', \
-                             'Indoor air conditions for a Finnish Building physical test year', \
-                             '23.50	Longitude [°]; East is positive', \
-                             "60.81	Latitude [°]; North is positive", \
-                             '104	HeightAMSL [m]', \
-                             '2.0	Time Zone [h from UTC]; East is positive', \
-                             '1	Time Step [h]', \
-                             '8760	Number of DataLines', 
-                             '3	Number of DataColumns', \
-                             'TA HREL PMSL']
 
+# The output formats and their folders
+output_formats = {'csv': '/csv/', \
+                  'Delphin5': '/Delphin5/', \
+                  'Delphin6': '/Delphin6/', \
+                  'WUFI': '/WUFI/', \
+                  'columnar': '/columnar/', \
+                  'mmap': '/mmap/', \
+                  'figures': '/figures/'}
 
-WUFI_wac_headers_indoor_van = ['WUFI®_WAC_02', \
-                             "10	Line Offset to 'Number of Data Columns'", \
-                             '', \
-                             'Indoor air conditions for a Finnish Building physical test year', \
-                             '24.96	Longitude [°]; East is positive', \
-                             "60.33	Latitude [°]; North is positive", \
-                             '51	HeightAMSL [m]', \
-                             '2.0	Time Zone [h from UTC]; East is positive', \
-                             '1	Time Step [h]', \
-                             '8760	Number of DataLines', 
-                             '3	Number of DataColumns', \
-                             'TA HREL PMSL']
 
+def get_output_format(fname):
+    # Returns the output format of a file name, see output_formats
+    for output_format, folder in output_formats.items():
+        if folder in fname:
+            return(output_format)
+    raise ValueError('Unknown output format: ' + fname)
 
 
+def get_format_outputs(year, formats, with_plots=True):
+    """
+    Returns the set of output files of one test year in the formats
+    listed in formats, e.g. ['WUFI'], see output_formats. The figures
+    are included, if with_plots is True.
+    """
+    
+    formats = set(formats)
+    if with_plots:
+        formats.add('figures')
+    
+    outputs = set([fname for fname in get_output_dependencies(year, with_plots) \
+                   if get_output_format(fname) in formats])
+    
+    return(outputs)
 
-# Read
-data = pd.read_excel('./input/bf_test_years_2020-04-20.xlsx', \
-                     sheet_name=None)
 
+def is_requested(fname, outputs):
+    # outputs is a set of file names or None for all files
+    return(outputs is None or fname in outputs)
 
-# Calculate and write files
-print('Current variables are:', data.keys())
 
-for idx_year, year in enumerate(data.keys()):
-    
-    print('year:', year)
-    
-    # LWdn
-    fname = './LWrad/'+year + '_LWdn_emissivity_Tsky_dTsky.csv'
-    data[year]['LWdn'] = pd.read_csv(fname, sep='\s+', \
-                                   usecols=[0], skiprows=0)
-    
-    
-    # Rdir
-    data[year]['Rdir'] = data[year]['Rglob'].values - data[year]['Rdif'].values
-    
-    # Indoor air, Ti = constant 21 degC, hourly
-    Te = data[year].loc[:,'Te']
-    RHe_water = data[year].loc[:,'RHe_water']
-    ve = (RHe_water/100.0)*pvsat_water(Te) / (Rw*(273.15+Te))
-    
-    Ti_21 = 21.0 * np.ones(8760)
-    Te_rolling_mean = Te.rolling(window_width, min_periods = 1).mean()
-    ve_rolling_mean = ve.rolling(window_width, min_periods = 1).mean()
-    vi_Ti21 = ve_rolling_mean + dv(Te_rolling_mean)
-    vsat_Ti21 = pvsat_water(Ti_21)/(Rw*(273.15+Ti_21))
-    RHi_Ti21 = np.minimum(95.0, 100.0 * vi_Ti21 / vsat_Ti21)
+def get_output_dependencies(year, with_plots=True):
+    """
+    Returns a dictionary from the names of the output files of one test
+    year to the lists of variables that each file depends on. The file
+    names are the same as in process_year() and get_plot_jobs().
+    The WUFI files depend also on the header information ('wac_header').
+    """
     
-    data[year]['Ti_21'] = Ti_21
-    data[year]['vi_Ti21'] = vi_Ti21
-    data[year]['RHi_Ti21'] = RHi_Ti21
+    varname_Pi = get_facade_varname('Pi', terrain_category, h, orientation)
+    varname_WDR = get_facade_varname('WDR', terrain_category, h, orientation)
+    file_col_names = {'Pi': varname_Pi, 'WDR': varname_WDR}
     
+    deps = {}
     
-    # Indoor air, Ti ~ S2, daily
-    Ti_S2 = T_S2(Te_rolling_mean)
-    vi_TiS2 = vi_Ti21.copy()
-    vsat_TiS2 = pvsat_water(Ti_S2)/(Rw*(273.15+Ti_S2))
-    RHi_TiS2 = np.minimum(95.0, 100.0 * vi_TiS2 / vsat_TiS2)
+    for col_name in col_names:
+        file_col_name = file_col_names.get(col_name, col_name)
+        deps[get_text_fname('./output/csv/'+year+'/'+file_col_name+'.csv')] = [col_name]
+        if col_name != 'Rbeam':
+            deps[get_text_fname('./output/Delphin5/'+year+'/'+file_col_name+'.ccd')] = [col_name]
+        deps[get_text_fname('./output/Delphin6/'+year+'/'+file_col_name+'.ccd')] = [col_name]
     
-    data[year]['Ti_S2'] = Ti_S2
-    data[year]['vi_TiS2'] = vi_TiS2
-    data[year]['RHi_TiS2'] = RHi_TiS2
+    for RHe_name, folder in [('RHe_water', 'outdoor_over_water'), \
+                             ('RHe_ice', 'outdoor_over_ice')]:
+        fname = get_text_fname('./output/WUFI/' + folder + '/' + year + '_' \
+                               + RHe_name + '.wac')
+        deps[fname] = ['Te', RHe_name, 'Rdir', 'Rdif', 'LWdn', 'precip', \
+                       'wd', 'ws', 'Pe', 'wac_header']
     
+    for Ti_name, RHi_name, ending in [('Ti_21', 'RHi_Ti21', '_Ti21.wac'), \
+                                      ('Ti_S2', 'RHi_TiS2', '_TiS2.wac')]:
+        fname = get_text_fname('./output/WUFI/indoor/' + year + ending)
+        deps[fname] = [Ti_name, RHi_name, 'Pe', 'wac_header']
     
-    # Outdoor air relative humidity with respect to ice
-    RHe_ice = np.minimum(100.0, RHe_water * (pvsat_water(Te)/pvsat_ice(Te)))
-    data[year].loc[:,'RHe_ice'] = RHe_ice
+    if columnar_format is not None:
+        deps[get_columnar_fname(year)] = list(col_names) + ['wac_header']
     
+    if export_mmap_store:
+        # The index names the current data file, see climate_store.py
+        fname = climate_store.get_fnames(climate_store.store_folder_default, \
+                                         year)[1]
+        deps[fname] = list(col_names) + ['wac_header']
     
+    if with_plots:
+        folder = './output/figures/' + year + '/'
+        for key in plot_ylims.keys():
+            deps[folder + key + '.png'] = [key]
+        deps[folder + 'dP' + '.png'] = ['Pi']
+        deps[folder + varname_WDR + '_cumulative.png'] = ['WDR']
     
-    # Pe
-    data[year]['Pe'] = 101325.0 * np.ones(8760)
+    return(deps)
+
+
+def calc_output_fingerprints(year, data_year, year_title, LWdn=None, \
+                             with_plots=True, code_hash=''):
+    """
+    Returns a dictionary from the output file names of one test year to 
+    their fingerprints (see incremental.py)
+    """
     
+    parameters = get_run_parameters()
     
-    # Pi, SFS-EN 1991-1-4
-    C_R = get_c_r(h, terrain_category, method='ISO_1991_1_4')
-    print('C_R, pressure difference:', C_R)
-    data[year]['ws_local'] = data[year].loc[:,'ws'] * C_R * C_T
+    input_hash = incremental.hash_array( \
+                    data_year.loc[:, prn_files.data_col_names].values)
     
-    varname_Pi = 'Pi_' + terrain_category + '_' \
-            + str(h) + 'm_' \
-            + str(orientation) + 'deg'
-            
-    dPT, dPw, dP = calc_dP(data[year].loc[:,'Te'], 
-                     data[year]['Ti_S2'], 
-                     data[year]['Pe'], 
-                     data[year].loc[:,'ws_local'], 
-                     data[year].loc[:,'wd'], 
-                     h, orientation)
-    data[year][varname_Pi+'_dPT'] = dPT
-    data[year][varname_Pi+'_dPw'] = dPw
-    data[year][varname_Pi+'_dP'] = dP
-    data[year][varname_Pi] = data[year]['Pe'] + dP
-    
-    
-
-
-    # WDR, SFS-EN ISO 15927-3
-    # x1 = data[year].loc[1:, 'precip'].values
-    # x2 = data[year].loc[0, 'precip']
-    # precip = np.append(x1, x2)
-    
-    # I_A can be handled as instantaneous values from here onwards
-    I_A = calculate_I_A(data[year].loc[:,'ws'], 
-                        data[year].loc[:,'wd'], 
-                        data[year].loc[:, 'precip'], 
-                        data[year].loc[:,'Te'], 
-                        Te_min,
-                        orientation)
-    
-    C_R = get_c_r(h, terrain_category, method='ISO_15927_3')
-    print('C_R_WDR:', C_R)
-    
-    varname_WDR = 'WDR_' + terrain_category + '_' \
-                    + str(h) + 'm_' \
-                    + str(orientation) + 'deg'
-    
-    # These are considered as instantaneous/following-hour values
-    # They are changed to preciding hour values
-    # Delphin 6 (at least earlier version) required unit to be: l/(m2s)
-    dummy = I_A * C_R * C_T * O * W / 3600
-    print('RainFluxNormal vuodessa', year, 'l/(m2a):', np.sum(dummy*3600))
-    # x1 = dummy[-1]
-    # x2 = dummy[0:-1]
-    # data[year][varname_WDR] = np.append(x1, x2)
-    data[year][varname_WDR] = dummy
-    
-
-    
-    
-    
-    
-    ## Plot figures
-    if not os.path.exists('./output/figures/'+year):
-        os.makedirs('./output/figures/'+year)
-    
-    lwidth = 0.6
-    
-    # Te
-    key = 'Te'
-    plt.figure()
-    plt.plot(data[year].loc[:,key].values, linewidth=lwidth)
-    plt.grid()
-    plt.xlabel('Aika vuoden alusta, h')
-    plt.ylabel(key)
-    plt.ylim((-30, 35))
-    plt.title(year)
-    fname = './output/figures/' + year + '/' + key + '.png'
-    plt.savefig(fname, dpi=200, bbox_inches='tight')
-    plt.close()
-    
-    # RHe_water
-    key = 'RHe_water'
-    plt.figure()
-    plt.plot(data[year].loc[:,key].values, linewidth=lwidth)
-    plt.grid()
-    plt.xlabel('Aika vuoden alusta, h')
-    plt.ylabel(key)
-    plt.ylim((-3, 103))
-    plt.title(year)
-    fname = './output/figures/' + year + '/' + key + '.png'
-    plt.savefig(fname, dpi=200, bbox_inches='tight')
-    plt.close()
-    
-    # RHe_ice
-    key = 'RHe_ice'
-    plt.figure()
-    plt.plot(data[year].loc[:,key].values, linewidth=lwidth)
-    plt.grid()
-    plt.xlabel('Aika vuoden alusta, h')
-    plt.ylabel(key)
-    plt.ylim((-3, 103))
-    plt.title(year)
-    fname = './output/figures/' + year + '/' + key + '.png'
-    plt.savefig(fname, dpi=200, bbox_inches='tight')
-    plt.close()
-    
-    
-    # Ti = 21
-    key = 'Ti_21'
-    plt.figure()
-    plt.plot(data[year].loc[:,key].values, linewidth=lwidth)
-    plt.grid()
-    plt.xlabel('Aika vuoden alusta, h')
-    plt.ylabel(key)
-    plt.ylim((15, 30))
-    plt.title(year)
-    fname = './output/figures/' + year + '/' + key + '.png'
-    plt.savefig(fname, dpi=200, bbox_inches='tight')
-    plt.close()
-    
-    # Ti ~ S2
-    key = 'Ti_S2'
-    plt.figure()
-    plt.plot(data[year].loc[:,key].values, linewidth=lwidth)
-    plt.grid()
-    plt.xlabel('Aika vuoden alusta, h')
-    plt.ylabel(key)
-    plt.ylim((15, 30))
-    plt.title(year)
-    fname = './output/figures/' + year + '/' + key + '.png'
-    plt.savefig(fname, dpi=200, bbox_inches='tight')
-    plt.close()
-    
-    # RHi_Ti21
-    key = 'RHi_Ti21'
-    plt.figure()
-    plt.plot(data[year].loc[:,key].values, linewidth=lwidth)
-    plt.grid()
-    plt.xlabel('Aika vuoden alusta, h')
-    plt.ylabel(key)
-    plt.ylim((-3, 103))
-    plt.title(year)
-    fname = './output/figures/' + year + '/' + key + '.png'
-    plt.savefig(fname, dpi=200, bbox_inches='tight')
-    plt.close()
-    
-    # RHi_TiS2
-    key = 'RHi_TiS2'
-    plt.figure()
-    plt.plot(data[year].loc[:,key].values, linewidth=lwidth)
-    plt.grid()
-    plt.xlabel('Aika vuoden alusta, h')
-    plt.ylabel(key)
-    plt.ylim((-3, 103))
-    plt.title(year)
-    fname = './output/figures/' + year + '/' + key + '.png'
-    plt.savefig(fname, dpi=200, bbox_inches='tight')
-    plt.close()
+    if LWdn is None:
+        fname = './LWrad/'+year + '_LWdn_emissivity_Tsky_dTsky.csv'
+        LWdn_hash = incremental.hash_files([fname])
+    else:
+        LWdn_hash = incremental.hash_array(LWdn)
     
+    wac_header = [year_title, stations.get_station(year), \
+                  wac_description_outdoor, wac_description_indoor]
     
+    fingerprints = {}
+    for fname, variables in get_output_dependencies(year, with_plots).items():
+        dependencies = {'code': code_hash, 'input': input_hash}
+        for variable in variables:
+            if variable == 'LWdn':
+                dependencies['LWdn'] = LWdn_hash
+            elif variable == 'wac_header':
+                dependencies['wac_header'] = wac_header
+            for parameter in variable_parameters.get(variable, []):
+                dependencies[parameter] = parameters[parameter]
+        fingerprints[fname] = incremental.calc_fingerprint(dependencies)
     
-    # dP
-    dP = data[year][varname_Pi] - data[year]['Pe']
-    plt.figure()
-    plt.plot(dP, linewidth=lwidth)
-    plt.grid()
-    plt.title(year)
-    plt.xlabel('Aika vuoden alusta, h')
-    plt.ylabel('dP, Pa')
-    fname = './output/figures/' + year + '/' + 'dP' + '.png'
-    plt.savefig(fname, dpi=200, bbox_inches='tight')
+    return(fingerprints)
+
+
+def process_year(year, data_year, year_title, LWdn=None, outputs=None):
+    """
+    Calculates the derived variables of one test year and writes the
+    csv, Delphin 5, Delphin 6 and WUFI files.
+    
+    year is the short name of the test year, e.g. 'jok2004'
+    data_year is a pandas dataframe of the test year
+    year_title is the long name of the test year, e.g. 'Jokioinen 2004'
+    LWdn is the hourly downward longwave radiation, W/m2, e.g. from
+    LWrad.LWrad().LWdn. If it is None, LWdn is read from the csv file 
+    written by LWrad.py.
+    outputs is a set of output file names to write, None = all files
+    
+    The building and terrain parameters are read from the module level 
+    variables. The dataframe with the derived variables is returned.
+    """
     
+    # The data can be of any length, e.g. a 30-year record with a
+    # DatetimeIndex, so the time steps are handled by position
+    n_steps = len(data_year.index)
     
+    with instrumentation.stage('derived_variables', year):
+        # LWdn
+        if LWdn is None:
+            fname = './LWrad/'+year + '_LWdn_emissivity_Tsky_dTsky.csv'
+            data_year['LWdn'] = pd.read_csv(fname, sep='\s+', \
+                                           usecols=[0], skiprows=0).values[:,0]
+        else:
+            data_year['LWdn'] = np.asarray(LWdn)
+        
+        
+        # Rdir
+        data_year['Rdir'] = data_year['Rglob'].values - data_year['Rdif'].values
+        
+        # Indoor air
+        Te = data_year.loc[:,'Te']
+        RHe_water = data_year.loc[:,'RHe_water']
+        
+        indoor_air = calc_indoor_air(Te, RHe_water, window_width)
+        for key, x in indoor_air.items():
+            data_year[key] = x
+        
+        
+        # Outdoor air relative humidity with respect to ice
+        RHe_ice = psychrometrics.rh_water_to_ice(Te, RHe_water)
+        np.minimum(100.0, RHe_ice, out=RHe_ice)
+        data_year.loc[:,'RHe_ice'] = RHe_ice
+        
+        
+        
+        # Pe
+        data_year['Pe'] = 101325.0 * np.ones(n_steps)
+        
+        
+        # Pi, SFS-EN 1991-1-4
+        C_R = get_c_r(h, terrain_category, method='ISO_1991_1_4')
+        instrumentation.record_value('C_R_pressure_difference', C_R)
+        data_year['ws_local'] = data_year.loc[:,'ws'] * C_R * C_T
+        
+        varname_Pi = get_facade_varname('Pi', terrain_category, h, orientation)
+                
+        dPT, dPw, dP = calc_dP(data_year.loc[:,'Te'], 
+                         data_year['Ti_S2'], 
+                         data_year['Pe'], 
+                         data_year.loc[:,'ws_local'], 
+                         data_year.loc[:,'wd'], 
+                         h, orientation)
+        data_year[varname_Pi+'_dPT'] = dPT
+        data_year[varname_Pi+'_dPw'] = dPw
+        data_year[varname_Pi+'_dP'] = dP
+        data_year[varname_Pi] = data_year['Pe'] + dP
+        
+        
+
+
+        # WDR, SFS-EN ISO 15927-3
+        # x1 = data_year.loc[1:, 'precip'].values
+        # x2 = data_year.loc[0, 'precip']
+        # precip = np.append(x1, x2)
+        
+        # I_A can be handled as instantaneous values from here onwards
+        I_A = calculate_I_A_array(data_year.loc[:,'ws'], 
+                            data_year.loc[:,'wd'], 
+                            data_year.loc[:, 'precip'], 
+                            data_year.loc[:,'Te'], 
+                            Te_min,
+                            orientation)
+        
+        C_R = get_c_r(h, terrain_category, method='ISO_15927_3')
+        instrumentation.record_value('C_R_WDR', C_R)
+        
+        varname_WDR = get_facade_varname('WDR', terrain_category, h, orientation)
+        
+        # These are considered as instantaneous/following-hour values
+        # They are changed to preciding hour values
+        # Delphin 6 (at least earlier version) required unit to be: l/(m2s)
+        dummy = I_A * C_R * C_T * O * W / 3600
+        WDR_annual = np.sum(dummy*3600) / (n_steps/8760)
+        instrumentation.record_value('WDR_annual_l_m2a', WDR_annual)
+        # x1 = dummy[-1]
+        # x2 = dummy[0:-1]
+        # data_year[varname_WDR] = np.append(x1, x2)
+        data_year[varname_WDR] = dummy
     
-    # Wind-driven rain
-    wdr_cumsum = data[year].loc[:,varname_WDR].cumsum().values*3600
-    plt.figure()
-    plt.plot(wdr_cumsum, linewidth=lwidth)
-    plt.grid()
-    plt.title(year)
-    plt.xlabel('Aika vuoden alusta, h')
-    plt.ylabel('WDR kumulatiivinen, kg/m2')
-    fname = './output/figures/' + year + '/' + varname_WDR + '_cumulative.png'
-    plt.savefig(fname, dpi=200, bbox_inches='tight')
+
     
     
     
@@ -610,63 +871,56 @@ for idx_year, year in enumerate(data.keys()):
     # hour. If needed, they can be changed to correspond to the following hour.
     move_cumulative_to_following = False
     
-    if not os.path.exists('./output/csv/'+year):
-        os.makedirs('./output/csv/'+year)
-    
-    for idx, col_name in enumerate(col_names):
-        
-        if col_name == 'Pi':
-            col_name = varname_Pi
-        elif col_name == 'WDR':
-            col_name = varname_WDR
-        
-        fname = './output/csv/'+year+'/'+col_name+'.csv'
-        
-        if move_cumulative_to_following:
-            if col_name in ['precip', 'Rdif', 'Rdir', 'Rbeam', 'LWdn', varname_WDR]:
-                # Move one hour earlier
-                x1 = data[year].loc[1:,col_name].values
-                x2 = data[year].loc[0,col_name]
-                x = np.append(x1,x2)
+    with instrumentation.stage('write_csv', year):
+        for idx, col_name in enumerate(col_names):
+            
+            if col_name == 'Pi':
+                col_name = varname_Pi
+            elif col_name == 'WDR':
+                col_name = varname_WDR
+            
+            fname = get_text_fname('./output/csv/'+year+'/'+col_name+'.csv')
+            
+            if not is_requested(fname, outputs):
+                continue
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            
+            if move_cumulative_to_following:
+                if col_name in ['precip', 'Rdif', 'Rdir', 'Rbeam', 'LWdn', varname_WDR]:
+                    # Move one hour earlier
+                    x = np.roll(data_year.loc[:,col_name].values, -1)
+                else:
+                    x = data_year.loc[:,col_name].values
+            
             else:
-                x = data[year].loc[:,col_name].values
-        
-        else:
-            x = data[year].loc[:,col_name].values
-        
-        X = np.column_stack((np.arange(len(x)), x))
-        
-        if col_name == varname_WDR:
-            number_format = '%.2e'
-        else:
-            number_format = '%.2f'
-        
-        np.savetxt(fname, X, fmt=('%-2d', number_format), \
-                   header='t    '+D6_names[idx], \
-                   comments='')
+                x = data_year.loc[:,col_name].values
+            
+            if col_name == varname_WDR:
+                number_format = '%.2e'
+            else:
+                number_format = '%.2f'
+            
+            writer_pool.submit(fname, writers.write_csv, fname, \
+                               't    '+D6_names[idx], x, number_format)
     
     
 
     ## Export to Delphin 5 files
-    if not os.path.exists('./output/Delphin5/'+year):
-        os.makedirs('./output/Delphin5/'+year)
-    
-    dummy = [x for x in col_names if x not in ['Rbeam']]
-    
-    for idx, col_name in enumerate(dummy):
+    with instrumentation.stage('write_Delphin5', year):
+        dummy = [x for x in col_names if x not in ['Rbeam']]
         
-        if col_name == 'Pi':
-            col_name = varname_Pi
-        elif col_name == 'WDR':
-            col_name = varname_WDR
-        
-        fname = './output/Delphin5/'+year+'/'+col_name+'.ccd'
-        
-        with open(fname, 'w') as f:
+        for idx, col_name in enumerate(dummy):
+            
+            if col_name == 'Pi':
+                col_name = varname_Pi
+            elif col_name == 'WDR':
+                col_name = varname_WDR
+            
+            fname = get_text_fname('./output/Delphin5/'+year+'/'+col_name+'.ccd')
             
-            # Header
-            linetowrite = D5_keywords[idx]
-            f.write(linetowrite + '\n')
+            if not is_requested(fname, outputs):
+                continue
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
             
             # Data rows            
             if col_name in ['precip', 'Rdif', 'Rdir', 'Rbeam', 'LWdn']:
@@ -677,46 +931,36 @@ for idx_year, year in enumerate(data.keys()):
                 # describes conditions at 9:00-10:00. Because of this, the input
                 # data is moved one hour earlier, so that the definitions would match.
 
-                x1 = data[year].loc[1:,col_name]
-                x2 = data[year].loc[0,col_name]
-                x = np.append(x1,x2)
+                x = np.roll(data_year.loc[:,col_name].values, -1)
             else:
-                x = data[year].loc[:,col_name]
+                x = data_year.loc[:,col_name]
             
-            for t in range(8760):
-                hour = t % 24
-                day = int((t-hour)/24)
-                val = x[t]
-                
-                if col_name == varname_WDR:
-                    linetowrite = '{:<4d} {:02d}:00:00 {:.2e}'.format(day, hour, val)
-                else:
-                    linetowrite = '{:<4d} {:02d}:00:00 {:.2f}'.format(day, hour, val)
-                
-                f.writelines(linetowrite + '\n')
+            if col_name == varname_WDR:
+                number_format = '%.2e'
+            else:
+                number_format = '%.2f'
+            
+            writer_pool.submit(fname, writers.write_ccd, fname, \
+                               D5_keywords[idx], x, number_format)
     
     
     
     ## Export to Delphin 6 files
     # The values correspond to instantaneous values and for integrals of
     # the preceding hour
-    if not os.path.exists('./output/Delphin6/'+year):
-        os.makedirs('./output/Delphin6/'+year)
-    
-    for idx, col_name in enumerate(col_names):
-        
-        if col_name == 'Pi':
-            col_name = varname_Pi
-        elif col_name == 'WDR':
-            col_name = varname_WDR
-        
-        fname = './output/Delphin6/'+year+'/'+col_name+'.ccd'
-        
-        with open(fname, 'w') as f:
+    with instrumentation.stage('write_Delphin6', year):
+        for idx, col_name in enumerate(col_names):
+            
+            if col_name == 'Pi':
+                col_name = varname_Pi
+            elif col_name == 'WDR':
+                col_name = varname_WDR
             
-            # Header
-            linetowrite = D6_names[idx]
-            f.write(linetowrite + '\n')
+            fname = get_text_fname('./output/Delphin6/'+year+'/'+col_name+'.ccd')
+            
+            if not is_requested(fname, outputs):
+                continue
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
             
             # Data rows
             if col_name in ['precip', 'Rdif', 'Rdir', 'Rbeam', 'LWdn']:
@@ -725,195 +969,278 @@ for idx_year, year in enumerate(data.keys()):
                 # describes the conditions in the previous time step
                 # (for radiation and precipitation data). Because of this,
                 # the input data is moved one hour earlier to match definitions.
-                x1 = data[year].loc[1:,col_name]
-                x2 = data[year].loc[0,col_name]
-                x = np.append(x1,x2)
+                x = np.roll(data_year.loc[:,col_name].values, -1)
             else:
-                x = data[year].loc[:,col_name]
-                        
-            for t in range(8760):
-                hour = t % 24
-                day = int((t-hour)/24)
-                val = x[t]
-                
-                if col_name == varname_WDR:
-                    linetowrite = '{:<4d} {:02d}:00:00 {:.2e}'.format(day, hour, val)
-                else:
-                    linetowrite = '{:<4d} {:02d}:00:00 {:.2f}'.format(day, hour, val)
-                
-                f.write(linetowrite + '\n')
+                x = data_year.loc[:,col_name]
+            
+            if col_name == varname_WDR:
+                number_format = '%.2e'
+            else:
+                number_format = '%.2f'
+            
+            writer_pool.submit(fname, writers.write_ccd, fname, \
+                               D6_names[idx], x, number_format)
                 
                 
-    ## Export outdoor data to WUFI files, RHe over water
-    # Hourly data in WUFI is given for the preciding hour
-    x1 = data[year].loc[1:,'Te']
-    x2 = data[year].loc[0,'Te']
-    TA = np.append(x1, x2)
-    x1 = data[year].loc[1:,'RHe_water']
-    x2 = data[year].loc[0,'RHe_water']
-    HREL = np.append(x1, x2) / 100.0
-    ISDH = data[year].loc[:,'Rdir']
-    ISD = data[year].loc[:,'Rdif']
-    ILAH = data[year].loc[:,'LWdn']
-    RN = data[year].loc[:,'precip']
-    x1 = data[year].loc[1:,'wd']
-    x2 = data[year].loc[0,'wd']
-    WD = np.append(x1,x2)
-    x1 = data[year].loc[1:,'ws']
-    x2 = data[year].loc[0,'ws']
-    WS = np.append(x1,x2)
-    PMSL = data[year].loc[:,'Pe'] / 100.0    
-    
-    
-    if not os.path.exists('./output/WUFI/outdoor_over_water'):
-        os.makedirs('./output/WUFI/outdoor_over_water')
-    
-    fname = './output/WUFI/outdoor_over_water/' + year + '_RHe_water.wac'
-    
-    with open(fname, mode='w', encoding='ANSI') as f:
-        if 'jok' in year:
-            f.writelines(WUFI_wac_headers_outdoor_jok[0] + '\n')
-            f.writelines(WUFI_wac_headers_outdoor_jok[1] + '\n')
-            f.writelines(WUFI_wac_headers_outdoor_jok[2] + test_year_names[idx_year] + '\n')
-            for idx_line in range(3,11):
-                f.writelines(WUFI_wac_headers_outdoor_jok[idx_line] + '\n')
-            f.writelines('\t'.join(WUFI_wac_headers_outdoor_jok[-1].split(' ')) + '\n')
+    ## Export outdoor data to WUFI files, RHe over water and over ice
+    # Hourly data in WUFI is given for the preciding hour, so the
+    # instantaneous values are moved one hour earlier
+    with instrumentation.stage('write_WUFI', year):
+        station = stations.get_station(year)
+        
+        for RHe_name, folder in [('RHe_water', 'outdoor_over_water'), \
+                                 ('RHe_ice', 'outdoor_over_ice')]:
             
-        elif 'van' in year:
-            f.writelines(WUFI_wac_headers_outdoor_van[0] + '\n')
-            f.writelines(WUFI_wac_headers_outdoor_van[1] + '\n')
-            f.writelines(WUFI_wac_headers_outdoor_van[2] + test_year_names[idx_year] + '\n')
-            for idx_line in range(3,11):
-                f.writelines(WUFI_wac_headers_outdoor_van[idx_line] + '\n')
-            f.writelines('\t'.join(WUFI_wac_headers_outdoor_van[-1].split(' ')) + '\n')
-
-        for t in range(8760):
-            txt = '{:<.2f}\t{:<.2f}\t{:<.2f}\t{:<.2f}\t{:<.2f}\t{:<.2f}\t{:<.2f}\t{:<.2f}\t{:<.2f}'
-            vals = [TA[t], HREL[t], ISDH[t], ISD[t], ILAH[t], RN[t], WD[t], WS[t], PMSL[t]]
-            linetowrite = txt.format(*vals)
-            f.write(linetowrite + '\n')
+            columns = {'TA': np.roll(data_year.loc[:,'Te'].values, -1), \
+                       'HREL': np.roll(data_year.loc[:,RHe_name].values, -1) / 100.0, \
+                       'ISDH': data_year.loc[:,'Rdir'].values, \
+                       'ISD': data_year.loc[:,'Rdif'].values, \
+                       'ILAH': data_year.loc[:,'LWdn'].values, \
+                       'RN': data_year.loc[:,'precip'].values, \
+                       'WD': np.roll(data_year.loc[:,'wd'].values, -1), \
+                       'WS': np.roll(data_year.loc[:,'ws'].values, -1), \
+                       'PMSL': data_year.loc[:,'Pe'].values / 100.0}
             
+            fname = get_text_fname('./output/WUFI/' + folder + '/' + year \
+                                   + '_' + RHe_name + '.wac')
             
-
-    ## Export outdoor data to WUFI files, RHe over ice
-    x1 = data[year].loc[1:,'Te']
-    x2 = data[year].loc[0,'Te']
-    TA = np.append(x1, x2)
-    x1 = data[year].loc[1:,'RHe_ice']
-    x2 = data[year].loc[0,'RHe_ice']
-    HREL = np.append(x1, x2) / 100.0
-    ISDH = data[year].loc[:,'Rdir']
-    ISD = data[year].loc[:,'Rdif']
-    ILAH = data[year].loc[:,'LWdn']
-    RN = data[year].loc[:,'precip']
-    x1 = data[year].loc[1:,'wd']
-    x2 = data[year].loc[0,'wd']
-    WD = np.append(x1,x2)
-    x1 = data[year].loc[1:,'ws']
-    x2 = data[year].loc[0,'ws']
-    WS = np.append(x1,x2)
-    PMSL = data[year].loc[:,'Pe'] / 100.0    
-    
-    
-    if not os.path.exists('./output/WUFI/outdoor_over_ice'):
-        os.makedirs('./output/WUFI/outdoor_over_ice')
-    
-    fname = './output/WUFI/outdoor_over_ice/' + year + '_RHe_ice.wac'
-    
-    with open(fname, mode='w', encoding='ANSI') as f:
-        if 'jok' in year:
-            f.writelines(WUFI_wac_headers_outdoor_jok[0] + '\n')
-            f.writelines(WUFI_wac_headers_outdoor_jok[1] + '\n')
-            f.writelines(WUFI_wac_headers_outdoor_jok[2] + test_year_names[idx_year] + '\n')
-            for idx_line in range(3,11):
-                f.writelines(WUFI_wac_headers_outdoor_jok[idx_line] + '\n')
-            f.writelines('\t'.join(WUFI_wac_headers_outdoor_jok[-1].split(' ')) + '\n')
+            if not is_requested(fname, outputs):
+                continue
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            
+            writer_pool.submit(fname, writers.write_wac, fname, columns, \
+                               station, year_title, wac_description_outdoor)
+        
+        
+        ## Export indoor data to WUFI files, Ti = 21 degC and Ti ~ S2
+        for Ti_name, RHi_name, ending in [('Ti_21', 'RHi_Ti21', '_Ti21.wac'), \
+                                          ('Ti_S2', 'RHi_TiS2', '_TiS2.wac')]:
             
-        elif 'van' in year:
-            f.writelines(WUFI_wac_headers_outdoor_van[0] + '\n')
-            f.writelines(WUFI_wac_headers_outdoor_van[1] + '\n')
-            f.writelines(WUFI_wac_headers_outdoor_van[2] + test_year_names[idx_year] + '\n')
-            for idx_line in range(3,11):
-                f.writelines(WUFI_wac_headers_outdoor_van[idx_line] + '\n')
-            f.writelines('\t'.join(WUFI_wac_headers_outdoor_van[-1].split(' ')) + '\n')
-
-        for t in range(8760):
-            txt = '{:<.2f}\t{:<.2f}\t{:<.2f}\t{:<.2f}\t{:<.2f}\t{:<.2f}\t{:<.2f}\t{:<.2f}\t{:<.2f}'
-            vals = [TA[t], HREL[t], ISDH[t], ISD[t], ILAH[t], RN[t], WD[t], WS[t], PMSL[t]]
-            linetowrite = txt.format(*vals)
-            f.write(linetowrite + '\n')
-    
-    
-    # Export indoor data to WUFI files, Ti = 21 degC
-    x1 = data[year].loc[1:,'Ti_21']
-    x2 = data[year].loc[0,'Ti_21']
-    TA = np.append(x1, x2)
-    x1 = data[year].loc[1:,'RHi_Ti21']
-    x2 = data[year].loc[0,'RHi_Ti21']
-    HREL = np.append(x1, x2) / 100.0
-    PMSL = data[year].loc[:,'Pe'] / 100.0    
-    
-    if not os.path.exists('./output/WUFI/indoor'):
-        os.makedirs('./output/WUFI/indoor')
-    
-    fname = './output/WUFI/indoor/' + year + '_Ti21.wac'
-    
-    with open(fname, mode='w', encoding='ANSI') as f:
-        if 'jok' in year:
-            f.writelines(WUFI_wac_headers_indoor_jok[0] + '\n')
-            f.writelines(WUFI_wac_headers_indoor_jok[1] + '\n')
-            f.writelines(WUFI_wac_headers_indoor_jok[2] + test_year_names[idx_year] + '\n')
-            for idx_line in range(3,len(WUFI_wac_headers_indoor_jok)-1):
-                f.writelines(WUFI_wac_headers_indoor_jok[idx_line] + '\n')
-            f.writelines('\t'.join(WUFI_wac_headers_indoor_jok[-1].split(' ')) + '\n')
+            columns = {'TA': np.roll(data_year.loc[:,Ti_name].values, -1), \
+                       'HREL': np.roll(data_year.loc[:,RHi_name].values, -1) / 100.0, \
+                       'PMSL': data_year.loc[:,'Pe'].values / 100.0}
             
-        elif 'van' in year:
-            f.writelines(WUFI_wac_headers_indoor_van[0] + '\n')
-            f.writelines(WUFI_wac_headers_indoor_van[1] + '\n')
-            f.writelines(WUFI_wac_headers_indoor_van[2] + test_year_names[idx_year] + '\n')
-            for idx_line in range(3,len(WUFI_wac_headers_indoor_van)-1):
-                f.writelines(WUFI_wac_headers_indoor_van[idx_line] + '\n')
-            f.writelines('\t'.join(WUFI_wac_headers_indoor_van[-1].split(' ')) + '\n')
-
-        for t in range(8760):
-            txt = '{:<.2f}\t{:<.2f}\t{:<.2f}'
-            vals = [TA[t], HREL[t], PMSL[t]]
-            linetowrite = txt.format(*vals)
-            f.write(linetowrite + '\n')
+            fname = get_text_fname('./output/WUFI/indoor/' + year + ending)
             
-    # Export indoor data to WUFI files, Ti ~ S2
-    x1 = data[year].loc[1:,'Ti_S2']
-    x2 = data[year].loc[0,'Ti_S2']
-    TA = np.append(x1, x2)
-    x1 = data[year].loc[1:,'RHi_TiS2']
-    x2 = data[year].loc[0,'RHi_TiS2']
-    HREL = np.append(x1, x2) / 100.0
-    PMSL = data[year].loc[:,'Pe'] / 100.0    
-    
-    if not os.path.exists('./output/WUFI/indoor'):
-        os.makedirs('./output/WUFI/indoor')
-    
-    fname = './output/WUFI/indoor/' + year + '_TiS2.wac'
-    
-    with open(fname, mode='w', encoding='ANSI') as f:
-        if 'jok' in year:
-            f.writelines(WUFI_wac_headers_indoor_jok[0] + '\n')
-            f.writelines(WUFI_wac_headers_indoor_jok[1] + '\n')
-            f.writelines(WUFI_wac_headers_indoor_jok[2] + test_year_names[idx_year] + '\n')
-            for idx_line in range(3,len(WUFI_wac_headers_indoor_jok)-1):
-                f.writelines(WUFI_wac_headers_indoor_jok[idx_line] + '\n')
-            f.writelines('\t'.join(WUFI_wac_headers_indoor_jok[-1].split(' ')) + '\n')
+            if not is_requested(fname, outputs):
+                continue
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
             
-        elif 'van' in year:
-            f.writelines(WUFI_wac_headers_indoor_van[0] + '\n')
-            f.writelines(WUFI_wac_headers_indoor_van[1] + '\n')
-            f.writelines(WUFI_wac_headers_indoor_van[2] + test_year_names[idx_year] + '\n')
-            for idx_line in range(3,len(WUFI_wac_headers_indoor_van)-1):
-                f.writelines(WUFI_wac_headers_indoor_van[idx_line] + '\n')
-            f.writelines('\t'.join(WUFI_wac_headers_indoor_van[-1].split(' ')) + '\n')
-
-        for t in range(8760):
-            txt = '{:<.2f}\t{:<.2f}\t{:<.2f}'
-            vals = [TA[t], HREL[t], PMSL[t]]
-            linetowrite = txt.format(*vals)
-            f.write(linetowrite + '\n')
+            writer_pool.submit(fname, writers.write_wac, fname, columns, \
+                               station, year_title, wac_description_indoor)
+    
+    
+    ## Export all variables to one columnar file
+    if columnar_format is not None:
+        fname = get_columnar_fname(year)
+        
+        if is_requested(fname, outputs):
+            with instrumentation.stage('write_columnar', year):
+                metadata = get_columnar_metadata(year, year_title, data_year)
+                columnar.write_columnar(fname, \
+                                        {year: get_output_table(data_year)}, \
+                                        {year: metadata})
+                instrumentation.record_output(fname)
+    
+    
+    ## Export all variables to the memory-mapped store
+    if export_mmap_store:
+        fname = climate_store.get_fnames(climate_store.store_folder_default, \
+                                         year)[1]
+        
+        if is_requested(fname, outputs):
+            with instrumentation.stage('write_mmap', year):
+                metadata = get_columnar_metadata(year, year_title, data_year)
+                fnames = climate_store.write_year( \
+                                    climate_store.store_folder_default, \
+                                    year, get_output_table(data_year), \
+                                    metadata)
+                for fname in fnames:
+                    instrumentation.record_output(fname)
+    
+    return(data_year)
+
+
+def get_plot_jobs(year, data_year):
+    """
+    Yields the plot jobs (see plots.py) of one processed test year.
+    The figures are saved to the folder output/figures/<year>.
+    """
+    
+    folder = './output/figures/' + year + '/'
+    xlabel = 'Aika vuoden alusta, h'
+    
+    for key, ylim in plot_ylims.items():
+        yield(plots.line_plot_job(folder + key + '.png', \
+                                  data_year.loc[:,key].values, \
+                                  year, xlabel, key, ylim=ylim, \
+                                  linewidth=lwidth))
+    
+    # dP
+    varname_Pi = get_facade_varname('Pi', terrain_category, h, orientation)
+    dP = data_year[varname_Pi].values - data_year['Pe'].values
+    yield(plots.line_plot_job(folder + 'dP' + '.png', dP, \
+                              year, xlabel, 'dP, Pa', \
+                              linewidth=lwidth))
+    
+    # Wind-driven rain
+    varname_WDR = get_facade_varname('WDR', terrain_category, h, orientation)
+    wdr_cumsum = data_year.loc[:,varname_WDR].cumsum().values*3600
+    yield(plots.line_plot_job(folder + varname_WDR + '_cumulative.png', \
+                              wdr_cumsum, year, xlabel, \
+                              'WDR kumulatiivinen, kg/m2', \
+                              linewidth=lwidth))
+
+
+def process_year_with_parameters(parameters, year, data_year, year_title, \
+                                 LWdn=None, outputs=None, n_threads=0):
+    """
+    Same as process_year(), but sets first the parameters (see
+    get_run_parameters()), because the worker processes do not always
+    share the module level variables of the calling process.
+    If n_threads > 0, the text files are written in a writer pool of
+    n_threads threads, which is closed before returning.
+    """
+    
+    set_run_parameters(parameters)
+    
+    if n_threads > 0:
+        with writer_pool.WriterPool(n_threads):
+            return(process_year(year, data_year, year_title, LWdn, outputs))
+    
+    return(process_year(year, data_year, year_title, LWdn, outputs))
+
+
+def run(data, n_workers=1, make_plots=True, LWdn=None, \
+        incremental_build=False, \
+        state_fname=incremental.state_fname_default, formats=None):
+    """
+    Processes all test years in the dictionary data. The years are
+    independent of each other, so they can be processed in parallel in
+    n_workers processes (None or 0 = number of CPUs).
+    LWdn is a dictionary of the hourly LWdn arrays of the years. If it is
+    None, LWdn is read from the csv files written by LWrad.py.
+    If incremental_build is True, only the output files whose
+    fingerprints differ from the ones stored in state_fname are written,
+    and the years that are up to date are not processed at all.
+    The output files are the same as when the years are processed
+    one after another. If make_plots is True, the figures are rendered
+    after the calculations as a separate stage.
+    formats is a list of the output formats to write, e.g. ['WUFI'],
+    None = all formats, see output_formats.
+    Returns a dictionary of the processed dataframes.
+    """
+    
+    print('Current variables are:', data.keys())
+    
+    if LWdn is None:
+        LWdn = {}
+    
+    if incremental_build:
+        state = incremental.BuildState(state_fname)
+        # This module and all modules of the repository that it imports
+        code_hash = incremental.hash_files(incremental.get_module_files( \
+                                            [sys.modules[__name__]]))
+    
+    tasks = []
+    fingerprints = {}
+    for year in data.keys():
+        outputs = None
+        year_title = test_year_titles.get(year, year)
+        
+        if formats is not None:
+            outputs = get_format_outputs(year, formats, make_plots)
+        
+        if incremental_build:
+            with instrumentation.stage('fingerprints', year):
+                fingerprints_year = calc_output_fingerprints(year, data[year], \
+                                        year_title, LWdn.get(year), \
+                                        make_plots, code_hash)
+            stale = state.get_stale(fingerprints_year)
+            if outputs is not None:
+                stale = stale.intersection(outputs)
+            outputs = stale
+            if len(outputs) == 0:
+                print('year:', year, 'is up to date')
+                continue
+            fingerprints[year] = {fname: fingerprints_year[fname] \
+                                  for fname in outputs}
+        
+        tasks.append((year, data[year], year_title, \
+                      LWdn.get(year), outputs))
+    
+    # The text files are written in the background. In one process the
+    # pool is shared by all years and the figures, so that the next year
+    # is calculated while the files of the previous year are written.
+    # Each worker process writes the files of its year before returning,
+    # and no processes are forked while the writer threads are running.
+    pool = contextlib.nullcontext()
+    n_threads = n_writer_threads
+    if n_writer_threads > 0 and parallel.get_n_workers(n_workers) == 1:
+        pool = writer_pool.WriterPool(n_writer_threads)
+        n_threads = 0
+    
+    # The stages of the workers are returned with the results
+    settings = dict(instrumentation.settings)
+    parameters = get_run_parameters()
+    
+    with pool:
+        results = parallel.map_tasks(instrumentation.call_recorded, \
+                                     [(settings, 'process_year', task[0], \
+                                       process_year_with_parameters, parameters) \
+                                      + task + (n_threads,) for task in tasks], \
+                                     n_workers)
+        results = [instrumentation.merge_records(x) for x in results]
+        output = dict(zip([task[0] for task in tasks], results))
+        
+        if make_plots:
+            with instrumentation.stage('plots'):
+                jobs = itertools.chain.from_iterable( \
+                            [get_plot_jobs(task[0], output[task[0]]) for task in tasks])
+                if incremental_build or formats is not None:
+                    requested = set().union(*[task[4] for task in tasks])
+                    jobs = (job for job in jobs if job['fname'] in requested)
+                plots.render_plots(jobs, n_workers)
+    
+    if columnar_format is not None and columnar_all_years \
+            and (formats is None or 'columnar' in formats):
+        fname = get_columnar_fname('all_years')
+        if len(tasks) > 0 or not os.path.exists(fname):
+            with instrumentation.stage('combine_columnar'):
+                columnar.combine_columnar([get_columnar_fname(year) \
+                                           for year in data.keys()], fname)
+                instrumentation.record_output(fname)
+    
+    if incremental_build:
+        for year in output.keys():
+            state.update(fingerprints[year])
+        state.save()
+    
+    return(output)
+
+
+
+if __name__ == '__main__':
+    
+    print('h', h)
+    print('orientation:', orientation)
+    print('terrain_category:', terrain_category)
+    print('C_T:', C_T)
+    print('O:', O)
+    print('W:', W)
+    
+    
+    instrumentation.settings['profile_stage'] = profile_stage
+    instrumentation.settings['profile_mode'] = profile_mode
+    
+    # Read
+    with instrumentation.stage('read'):
+        data = data_cache.load_test_years(input_folder='./input')
+
+
+    # Calculate and write files
+    output = run(data, n_workers, make_plots, \
+                 incremental_build=incremental_build)
+    
+    if run_report_fname is not None:
+        instrumentation.write_report(run_report_fname, get_run_parameters())
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-mapped store of the generated climate data.
+
+Each test year is stored as one uncompressed .npy file with the shape
+(n_variables, n_steps), so that each variable is a contiguous row, and
+a small json index file with the names of the variables and the
+metadata. If the data has time stamps, they are stored in a separate
+file. The data files are named by a hash of their contents,
+<year>.<version>.npy and <year>_time.<version>.npy, and the index
+<year>.json names the data files of the current version. The index is
+written last, to a temporary file that is then renamed, so the rename
+is the single point where a new version replaces the old one. A reader
+sees either the old or the new version of all files of a year, never a
+mix of them. The files of the old version are removed after the rename.
+On Windows, a file that another process has open as a memory map cannot
+be removed, so such files are left for the next write to remove. A data
+file of the same version is not written again.
+
+The reader ClimateStore opens the .npy files as read-only memory maps.
+The variables are returned as views to the memory map without copying,
+so several worker processes reading the same store share the operating
+system page cache instead of each holding its own parsed copy:
+
+    store = ClimateStore('./output/mmap')
+    Te = store.get('jok2004', 'Te')
+    x = store.get('van2007', 'WDR_I_6.0m_180.0deg')[0:24*31]
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+import numpy as np
+import pandas as pd
+
+
+store_folder_default = './output/mmap'
+
+
+def get_fnames(folder, year, version=''):
+    """
+    Returns the names of the data, index and time stamp files of a year.
+    The index file name does not depend on the version.
+    """
+    
+    fname_data = os.path.join(folder, year + '.' + version + '.npy')
+    fname_index = os.path.join(folder, year + '.json')
+    fname_time = os.path.join(folder, year + '_time.' + version + '.npy')
+    return(fname_data, fname_index, fname_time)
+
+
+def remove_old_versions(folder, year, fnames_keep):
+    # Removes the data files of the other versions of a year
+    pattern = re.compile(re.escape(year) + '(_time)?\\.[0-9a-f]{16}\\.npy')
+    basenames_keep = [os.path.basename(x) for x in fnames_keep]
+    
+    for basename in os.listdir(folder):
+        if basename not in basenames_keep and pattern.fullmatch(basename):
+            # e.g. memory-mapped by a reader on Windows, see the module
+            # docstring
+            try:
+                os.remove(os.path.join(folder, basename))
+            except OSError:
+                pass
+
+
+def save_array(fname, x, suffix):
+    """
+    Writes x to the .npy file fname through a temporary file. An existing
+    file has the same contents, because the file name includes the
+    version, and it can be open in a reader, so it is kept.
+    """
+    
+    if os.path.exists(fname):
+        return
+    
+    with open(fname + suffix, 'wb') as f:
+        np.save(f, x)
+    os.replace(fname + suffix, fname)
+
+
+def replace(src, dst, n_attempts=10, wait=0.1):
+    # os.replace(), which is tried again if a reader has dst open on Windows
+    for attempt in range(n_attempts):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == n_attempts - 1:
+                raise
+            time.sleep(wait)
+
+
+def write_year(folder, year, table, metadata=None):
+    """
+    Writes one test year to the store and returns the names of the
+    written data and index files
+    
+    table is a dictionary from the variable names to the hourly data,
+    and it can contain the time stamps with the key 'time'
+    metadata is a json serializable dictionary
+    """
+    
+    if metadata is None:
+        metadata = {}
+    
+    os.makedirs(folder, exist_ok=True)
+    suffix = '.' + str(os.getpid()) + '.tmp'
+    
+    variables = [key for key in table.keys() if key != 'time']
+    X = np.empty((len(variables), len(table[variables[0]])))
+    for idx, key in enumerate(variables):
+        X[idx, :] = table[key]
+    
+    has_time = 'time' in table
+    if has_time:
+        t = np.asarray(table['time'], dtype='datetime64[ns]')
+    
+    # The version is the hash of the data and the time stamps
+    h = hashlib.sha256(json.dumps(variables).encode('utf-8'))
+    h.update(X.tobytes())
+    if has_time:
+        h.update(t.tobytes())
+    version = h.hexdigest()[0:16]
+    
+    fname_data, fname_index, fname_time = get_fnames(folder, year, version)
+    
+    save_array(fname_data, X, suffix)
+    if has_time:
+        save_array(fname_time, t, suffix)
+    
+    index = {'year': year, \
+             'n_steps': X.shape[1], \
+             'variables': variables, \
+             'has_time': has_time, \
+             'data_file': os.path.basename(fname_data), \
+             'data_bytes': os.path.getsize(fname_data), \
+             'time_file': os.path.basename(fname_time) if has_time else None, \
+             'metadata': metadata}
+    
+    # The commit point, see the module docstring
+    with open(fname_index + suffix, 'w') as f:
+        json.dump(index, f, default=str)
+    replace(fname_index + suffix, fname_index)
+    
+    fnames_keep = [fname_data, fname_time] if has_time else [fname_data]
+    remove_old_versions(folder, year, fnames_keep)
+    
+    return([fname_data, fname_index])
+
+
+class ClimateStore():
+    """
+    Read-only access to the memory-mapped climate data, see the
+    module docstring
+    """
+    
+    def __init__(self, folder=store_folder_default):
+    
+        self.folder = folder
+        self.index = {}
+        self._data = {}
+        
+        for fname in sorted(glob.glob(os.path.join(folder, '*.json'))):
+            index_year = self._read_index(fname)
+            self.index[index_year['year']] = index_year
+    
+    
+    def _read_index(self, fname):
+        with open(fname, 'r') as f:
+            return(json.load(f))
+    
+    
+    def _reload(self, year):
+        # Reads the index of a year again, if a writer has replaced it
+        fname_index = get_fnames(self.folder, year)[1]
+        self.index[year] = self._read_index(fname_index)
+        self._data.pop(year, None)
+    
+    
+    def _open(self, year, key, func):
+        """
+        Returns func(fname) of the file self.index[year][key]. If the file
+        of the version was removed after the index was read, the index is
+        read again once.
+        """
+        
+        for attempt in range(2):
+            fname = os.path.join(self.folder, self.index[year][key])
+            try:
+                return(func(fname))
+            except FileNotFoundError:
+                if attempt == 1:
+                    raise
+                self._reload(year)
+    
+    
+    @property
+    def years(self):
+        return(list(self.index.keys()))
+    
+    
+    def variables(self, year):
+        # Returns the names of the variables of a year
+        return(list(self.index[year]['variables']))
+    
+    
+    def metadata(self, year):
+        # Returns the metadata of a year, e.g. title, station and units
+        return(self.index[year]['metadata'])
+    
+    
+    def get_data(self, year):
+        """
+        Returns the (n_variables, n_steps) memory map of a year, which
+        is opened on the first call
+        """
+        
+        if year not in self._data:
+            if year not in self.index:
+                raise KeyError('Year not found in ' + self.folder + ': ' + year)
+            self._data[year] = self._open(year, 'data_file', \
+                                    lambda fname: self._load_data(year, fname))
+        
+        return(self._data[year])
+    
+    
+    def get(self, year, variable):
+        """
+        Returns one variable as a read-only view to the memory map
+        """
+        
+        if year not in self.index:
+            raise KeyError('Year not found in ' + self.folder + ': ' + year)
+        
+        # The index can be read again by get_data()
+        X = self.get_data(year)
+        variables = self.index[year]['variables']
+        if variable not in variables:
+            raise KeyError('Variable not found for ' + year + ': ' + variable)
+        
+        return(X[variables.index(variable), :])
+    
+    
+    def _load_data(self, year, fname):
+        # Opens the memory map and checks it against the index
+        index_year = self.index[year]
+        if os.path.getsize(fname) != index_year['data_bytes']:
+            raise ValueError('Data file does not match the index: ' + fname)
+        
+        X = np.load(fname, mmap_mode='r')
+        if X.shape != (len(index_year['variables']), index_year['n_steps']):
+            raise ValueError('Data file does not match the index: ' + fname)
+        
+        return(X)
+    
+    
+    def time(self, year):
+        """
+        Returns the time stamps of a year as a pandas DatetimeIndex,
+        or None if the data has no time stamps
+        """
+        
+        if not self.index[year]['has_time']:
+            return(None)
+        
+        return(pd.DatetimeIndex(self._open(year, 'time_file', np.load)))
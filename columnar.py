@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar output of the climate data: all variables of one or several
+test years in one compressed file.
+
+The default format is a compressed numpy .npz file, which needs only
+numpy. Each variable is a separate member '<year>/<variable>', so that
+one variable can be read without reading the others, and the metadata of
+each year is stored as a json string in the member '<year>/metadata'.
+The file is read with np.load(fname) without pickle.
+
+Parquet ('parquet', needs pyarrow) and HDF5 ('hdf5', needs PyTables)
+files are written with pandas. A parquet file has one row per time step
+and year with a 'year' column, and a HDF5 file has one table per year.
+The metadata is stored in the file in both cases.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+
+
+file_extensions = {'npz': '.npz', \
+                   'parquet': '.parquet', \
+                   'hdf5': '.h5'}
+
+
+def get_file_format(fname):
+    # Returns the file format from the file name extension
+    for file_format, extension in file_extensions.items():
+        if fname.endswith(extension):
+            return(file_format)
+    raise ValueError('Unknown columnar file format: ' + fname)
+
+
+def write_columnar(fname, tables, metadata=None):
+    """
+    Writes the variables of one or several test years to one file.
+    The file format is chosen by the file name extension, see
+    file_extensions.
+    
+    tables is a dictionary from the year names to dictionaries of the
+    hourly variables, e.g. {'jok2004': {'Te': Te, 'RHe_water': ...}}
+    metadata is a dictionary from the year names to json serializable
+    dictionaries, e.g. the title, station and parameters of the year
+    """
+    
+    if metadata is None:
+        metadata = {}
+    
+    file_format = get_file_format(fname)
+    
+    folder = os.path.dirname(fname)
+    if folder != '':
+        os.makedirs(folder, exist_ok=True)
+    
+    if file_format == 'npz':
+        members = {}
+        for year, table in tables.items():
+            for key, x in table.items():
+                members[year + '/' + key] = np.asarray(x)
+            members[year + '/metadata'] = np.array( \
+                        json.dumps(metadata.get(year, {}), default=str))
+        
+        # np.savez adds .npz to the name, so a file object is used
+        with open(fname, 'wb') as f:
+            np.savez_compressed(f, **members)
+    
+    elif file_format == 'parquet':
+        dfs = []
+        for year, table in tables.items():
+            df = pd.DataFrame(table)
+            df.insert(0, 'year', year)
+            dfs.append(df)
+        df = pd.concat(dfs, ignore_index=True)
+        df['year'] = df['year'].astype('category')
+        df.attrs['metadata'] = json.dumps(metadata, default=str)
+        df.to_parquet(fname, index=False)
+    
+    elif file_format == 'hdf5':
+        with pd.HDFStore(fname, mode='w', complevel=5, complib='zlib') as store:
+            for year, table in tables.items():
+                store.put(year, pd.DataFrame(table), format='table')
+                store.get_storer(year).attrs.metadata = \
+                        json.dumps(metadata.get(year, {}), default=str)
+
+
+def read_columnar(fname, variables=None, years=None):
+    """
+    Reads a file written with write_columnar(). Returns the tables and
+    the metadata in the same form as the arguments of write_columnar().
+    variables and years are lists of the variables and years to read,
+    None = all.
+    """
+    
+    file_format = get_file_format(fname)
+    
+    tables = {}
+    metadata = {}
+    
+    if file_format == 'npz':
+        with np.load(fname, allow_pickle=False) as npz:
+            for member in npz.files:
+                year, key = member.rsplit('/', 1)
+                if years is not None and year not in years:
+                    continue
+                if key == 'metadata':
+                    metadata[year] = json.loads(str(npz[member]))
+                elif variables is None or key in variables:
+                    tables.setdefault(year, {})[key] = npz[member]
+    
+    elif file_format == 'parquet':
+        columns = None
+        if variables is not None:
+            columns = ['year'] + list(variables)
+        df = pd.read_parquet(fname, columns=columns)
+        metadata = json.loads(df.attrs.get('metadata', '{}'))
+        for year, df_year in df.groupby('year', observed=True, sort=False):
+            if years is None or year in years:
+                tables[year] = {key: df_year[key].values \
+                                for key in df_year.columns if key != 'year'}
+        metadata = {year: x for year, x in metadata.items() \
+                    if year in tables}
+    
+    elif file_format == 'hdf5':
+        with pd.HDFStore(fname, mode='r') as store:
+            for key in store.keys():
+                year = key.lstrip('/')
+                if years is not None and year not in years:
+                    continue
+                df = store.select(key, columns=variables)
+                tables[year] = {x: df[x].values for x in df.columns}
+                metadata[year] = json.loads(store.get_storer(key).attrs.metadata)
+    
+    return(tables, metadata)
+
+
+def combine_columnar(fnames, fname_out):
+    """
+    Combines several columnar files, e.g. the files of the test years,
+    to one file
+    """
+    
+    tables = {}
+    metadata = {}
+    for fname in fnames:
+        tables_file, metadata_file = read_columnar(fname)
+        tables.update(tables_file)
+        metadata.update(metadata_file)
+    
+    write_columnar(fname_out, tables, metadata)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Compressed text files for the csv, Delphin and WUFI outputs.
+
+The compression is chosen by the file name extension:
+.gz     gzip, needs only the standard library
+.zst    zstd, needs the zstandard package (pip install zstandard)
+other   no compression
+
+open_text() returns a text file object for writing or reading, so the
+writers in writers.py write the same text to all files, one chunk at a
+time. The gzip files are compressed in blocks of block_size bytes in
+n_threads threads, and each block is a separate gzip member, which all
+gzip readers (e.g. gzip.open(), zcat, pandas) read as one file. The zstd
+files are compressed with the threads of the zstd library. The files
+can be read with open_text() or the readers in writers.py.
+
+With gzip, the csv files compress to about a third and the Delphin and
+WUFI files to about a fifth of their size, see levels.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import collections
+import concurrent.futures
+import gzip
+import io
+import os
+
+
+file_extensions = {'gzip': '.gz', \
+                   'zstd': '.zst'}
+
+# Compression levels
+levels = {'gzip': 6, \
+          'zstd': 3}
+
+# Number of compression threads per file, 1 = compress in the writing
+# thread, and the size of the compressed blocks of the gzip files, bytes
+n_threads = 2
+block_size = 2**18
+
+# Shared by all gzip files of this process, see get_executor()
+_executor = {'pid': None, 'executor': None}
+
+
+def get_compression(fname):
+    # Returns 'gzip', 'zstd' or None from the file name extension
+    for compression, extension in file_extensions.items():
+        if fname.endswith(extension):
+            return(compression)
+    return(None)
+
+
+def add_extension(fname, compression):
+    # e.g. ('Te.csv', 'gzip') -> 'Te.csv.gz', compression can be None
+    if compression is None:
+        return(fname)
+    if compression not in file_extensions:
+        raise ValueError('Unknown compression: ' + str(compression))
+    return(fname + file_extensions[compression])
+
+
+def get_executor():
+    """
+    Returns the thread pool of the gzip compression. A forked worker
+    process creates its own pool.
+    """
+    
+    if _executor['pid'] != os.getpid():
+        _executor['executor'] = concurrent.futures.ThreadPoolExecutor( \
+                                        max_workers=n_threads)
+        _executor['pid'] = os.getpid()
+    
+    return(_executor['executor'])
+
+
+def import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('zstd compression needs the zstandard package, ' \
+                          + 'pip install zstandard, or use gzip')
+    return(zstandard)
+
+
+class GzipBlockWriter(io.RawIOBase):
+    """
+    Binary file object that compresses the written data in blocks of
+    block_size bytes, each block in a thread of get_executor() as one
+    gzip member. The members are written in order, and at most
+    2*n_threads blocks are compressed at a time.
+    """
+    
+    def __init__(self, fname, level=None):
+    
+        self.level = levels['gzip'] if level is None else level
+        self._f = open(fname, 'wb')
+        self._buffer = bytearray()
+        self._pending = collections.deque()
+        self._n_members = 0
+    
+    
+    def writable(self):
+        return(True)
+    
+    
+    def write(self, b):
+        self._buffer += b
+        while len(self._buffer) >= block_size:
+            self._submit(bytes(self._buffer[0:block_size]))
+            del self._buffer[0:block_size]
+        return(len(b))
+    
+    
+    def _submit(self, block):
+        # The time stamp of the members is 0, so the files are reproducible
+        self._n_members += 1
+        if n_threads <= 1:
+            self._f.write(gzip.compress(block, self.level, mtime=0))
+            return
+        
+        self._pending.append(get_executor().submit(gzip.compress, block, \
+                                                   self.level, mtime=0))
+        while len(self._pending) > 2*n_threads:
+            self._f.write(self._pending.popleft().result())
+    
+    
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if len(self._buffer) > 0 or self._n_members == 0:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            while len(self._pending) > 0:
+                self._f.write(self._pending.popleft().result())
+        finally:
+            self._f.close()
+            super().close()
+
+
+def open_text(fname, mode='r', encoding=None):
+    """
+    Opens a text file for reading (mode 'r') or writing ('w'), with the
+    compression of the file name extension, see get_compression()
+    """
+    
+    if mode not in ['r', 'w']:
+        raise ValueError('mode must be r or w: ' + str(mode))
+    
+    compression = get_compression(fname)
+    
+    if compression is None:
+        return(open(fname, mode, encoding=encoding))
+    
+    elif compression == 'gzip':
+        if mode == 'r':
+            return(gzip.open(fname, 'rt', encoding=encoding))
+        f = io.BufferedWriter(GzipBlockWriter(fname), buffer_size=block_size)
+    
+    elif compression == 'zstd':
+        zstandard = import_zstandard()
+        if mode == 'r':
+            f = zstandard.ZstdDecompressor().stream_reader(open(fname, 'rb'), \
+                                                          closefd=True)
+        else:
+            cctx = zstandard.ZstdCompressor(level=levels['zstd'], \
+                        threads=n_threads if n_threads > 1 else 0)
+            f = cctx.stream_writer(open(fname, 'wb'), closefd=True)
+    
+    return(io.TextIOWrapper(f, encoding=encoding))
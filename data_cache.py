@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Binary cache for the parsed building physical test years.
+
+The parsed data of each test year is stored as a .npy file in the cache
+folder. The file name contains a hash of the contents of the source file
+(.prn file or the xlsx workbook), so the cached data is invalidated
+automatically when the source file changes. The .npy files are opened
+as memory-mapped arrays, so loading them needs no parsing. The arrays of
+load_prn() and load_test_years_xlsx() are these memory maps, but
+load_test_years() copies the data to the dataframes, so the dataframes
+do not depend on the cache files and the calculation stages can add and
+change their columns.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import hashlib
+import os
+import re
+import numpy as np
+import pandas as pd
+
+import prn_files
+
+
+# Increase this if the contents of the cached arrays change
+cache_version = 2
+
+cache_folder_default = './cache'
+
+xlsx_fname_default = './input/bf_test_years_2020-04-20.xlsx'
+
+
+def calc_file_hash(fname):
+    """
+    Returns the sha256 hash of the contents of a file
+    """
+    
+    h = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            h.update(block)
+    
+    return(h.hexdigest())
+
+
+def get_cache_key(source_hash, *options):
+    """
+    Combines the hash of the source file, the cache version and the
+    reader options into a short key that is used in the cache file name
+    """
+    
+    txt = source_hash + '|' + str(cache_version) \
+            + '|' + '|'.join([str(x) for x in options])
+    key = hashlib.sha256(txt.encode('utf-8')).hexdigest()[0:16]
+    
+    return(key)
+
+
+def save_to_cache(fname_cache, X):
+    """
+    Saves the array to the cache. The array is first written to a
+    temporary file, so that other processes never see a partial file.
+    Old cache files of the same source and year are removed.
+    """
+    
+    folder, basename = os.path.split(fname_cache)
+    prefix = basename.rsplit('_', 1)[0] + '_'
+    
+    # Only <prefix><key>.npy, not the files of other sources with a
+    # longer name that starts with the same prefix
+    pattern = re.compile(re.escape(prefix) + '[0-9a-f]{16}\\.npy')
+    
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    
+    fname_tmp = fname_cache + '.' + str(os.getpid()) + '.tmp'
+    with open(fname_tmp, 'wb') as f:
+        np.save(f, np.ascontiguousarray(X, dtype=float))
+    os.replace(fname_tmp, fname_cache)
+    
+    for basename_old in os.listdir(folder):
+        if basename_old != basename and pattern.fullmatch(basename_old):
+            try:
+                os.remove(os.path.join(folder, basename_old))
+            except OSError:
+                pass
+
+
+def load_from_cache(fname_cache, mmap_mode='r'):
+    """
+    Returns the cached array or None, if the cache file does not exist
+    or it can't be read
+    """
+    
+    if not os.path.exists(fname_cache):
+        return(None)
+    
+    try:
+        X = np.load(fname_cache, mmap_mode=mmap_mode)
+    except (OSError, ValueError):
+        return(None)
+    
+    return(X)
+
+
+def load_prn(fname, name, source='prn', cache_folder=cache_folder_default, \
+             remove_leap_day=True, mmap_mode='r'):
+    """
+    Returns all 13 columns of a .prn file as a (n_steps, 13) array.
+    The array is read from the cache if the .prn file is unchanged,
+    otherwise the .prn file is parsed and the result is cached.
+    name and source are used in the cache file name.
+    """
+    
+    key = get_cache_key(calc_file_hash(fname), remove_leap_day)
+    fname_cache = os.path.join(cache_folder, \
+                               source + '_' + name + '_' + key + '.npy')
+    
+    X = load_from_cache(fname_cache, mmap_mode)
+    
+    if X is None:
+        X = prn_files.read_prn(fname, remove_leap_day)
+        save_to_cache(fname_cache, X)
+        X = load_from_cache(fname_cache, mmap_mode)
+    
+    return(X)
+
+
+def get_prn_fname(year_name, input_folder='./input', originals=False):
+    # Returns the .prn file name and the cache source name of a test year
+    
+    if originals:
+        fname = os.path.join(input_folder, \
+                             prn_files.prn_fnames_originals[year_name])
+        source = 'prnorig'
+    else:
+        fname = os.path.join(input_folder, prn_files.prn_fnames[year_name])
+        source = 'prn'
+    
+    return(fname, source)
+
+
+def load_test_year_prn(year_name, input_folder='./input', \
+                       cache_folder=cache_folder_default, \
+                       originals=False, remove_leap_day=True, \
+                       mmap_mode='r'):
+    """
+    Returns the data columns of one test year as a (n_steps, 8) array,
+    see load_prn()
+    """
+    
+    fname, source = get_prn_fname(year_name, input_folder, originals)
+    
+    X = load_prn(fname, year_name, source, cache_folder, remove_leap_day, \
+                 mmap_mode)
+    
+    return(X[:, 5:])
+
+
+def load_record(fname, cache_folder=cache_folder_default, \
+                remove_leap_day=False):
+    """
+    Returns a long hourly record in the .prn format, e.g. 30 years of
+    FMI data, as a pandas dataframe with the same columns as the test
+    years and a DatetimeIndex. By default the leap days are kept.
+    """
+    
+    name = os.path.splitext(os.path.basename(fname))[0]
+    X = load_prn(fname, name, 'record', cache_folder, remove_leap_day)
+    
+    data = pd.DataFrame(X[:, 5:], copy=True, \
+                        columns=prn_files.data_col_names, \
+                        index=prn_files.get_time_index(X, remove_leap_day))
+    
+    return(data)
+
+
+def load_test_years_xlsx(year_names, fname=xlsx_fname_default, \
+                         cache_folder=cache_folder_default, mmap_mode='r'):
+    """
+    Returns a dictionary of (n_steps, 8) arrays read from the sheets
+    of the xlsx workbook. The workbook is read only if some of the
+    sheets are missing from the cache.
+    """
+    
+    source_hash = calc_file_hash(fname)
+    
+    fnames_cache = {}
+    for year_name in year_names:
+        key = get_cache_key(source_hash, year_name)
+        fnames_cache[year_name] = os.path.join(cache_folder, \
+                            'xlsx_' + year_name + '_' + key + '.npy')
+    
+    d = {}
+    for year_name in year_names:
+        d[year_name] = load_from_cache(fnames_cache[year_name], mmap_mode)
+    
+    missing = [x for x in year_names if d[x] is None]
+    
+    if len(missing) > 0:
+        data = pd.read_excel(fname, sheet_name=missing)
+        for year_name in missing:
+            X = data[year_name].loc[:, prn_files.data_col_names].values
+            save_to_cache(fnames_cache[year_name], X)
+            d[year_name] = load_from_cache(fnames_cache[year_name], mmap_mode)
+    
+    return(d)
+
+
+def load_test_years(year_names=None, input_folder='./input', \
+                    cache_folder=cache_folder_default, source='prn', \
+                    originals=False, remove_leap_day=True, time_index=False):
+    """
+    Cached replacement for prn_files.read_test_years(). Returns a
+    dictionary of pandas dataframes with the columns Te, RHe_water, ws,
+    wd, Rglob, Rdif, Rbeam and precip.
+    
+    source is either 'prn' (the .prn files in input_folder) or
+    'xlsx' (the workbook bf_test_years_2020-04-20.xlsx in input_folder)
+    If time_index is True, the dataframes are indexed with the time
+    stamps of the .prn files (see prn_files.get_time_index()).
+    """
+    
+    if year_names is None:
+        year_names = list(prn_files.prn_fnames.keys())
+    
+    time_indexes = {}
+    
+    if source == 'prn':
+        arrays = {}
+        for year_name in year_names:
+            fname, source_name = get_prn_fname(year_name, input_folder, \
+                                               originals)
+            X = load_prn(fname, year_name, source_name, cache_folder, \
+                         remove_leap_day)
+            arrays[year_name] = X[:, 5:]
+            if time_index:
+                time_indexes[year_name] = prn_files.get_time_index(X, \
+                                                        remove_leap_day)
+    
+    elif source == 'xlsx':
+        if time_index:
+            raise ValueError('The xlsx file has no time columns')
+        fname = os.path.join(input_folder, \
+                             os.path.basename(xlsx_fname_default))
+        arrays = load_test_years_xlsx(year_names, fname, cache_folder)
+    
+    else:
+        raise ValueError('Unknown source: ' + str(source))
+    
+    # Copied from the read-only memory maps, see the module docstring
+    data = {}
+    for year_name in year_names:
+        data[year_name] = pd.DataFrame(arrays[year_name], copy=True, \
+                                       columns=prn_files.data_col_names, \
+                                       index=time_indexes.get(year_name))
+    
+    return(data)
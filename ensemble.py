@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo ensembles of perturbed test years for sensitivity studies.
+
+The outdoor air temperature, relative humidity, wind speed and
+precipitation of a base test year are perturbed, and the longwave
+radiation (LWrad.py), the indoor air conditions (indoor_climate.py) and
+the indoor air pressure and wind-driven rain (climate_files.py) are
+calculated for all members at once as (n_members, n_steps) arrays.
+
+The perturbations are given as a dictionary, e.g.
+
+    spec = {'Te': ('add', 1.0), \
+            'RHe_water': ('add', 5.0), \
+            'ws': ('scale', 0.1), \
+            'precip': ('scale', 0.2)}
+
+'add' adds a normally distributed offset with the given standard
+deviation to the whole year, and 'scale' multiplies the year with
+1 + a normally distributed factor (limited to >= 0). Each member has
+its own offsets and factors, which are stored with the results. The
+relative humidity is limited to RHe_min...100 %, because the dew point
+(psychrometrics.dew_point()) is not defined at 0 %.
+
+The members are calculated in batches of batch_size members, so that
+the memory use does not depend on the number of members. run_ensemble()
+writes each member to its own columnar file (see columnar.py) as soon as
+its batch is ready, and calc_ensemble() returns all members in memory.
+The members are written only as columnar files, not as csv, Delphin or
+WUFI files, because there would be one set of those files per member.
+
+The building parameters (h, orientation, terrain category, etc.) are
+read from climate_files.py, and the location of the station from the
+station registry, stations.py.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import os
+import numpy as np
+
+import climate_files
+import columnar
+import indoor_climate
+import instrumentation
+import LWrad
+import psychrometrics
+import sky_models
+import stations
+
+
+perturbation_kinds = ['add', 'scale']
+
+# Lower limit of the perturbed outdoor air relative humidity, %
+RHe_min = 1.0
+
+# Indoor air variants of climate_files.calc_indoor_air()
+indoor_variants = [('21', 'RIL107_2'), ('S2', 'RIL107_2')]
+
+ensemble_folder_default = './output/ensemble'
+
+
+def draw_perturbations(spec, n_members, seed=None):
+    """
+    Returns a dictionary from the variable names of spec to the
+    (n_members,) arrays of the offsets ('add') or factors ('scale')
+    """
+    
+    rng = np.random.default_rng(seed)
+    
+    # One row per member, so that the first members are the same
+    # regardless of n_members
+    z = rng.standard_normal((n_members, len(spec)))
+    
+    perturbations = {}
+    for idx, (key, (kind, sd)) in enumerate(spec.items()):
+        if kind not in perturbation_kinds:
+            raise ValueError('Unknown perturbation for ' + key + ': ' + kind)
+        x = sd * z[:, idx]
+        if kind == 'scale':
+            x = np.maximum(1.0 + x, 0.0)
+        perturbations[key] = x
+    
+    return(perturbations)
+
+
+def perturb(data_year, spec, perturbations, members):
+    """
+    Returns the perturbed outdoor air data of the members (list of
+    indices) as a dictionary of (n_members, n_steps) arrays
+    """
+    
+    inputs = {}
+    for key in ['Te', 'RHe_water', 'ws', 'precip']:
+        x = data_year.loc[:, key].values[None, :]
+        if key in spec:
+            p = perturbations[key][members][:, None]
+            if spec[key][0] == 'add':
+                x = x + p
+            else:
+                x = x * p
+        else:
+            x = np.repeat(x, len(members), axis=0)
+        inputs[key] = x
+    
+    inputs['RHe_water'] = np.clip(inputs['RHe_water'], RHe_min, 100.0)
+    inputs['ws'] = np.maximum(inputs['ws'], 0.0)
+    inputs['precip'] = np.maximum(inputs['precip'], 0.0)
+    
+    return(inputs)
+
+
+def calc_members(data_year, K_t, inputs, buffers=None):
+    """
+    Calculates the derived variables of the perturbed members in one
+    vectorized pass. K_t is the clearness index of the base year, which
+    does not depend on the perturbed variables. buffers are the work
+    arrays of LWrad.get_half_hour_buffers() with the shape of the inputs,
+    or None. Returns a dictionary of (n_members, n_steps) arrays.
+    """
+    
+    Te = inputs['Te']
+    RHe_water = inputs['RHe_water']
+    ws = inputs['ws']
+    precip = inputs['precip']
+    wd = data_year.loc[:, 'wd'].values
+    n_steps = Te.shape[-1]
+    
+    res = dict(inputs)
+    if buffers is None:
+        buffers = LWrad.get_half_hour_buffers(Te.shape)
+    
+    # LWdn, LWrad.py
+    T_air, T_dew = LWrad.LWrad.calc_half_hour_air(Te, RHe_water, buffers)
+    epsilon_sky = sky_models.emissivity_mundt_petersen(T_dew, T_air, K_t)
+    res['LWdn'] = epsilon_sky * 5.67e-8 * T_air**4
+    
+    # Indoor air, see climate_files.calc_indoor_air()
+    indoor = indoor_climate.calc_indoor_climate(Te, RHe_water, \
+                                                indoor_variants, \
+                                                climate_files.window_width, \
+                                                buffers=buffers)
+    for idx, (Ti_name, vi_name, RHi_name) in \
+            enumerate([('Ti_21', 'vi_Ti21', 'RHi_Ti21'), \
+                       ('Ti_S2', 'vi_TiS2', 'RHi_TiS2')]):
+        res[Ti_name] = indoor['Ti'][idx]
+        res[vi_name] = indoor['vi'][idx]
+        res[RHi_name] = indoor['RHi'][idx]
+    
+    res['RHe_ice'] = psychrometrics.rh_water_to_ice(Te, RHe_water, \
+                                                   work=buffers['work'])
+    np.minimum(100.0, res['RHe_ice'], out=res['RHe_ice'])
+    
+    # Pi, SFS-EN 1991-1-4
+    h = climate_files.h
+    orientation = climate_files.orientation
+    terrain_category = climate_files.terrain_category
+    C_T = climate_files.C_T
+    
+    Pe = climate_files.Pe_basevalue * np.ones(n_steps)
+    C_R = climate_files.get_c_r(h, terrain_category, method='ISO_1991_1_4')
+    dPT, dPw, dP = climate_files.calc_dP(Te, res['Ti_S2'], Pe, \
+                                         ws * C_R * C_T, wd, h, orientation)
+    res['Pi'] = Pe + dP
+    
+    # WDR, SFS-EN ISO 15927-3, l/(m2s)
+    I_A = climate_files.calculate_I_A_array(ws, wd, precip, Te, \
+                                            climate_files.Te_min, orientation)
+    C_R = climate_files.get_c_r(h, terrain_category, method='ISO_15927_3')
+    res['WDR'] = I_A * C_R * C_T * climate_files.O * climate_files.W / 3600
+    
+    return(res)
+
+
+def iter_ensemble(data_year, spec, n_members, station, seed=None, \
+                  batch_size=50):
+    """
+    Yields the members in batches as (members, perturbations, res),
+    where members is a list of the member indices, perturbations the
+    dictionary of draw_perturbations() for all members and res the
+    dictionary of calc_members(). station is the name of the station
+    or the test year, e.g. 'jok' or 'jok2004', see stations.py.
+    """
+    
+    perturbations = draw_perturbations(spec, n_members, seed)
+    
+    # The clearness index of the base year
+    location = stations.get_station(station)
+    base = LWrad.LWrad(data_year, location['latitude'], \
+                       location['longitude'], '', '', plot=False, \
+                       export_csv=False, time_zone=location['time_zone'])
+    
+    # The work arrays are allocated once and shared by the batches
+    buffers = LWrad.get_half_hour_buffers((min(batch_size, n_members), \
+                                           len(data_year.index)))
+    
+    for idx_start in range(0, n_members, batch_size):
+        members = list(range(idx_start, min(idx_start + batch_size, n_members)))
+        inputs = perturb(data_year, spec, perturbations, members)
+        buffers_batch = {key: x[0:len(members)] for key, x in buffers.items()}
+        yield(members, perturbations, calc_members(data_year, base.K_t, \
+                                                   inputs, buffers_batch))
+
+
+def calc_ensemble(data_year, spec, n_members, station, seed=None, \
+                  batch_size=50):
+    """
+    Returns all members in memory as a dictionary of (n_members,
+    n_steps) arrays and the perturbations of the members
+    """
+    
+    res = {}
+    for members, perturbations, res_batch in iter_ensemble(data_year, \
+                    spec, n_members, station, seed, batch_size):
+        for key, x in res_batch.items():
+            if key not in res:
+                res[key] = np.empty((n_members, x.shape[-1]))
+            res[key][members, :] = x
+    
+    return(res, perturbations)
+
+
+def get_member_fname(folder, year, member):
+    return(os.path.join(folder, year, 'member_' + str(member).zfill(4) \
+                        + columnar.file_extensions['npz']))
+
+
+def run_ensemble(year, data_year, spec, n_members, seed=None, \
+                 batch_size=50, folder=ensemble_folder_default):
+    """
+    Calculates the members and writes each member to its own columnar
+    file <folder>/<year>/member_NNNN.npz with the station, perturbations,
+    seed and building parameters as metadata. The station is looked up
+    with the name of the test year. Returns the file names.
+    """
+    
+    fnames = []
+    batches = iter_ensemble(data_year, spec, n_members, year, seed, \
+                            batch_size)
+    
+    for members, perturbations, res in batches:
+        with instrumentation.stage('write_ensemble', year):
+            for idx, member in enumerate(members):
+                metadata = {'year': year, \
+                            'member': member, \
+                            'station': stations.get_station(year), \
+                            'seed': seed, \
+                            'spec': spec, \
+                            'perturbations': {key: float(x[member]) \
+                                              for key, x in perturbations.items()}, \
+                            'parameters': climate_files.get_run_parameters()}
+                table = {key: x[idx, :] for key, x in res.items()}
+                fname = get_member_fname(folder, year, member)
+                columnar.write_columnar(fname, {year: table}, {year: metadata})
+                instrumentation.record_output(fname)
+                fnames.append(fname)
+    
+    return(fnames)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Fingerprints for incremental rebuilds of the output files.
+
+Each output file has a fingerprint, which is a hash of everything the
+file depends on: the input data, the parameters that affect it and the
+source code of the modules that produce it. The fingerprints of the
+written files are stored in a json file. On the next run, a file is
+rebuilt only if it is missing or its fingerprint has changed.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import hashlib
+import json
+import os
+import types
+import numpy as np
+
+
+state_fname_default = './output/.build_state.json'
+
+
+def hash_array(x):
+    """
+    Returns the sha256 hash of the values of an array
+    """
+    
+    x = np.ascontiguousarray(x, dtype=float)
+    h = hashlib.sha256()
+    h.update(str(x.shape).encode('utf-8'))
+    h.update(x.tobytes())
+    
+    return(h.hexdigest())
+
+
+def hash_files(fnames):
+    """
+    Returns a combined sha256 hash of the contents of the files,
+    e.g. the source files of the modules that produce the outputs
+    """
+    
+    h = hashlib.sha256()
+    for fname in fnames:
+        with open(fname, 'rb') as f:
+            h.update(f.read())
+    
+    return(h.hexdigest())
+
+
+def get_module_files(modules):
+    """
+    Returns the sorted source files of the modules and of all modules of
+    this repository that they import, directly or indirectly, e.g.
+    climate_files -> indoor_climate.py, psychrometrics.py, writers.py, ...
+    """
+    
+    folder = os.path.dirname(os.path.abspath(__file__))
+    
+    fnames = set()
+    stack = list(modules)
+    while len(stack) > 0:
+        module = stack.pop()
+        fname = getattr(module, '__file__', None)
+        if fname is None or fname in fnames:
+            continue
+        if os.path.dirname(os.path.abspath(fname)) != folder:
+            continue
+        fnames.add(fname)
+        stack.extend([x for x in vars(module).values() \
+                      if isinstance(x, types.ModuleType)])
+    
+    return(sorted(fnames))
+
+
+def calc_fingerprint(dependencies):
+    """
+    Returns the fingerprint of an output file. dependencies is a
+    dictionary from the dependency names to json serializable values,
+    e.g. {'input': '3fa2...', 'h': 6.0, 'orientation': 180.0}
+    """
+    
+    txt = json.dumps(dependencies, sort_keys=True, default=str)
+    fingerprint = hashlib.sha256(txt.encode('utf-8')).hexdigest()
+    
+    return(fingerprint)
+
+
+class BuildState():
+    """
+    The stored fingerprints of the output files
+    """
+    
+    def __init__(self, fname=state_fname_default):
+    
+        self.fname = fname
+        self.fingerprints = {}
+        
+        if os.path.exists(self.fname):
+            try:
+                with open(self.fname, 'r') as f:
+                    self.fingerprints = json.load(f)
+            except (OSError, ValueError):
+                # A broken state file means that everything is rebuilt
+                self.fingerprints = {}
+    
+    
+    def is_stale(self, fname, fingerprint):
+        """
+        Returns True if the output file is missing or it was
+        built with different dependencies
+        """
+        
+        if not os.path.exists(fname):
+            return(True)
+        
+        return(self.fingerprints.get(fname) != fingerprint)
+    
+    
+    def get_stale(self, fingerprints):
+        """
+        Returns the set of stale output files of the dictionary
+        fingerprints (file name -> fingerprint)
+        """
+        
+        stale = set([fname for fname, fingerprint in fingerprints.items() \
+                     if self.is_stale(fname, fingerprint)])
+        
+        return(stale)
+    
+    
+    def update(self, fingerprints):
+        """
+        Stores the fingerprints of the output files that were written
+        """
+        
+        self.fingerprints.update(fingerprints)
+    
+    
+    def save(self):
+        """
+        Writes the fingerprints to the json file
+        """
+        
+        folder = os.path.dirname(self.fname)
+        if folder != '':
+            os.makedirs(folder, exist_ok=True)
+        
+        fname_tmp = self.fname + '.tmp'
+        with open(fname_tmp, 'w') as f:
+            json.dump(self.fingerprints, f, indent=0, sort_keys=True)
+        os.replace(fname_tmp, self.fname)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Indoor climate models as a function of the outdoor air conditions.
+
+An indoor climate variant is a combination of a temperature model and a
+moisture model, e.g. ('S2', 'RIL107_2') or ('EN15026', 'EN15026'). All
+requested variants are calculated in one pass over the outdoor data: the
+rolling means of the outdoor air temperature and vapour content are
+calculated only once with cumulative sums, and each temperature and
+moisture model is evaluated only once, even if it is used in several
+variants. The results are (n_variants, n_steps) arrays.
+
+Temperature models, indoor air temperature (degC) as a function of the
+rolling mean of the outdoor air temperature:
+21          constant 21 degC
+S1, S2, S3  target values of the indoor air temperature of the classes
+            S1, S2 and S3 of the Finnish classification of indoor
+            environment 2018 (Sisailmastoluokitus 2018). The curves are
+            constant below 0 degC and rise linearly to 0.5 degC below
+            the maximum room temperature of the class (25, 26 and 27
+            degC) at 20 degC. S2 is the curve that has always been used
+            in climate_files.py.
+EN15026     SFS-EN 15026, annex C: 20 degC below 10 degC, rising
+            linearly to 25 degC at 20 degC
+
+Moisture models:
+RIL107_2        moisture excess of moisture class 2 of the guidebook
+                RIL 107-2012 (the one that has always been used)
+ISO13788_1..5   moisture excess of the humidity classes 1-5 of
+                SFS-EN ISO 13788, annex A: 0.002, 0.004, 0.006, 0.008
+                and 0.010 kg/m3 below 0 degC, falling linearly to zero
+                at 20 degC
+EN15026         relative humidity of SFS-EN 15026, annex C (normal
+                occupancy): 30 % below -10 degC, rising linearly to
+                60 % at 20 degC
+
+The moisture excess is added to the rolling mean of the outdoor air
+vapour content, and the indoor air relative humidity is limited to 95 %.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import numpy as np
+import pandas as pd
+
+import psychrometrics
+
+
+# Curves (x = outdoor air temperature, degC)
+temperature_models = {'21': ((-30, 30), (21.0, 21.0)), \
+                      'S1': ((-30, 0, 20, 30), (21.5, 21.5, 24.5, 24.5)), \
+                      'S2': ((-30, 0, 20, 30), (21.5, 21.5, 25.5, 25.5)), \
+                      'S3': ((-30, 0, 20, 30), (21.0, 21.0, 26.5, 26.5)), \
+                      'EN15026': ((10, 20), (20.0, 25.0))}
+
+# Moisture excess (kg/m3) or relative humidity (%) curves
+moisture_models = {'RIL107_2': ('dv', (-30, 5, 15, 30), \
+                                (0.005, 0.005, 0.002, 0.002)), \
+                   'ISO13788_1': ('dv', (0, 20), (0.002, 0.0)), \
+                   'ISO13788_2': ('dv', (0, 20), (0.004, 0.0)), \
+                   'ISO13788_3': ('dv', (0, 20), (0.006, 0.0)), \
+                   'ISO13788_4': ('dv', (0, 20), (0.008, 0.0)), \
+                   'ISO13788_5': ('dv', (0, 20), (0.010, 0.0)), \
+                   'EN15026': ('RH', (-10, 20), (30.0, 60.0))}
+
+# Upper limit of the indoor air relative humidity, %
+RHi_max = 95.0
+
+
+def rolling_mean(x, window_width, method='cumsum'):
+    """
+    Trailing rolling mean of window_width time steps along the last
+    axis. The first values are the means of the available values, as in
+    pandas rolling(window_width, min_periods=1).mean().
+    
+    method 'cumsum' calculates all means from one cumulative sum. The
+    results differ from pandas only by rounding errors (about 1e-12),
+    but the rounding of the exported values can change at exact halfway
+    cases. method 'pandas' uses pandas, which reproduces the published
+    climate files of climate_files.py exactly (one dimensional x only).
+    """
+    
+    if method == 'pandas':
+        return(pd.Series(x).rolling(window_width, min_periods=1).mean().values)
+    elif method != 'cumsum':
+        raise ValueError('Unknown rolling mean method: ' + str(method))
+    
+    x = np.asarray(x, dtype=float)
+    n_steps = x.shape[-1]
+    
+    c = np.empty(x.shape[:-1] + (n_steps + 1,))
+    c[..., 0] = 0.0
+    np.cumsum(x, axis=-1, out=c[..., 1:])
+    
+    idx_end = np.arange(1, n_steps + 1)
+    idx_start = np.maximum(idx_end - window_width, 0)
+    
+    return((c[..., idx_end] - c[..., idx_start]) / (idx_end - idx_start))
+
+
+def get_variant_name(variant):
+    # e.g. ('S2', 'RIL107_2') -> 'S2_RIL107_2'
+    return(variant[0] + '_' + variant[1])
+
+
+def calc_indoor_climate(Te, RHe_water, variants, window_width=24, \
+                        rolling_method='cumsum', buffers=None):
+    """
+    Calculates the indoor air temperature (degC), vapour content (kg/m3)
+    and relative humidity (%) of the variants.
+    
+    Te and RHe_water are the hourly outdoor air temperature (degC) and
+    relative humidity with respect to liquid water (%). They can also be
+    (n_members, n_steps) arrays, see ensemble.py.
+    variants is a list of (temperature model, moisture model) tuples
+    window_width is the length of the rolling mean, time steps
+    rolling_method is 'cumsum' or 'pandas', see rolling_mean()
+    buffers is None or a dictionary with the work arrays 've' and 'work'
+    of the shape of Te, e.g. from LWrad.get_half_hour_buffers()
+    
+    Returns a dictionary with the keys 'names' (list of the variant
+    names) and 'Ti', 'vi' and 'RHi', which are (n_variants, n_steps)
+    arrays in the same order as the variants, or (n_variants,
+    n_members, n_steps) arrays.
+    """
+    
+    for T_model, moisture_model in variants:
+        if T_model not in temperature_models:
+            raise KeyError('Unknown temperature model: ' + T_model)
+        if moisture_model not in moisture_models:
+            raise KeyError('Unknown moisture model: ' + moisture_model)
+    
+    Te = np.asarray(Te, dtype=float)
+    
+    ve, work = None, None
+    if buffers is not None:
+        ve, work = buffers['ve'], buffers['work']
+    
+    # Shared by all variants
+    Te_mean = rolling_mean(Te, window_width, rolling_method)
+    ve_mean = rolling_mean(psychrometrics.vapour_content(Te, RHe_water, \
+                                                         ve, work), \
+                           window_width, rolling_method)
+    
+    Ti = np.empty((len(variants),) + Te.shape)
+    vi = np.empty((len(variants),) + Te.shape)
+    RHi = np.empty((len(variants),) + Te.shape)
+    
+    # Each model is evaluated once
+    Ti_models = {}
+    vsat_models = {}
+    moisture = {}
+    
+    for idx, (T_model, moisture_model) in enumerate(variants):
+    
+        if T_model not in Ti_models:
+            xp, fp = temperature_models[T_model]
+            Ti_models[T_model] = np.interp(Te_mean, xp, fp)
+            vsat_models[T_model] = psychrometrics.vapour_content( \
+                                            Ti_models[T_model], 100.0, \
+                                            work=work)
+        
+        if moisture_model not in moisture:
+            kind, xp, fp = moisture_models[moisture_model]
+            moisture[moisture_model] = np.interp(Te_mean, xp, fp)
+        
+        Ti[idx] = Ti_models[T_model]
+        vsat = vsat_models[T_model]
+        
+        kind = moisture_models[moisture_model][0]
+        if kind == 'dv':
+            np.add(ve_mean, moisture[moisture_model], out=vi[idx])
+            np.multiply(vi[idx], 100.0, out=RHi[idx])
+            np.divide(RHi[idx], vsat, out=RHi[idx])
+        else:
+            RHi[idx] = moisture[moisture_model]
+            np.multiply(vsat, RHi[idx] / 100.0, out=vi[idx])
+        
+        np.minimum(RHi[idx], RHi_max, out=RHi[idx])
+    
+    results = {'names': [get_variant_name(x) for x in variants], \
+               'Ti': Ti, \
+               'vi': vi, \
+               'RHi': RHi}
+    
+    return(results)
+
+
+def get_all_variants():
+    # All combinations of the temperature and moisture models
+    return([(T_model, moisture_model) \
+            for T_model in temperature_models.keys() \
+            for moisture_model in moisture_models.keys()])
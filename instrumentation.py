@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the calculation stages and a machine-readable run
+report.
+
+A stage is measured with a with-statement:
+
+    with instrumentation.stage('write_csv', year):
+        ...
+        instrumentation.record_output(fname)
+
+For each stage the wall time, the CPU time, the number and size of the
+written files (given with record_output()), the peak resident set size
+(RSS) of the process and the values given with record_value() are
+recorded. The stages can be nested, e.g. the writers of one test year
+are inside the stage 'process_year'. write_report() writes all recorded
+stages and a summary per stage name to a json file.
+
+The peak RSS is read from /proc/self/status and it can be reset for each
+stage only on Linux. Elsewhere the peak RSS is not recorded (None).
+
+One stage can be profiled by setting settings['profile_stage'] to the
+name of the stage (and optionally settings['profile_year']).
+settings['profile_mode'] is either 'cprofile', which writes a .prof file
+that can be read with the pstats module or e.g. snakeviz, or
+'tracemalloc', which writes the 25 lines of code that allocated most of
+the memory to a text file. The files are written to
+settings['profile_folder'].
+
+The values given with record_value() are also printed, unless
+settings['print_values'] is False.
+
+Stages that are run in worker processes are recorded with
+call_recorded(), see climate_files.run(). The files that are written in
+writer threads are added to the stages that submitted them, see
+writer_pool.py.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import contextlib
+import cProfile
+import datetime
+import json
+import os
+import time
+import tracemalloc
+
+
+settings = {'profile_stage': None, \
+            'profile_year': None, \
+            'profile_mode': 'cprofile', \
+            'profile_folder': './output/profile', \
+            'print_values': True}
+
+# Completed stages of this process, and the stages that are running
+_records = []
+_stack = []
+
+# Peak RSS of the whole run, MB
+_peak_rss = {'MB': None}
+
+_t_start = {'wall': time.time(), 'perf': time.perf_counter(), \
+            'cpu': time.process_time()}
+
+
+def read_proc_status(key):
+    # Returns a memory value (MB) from /proc/self/status, or None
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(key + ':'):
+                    return(float(line.split()[1]) / 1024)
+    except OSError:
+        pass
+    return(None)
+
+
+def reset_peak_rss():
+    # Resets the peak RSS (VmHWM) of the process, Linux only
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def update_peak_rss():
+    # Updates the peak RSS of the run and all running stages
+    peak = read_proc_status('VmHWM')
+    if peak is None:
+        return
+    if _peak_rss['MB'] is None or _peak_rss['MB'] < peak:
+        _peak_rss['MB'] = peak
+    for record in _stack:
+        if record['peak_rss_MB'] is None or record['peak_rss_MB'] < peak:
+            record['peak_rss_MB'] = peak
+
+
+def reset():
+    # Removes the recorded stages and restarts the clock of the run
+    del _records[:]
+    _peak_rss['MB'] = None
+    _t_start['wall'] = time.time()
+    _t_start['perf'] = time.perf_counter()
+    _t_start['cpu'] = time.process_time()
+
+
+def is_profiled(name, year):
+    # True, if the stage is selected for profiling in settings
+    if settings['profile_stage'] != name:
+        return(False)
+    return(settings['profile_year'] is None or settings['profile_year'] == year)
+
+
+def get_profile_fname(name, year, extension):
+    fname = name if year is None else name + '_' + year
+    os.makedirs(settings['profile_folder'], exist_ok=True)
+    return(os.path.join(settings['profile_folder'], fname + extension))
+
+
+@contextlib.contextmanager
+def stage(name, year=None):
+    """
+    Measures the code inside the with-statement as one stage. year is
+    the name of the test year or station, or None. Yields the record
+    of the stage, a dictionary.
+    """
+    
+    record = {'stage': name, \
+              'year': year, \
+              'parent': _stack[-1]['stage'] if len(_stack) > 0 else None, \
+              'pid': os.getpid(), \
+              'wall_time_s': 0.0, \
+              'cpu_time_s': 0.0, \
+              'bytes_written': 0, \
+              'n_files': 0, \
+              'peak_rss_MB': None, \
+              'values': {}}
+    
+    # The peak of the outer stages so far, before it is reset
+    update_peak_rss()
+    reset_peak_rss()
+    _stack.append(record)
+    
+    profiler = None
+    if is_profiled(name, year):
+        if settings['profile_mode'] == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        elif settings['profile_mode'] == 'tracemalloc':
+            if not tracemalloc.is_tracing():
+                profiler = 'tracemalloc'
+                tracemalloc.start()
+        else:
+            raise ValueError('Unknown profile_mode: ' \
+                             + str(settings['profile_mode']))
+    
+    t_wall = time.perf_counter()
+    t_cpu = time.process_time()
+    
+    try:
+        yield(record)
+    
+    finally:
+        record['wall_time_s'] = time.perf_counter() - t_wall
+        record['cpu_time_s'] = time.process_time() - t_cpu
+        
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            fname = get_profile_fname(name, year, '.prof')
+            profiler.dump_stats(fname)
+            record['profile'] = fname
+        
+        elif profiler == 'tracemalloc':
+            snapshot = tracemalloc.take_snapshot()
+            record['tracemalloc_peak_MB'] = \
+                        tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            fname = get_profile_fname(name, year, '_tracemalloc.txt')
+            with open(fname, 'w') as f:
+                for stat in snapshot.statistics('lineno')[0:25]:
+                    f.write(str(stat) + '\n')
+            record['profile'] = fname
+        
+        update_peak_rss()
+        _stack.pop()
+        _records.append(record)
+
+
+def record_output(fname, records=None):
+    """
+    Adds a written file to the running stages, or to records (list of
+    stages from get_running_stages()) if the file was written in the
+    background, see writer_pool.py
+    """
+    
+    if records is None:
+        records = _stack
+    
+    n_bytes = os.path.getsize(fname)
+    for record in records:
+        record['bytes_written'] += n_bytes
+        record['n_files'] += 1
+
+
+def record_value(key, value):
+    """
+    Stores a value, e.g. a coefficient or an annual sum, to the innermost
+    running stage and prints it with the year of the stage. Outside the
+    stages the value is only printed.
+    """
+    
+    year = None
+    if len(_stack) > 0:
+        _stack[-1]['values'][key] = value
+        year = _stack[-1]['year']
+    
+    if settings['print_values']:
+        print(key if year is None else year + ' ' + key, value)
+
+
+def get_running_stages():
+    # Returns the stages that are running, the innermost last
+    return(list(_stack))
+
+
+def get_records():
+    # Returns the completed stages of this process
+    return(list(_records))
+
+
+def call_recorded(settings_caller, name, year, func, *args):
+    """
+    Calls func(*args) as the stage name and returns the result and the
+    stages recorded during the call. Used for the tasks that can be run in
+    worker processes, see merge_records(). settings_caller is a copy of
+    settings of the calling process.
+    """
+    
+    settings.update(settings_caller)
+    
+    # A forked worker process has a copy of the stages of the caller
+    if len(_stack) > 0 and _stack[0]['pid'] != os.getpid():
+        del _stack[:]
+    
+    n_records = len(_records)
+    
+    with stage(name, year):
+        result = func(*args)
+    
+    records = _records[n_records:]
+    del _records[n_records:]
+    
+    return(result, records)
+
+
+def merge_records(result_records):
+    """
+    Adds the stages recorded with call_recorded() to this process and
+    returns the result of the call
+    """
+    
+    result, records = result_records
+    
+    # The files of the worker belong also to the stages running here
+    for record in records:
+        if record['parent'] is None:
+            record['parent'] = _stack[-1]['stage'] if len(_stack) > 0 else None
+            for outer in _stack:
+                outer['bytes_written'] += record['bytes_written']
+                outer['n_files'] += record['n_files']
+    _records.extend(records)
+    
+    return(result)
+
+
+def summarize(records):
+    """
+    Sums the stages with the same name. Returns a dictionary from the
+    stage names to the totals.
+    """
+    
+    summary = {}
+    for record in records:
+        x = summary.setdefault(record['stage'], \
+                               {'count': 0, \
+                                'wall_time_s': 0.0, \
+                                'cpu_time_s': 0.0, \
+                                'bytes_written': 0, \
+                                'n_files': 0, \
+                                'peak_rss_MB': None})
+        x['count'] += 1
+        for key in ['wall_time_s', 'cpu_time_s', 'bytes_written', 'n_files']:
+            x[key] += record[key]
+        if record['peak_rss_MB'] is not None:
+            x['peak_rss_MB'] = max(x['peak_rss_MB'] or 0.0, \
+                                   record['peak_rss_MB'])
+    
+    return(summary)
+
+
+def get_report(parameters=None):
+    """
+    Returns the run report as a json serializable dictionary.
+    parameters is a dictionary of e.g. the building parameters.
+    """
+    
+    records = get_records()
+    update_peak_rss()
+    
+    report = {'started': datetime.datetime.fromtimestamp( \
+                                    _t_start['wall']).isoformat(), \
+              'wall_time_s': time.perf_counter() - _t_start['perf'], \
+              'cpu_time_s': time.process_time() - _t_start['cpu'], \
+              'peak_rss_MB': _peak_rss['MB'], \
+              'bytes_written': sum([x['bytes_written'] for x in records \
+                                    if x['parent'] is None]), \
+              'n_files': sum([x['n_files'] for x in records \
+                              if x['parent'] is None]), \
+              'parameters': parameters if parameters is not None else {}, \
+              'settings': dict(settings), \
+              'summary': summarize(records), \
+              'stages': records}
+    
+    return(report)
+
+
+def write_report(fname, parameters=None):
+    """
+    Writes the run report to a json file
+    """
+    
+    report = get_report(parameters)
+    
+    folder = os.path.dirname(fname)
+    if folder != '':
+        os.makedirs(folder, exist_ok=True)
+    
+    with open(fname, 'w') as f:
+        json.dump(report, f, indent=1, default=float)
+    
+    return(report)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Helper for running independent tasks, e.g. test years, stations or
+building cases, in a pool of worker processes.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import collections
+import os
+import concurrent.futures
+
+
+def get_n_workers(n_workers, n_tasks=None):
+    """
+    Returns the number of worker processes to use. If n_workers is
+    None or 0, the number of CPUs is used. There are never more workers
+    than tasks, if the number of tasks is known.
+    """
+    
+    if n_workers is None or n_workers == 0:
+        n_workers = os.cpu_count() or 1
+    
+    n_workers = max(1, int(n_workers))
+    
+    if n_tasks is not None:
+        n_workers = max(1, min(n_workers, n_tasks))
+    
+    return(n_workers)
+
+
+def map_tasks(func, tasks, n_workers=1):
+    """
+    Calls func(*task) for each task in the list tasks and returns the
+    results in the same order as the tasks.
+    
+    If n_workers is 1, the tasks are run one after another in the current
+    process. Otherwise the tasks are distributed to a process pool, in
+    which case func, the tasks and the results have to be picklable.
+    An exception in a task is raised again in the calling process.
+    """
+    
+    tasks = list(tasks)
+    
+    if len(tasks) == 0:
+        return([])
+    
+    n_workers = get_n_workers(n_workers, len(tasks))
+    
+    if n_workers == 1:
+        results = [func(*task) for task in tasks]
+    
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(func, *task) for task in tasks]
+            results = [future.result() for future in futures]
+    
+    return(results)
+
+
+def imap_tasks(func, tasks, n_workers=1, max_pending=None):
+    """
+    Generator version of map_tasks(). The tasks can be any iterable and
+    they are consumed lazily: at most max_pending tasks (default
+    2*n_workers) are submitted to the process pool at a time, so the
+    memory use does not depend on the number of tasks.
+    The results are yielded in the same order as the tasks.
+    """
+    
+    n_workers = get_n_workers(n_workers)
+    
+    if n_workers == 1:
+        for task in tasks:
+            yield(func(*task))
+        return
+    
+    if max_pending is None:
+        max_pending = 2*n_workers
+    
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(executor.submit(func, *task))
+            if len(pending) >= max_pending:
+                yield(pending.popleft().result())
+        
+        while len(pending) > 0:
+            yield(pending.popleft().result())
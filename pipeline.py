@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Runs LWrad.py and climate_files.py as one process.
+
+The longwave radiation is calculated with the LWrad class and the LWdn
+arrays are passed directly to the climate file stage, so the csv files
+in the LWrad folder are not needed. They can still be written by setting
+export_LWrad_csv = True.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import itertools
+import data_cache
+import LWrad
+import climate_files
+import incremental
+import plots
+import prn_files
+import instrumentation
+
+
+def calc_LWrad(data, n_workers=1, make_plots=True, export_csv=False):
+    """
+    Calculates the longwave radiation of the test years in the
+    dictionary data. Returns a dictionary of LWrad objects.
+    """
+    
+    year_names = list(data.keys())
+    
+    d = LWrad.main(data, year_names, climate_files.test_year_titles, \
+                   make_plots, n_workers, export_csv)
+    
+    return(d)
+
+
+def render_LWrad_plots_incremental(data, d_LWrad, n_workers=1, \
+                                   state_fname=incremental.state_fname_default):
+    """
+    Renders only those LWrad figures, whose input data or code has
+    changed since the previous run
+    """
+    
+    state = incremental.BuildState(state_fname)
+    code_hash = incremental.hash_files(incremental.get_module_files([LWrad]))
+    
+    fingerprints = {}
+    for year_name in data.keys():
+        input_hash = incremental.hash_array( \
+                        data[year_name].loc[:, prn_files.data_col_names].values)
+        fingerprint = incremental.calc_fingerprint({'code': code_hash, \
+                                                    'input': input_hash})
+        for job in d_LWrad[year_name].get_plot_jobs():
+            fingerprints[job['fname']] = fingerprint
+    
+    stale = state.get_stale(fingerprints)
+    
+    jobs = itertools.chain.from_iterable( \
+                [d_LWrad[year_name].get_plot_jobs() for year_name in data.keys()])
+    plots.render_plots((job for job in jobs if job['fname'] in stale), \
+                       n_workers)
+    
+    state.update({fname: fingerprints[fname] for fname in stale})
+    state.save()
+
+
+def run_pipeline(year_names=None, input_folder='./input', n_workers=1, \
+                 make_plots=True, export_LWrad_csv=False, \
+                 incremental_build=False, formats=None):
+    """
+    Reads the test years, calculates the longwave radiation and writes
+    the climate files. year_names is a list of test years, e.g.
+    ['jok2004', 'van2007'], or None for all eight test years.
+    If incremental_build is True, only the outdated output files and
+    figures are written, see incremental.py. formats is a list of the
+    output formats of climate_files.py, e.g. ['WUFI'], or None for all.
+    Returns a dictionary of the processed dataframes of climate_files.py.
+    """
+    
+    with instrumentation.stage('read'):
+        data = data_cache.load_test_years(year_names, input_folder)
+    
+    if incremental_build:
+        d_LWrad = calc_LWrad(data, n_workers, False, export_LWrad_csv)
+        if make_plots:
+            with instrumentation.stage('LWrad_plots'):
+                render_LWrad_plots_incremental(data, d_LWrad, n_workers)
+    else:
+        d_LWrad = calc_LWrad(data, n_workers, make_plots, export_LWrad_csv)
+    
+    LWdn = {}
+    for year_name in data.keys():
+        LWdn[year_name] = d_LWrad[year_name].LWdn
+    
+    output = climate_files.run(data, n_workers, make_plots, LWdn, \
+                               incremental_build, formats=formats)
+    
+    return(output)
+
+
+
+if __name__ == '__main__':
+
+    instrumentation.settings['profile_stage'] = climate_files.profile_stage
+    instrumentation.settings['profile_mode'] = climate_files.profile_mode
+    
+    output = run_pipeline(n_workers=climate_files.n_workers, \
+                          make_plots=climate_files.make_plots, \
+                          incremental_build=climate_files.incremental_build)
+    
+    if climate_files.run_report_fname is not None:
+        instrumentation.write_report(climate_files.run_report_fname, \
+                                     climate_files.get_run_parameters())
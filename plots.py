@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Plotting stage for the figures of LWrad.py and climate_files.py.
+
+The figures are described as plot jobs (dictionaries), which are created
+by the calculation stages and rendered separately. The jobs are drawn
+with the non-interactive Agg backend to a single reused figure in each
+process, without pyplot, so that no figures are left open. The jobs are
+consumed lazily and rendered in batches in a pool of worker processes,
+so the memory use stays flat regardless of the number of figures.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import itertools
+import os
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import parallel
+import instrumentation
+
+
+# The reused figure of the current process
+_figure = None
+
+
+def line_plot_job(fname, y, title, xlabel, ylabel, \
+                  xlim=None, ylim=None, figsize=None, \
+                  linewidth=None, dpi=200):
+    """
+    Returns the description of a line plot of y
+    
+    fname is the name of the png file
+    xlim and ylim are (min, max) tuples or None for automatic limits
+    figsize is (width, height) in inches or None for the default size
+    """
+    
+    if figsize is None:
+        figsize = tuple(matplotlib.rcParams['figure.figsize'])
+    
+    job = {'fname': fname, \
+           'y': y, \
+           'title': title, \
+           'xlabel': xlabel, \
+           'ylabel': ylabel, \
+           'xlim': xlim, \
+           'ylim': ylim, \
+           'figsize': figsize, \
+           'linewidth': linewidth, \
+           'dpi': dpi}
+    
+    return(job)
+
+
+def get_figure():
+    """
+    Returns the figure of the current process, which is created
+    on the first call
+    """
+    
+    global _figure
+    
+    if _figure is None:
+        _figure = Figure()
+        FigureCanvasAgg(_figure)
+    
+    return(_figure)
+
+
+def render_line_plot(job):
+    """
+    Draws one plot job to the reused figure and saves it to a png file
+    """
+    
+    fig = get_figure()
+    fig.clear()
+    fig.set_size_inches(job['figsize'])
+    
+    ax = fig.add_subplot()
+    ax.plot(job['y'], linewidth=job['linewidth'])
+    ax.grid()
+    ax.set_title(job['title'])
+    ax.set_xlabel(job['xlabel'])
+    ax.set_ylabel(job['ylabel'])
+    if job['xlim'] is not None:
+        ax.set_xlim(job['xlim'])
+    if job['ylim'] is not None:
+        ax.set_ylim(job['ylim'])
+    
+    folder = os.path.dirname(job['fname'])
+    if folder != '':
+        os.makedirs(folder, exist_ok=True)
+    
+    fig.savefig(job['fname'], dpi=job['dpi'], bbox_inches='tight')
+    fig.clear()
+    
+    return(job['fname'])
+
+
+def render_line_plots(jobs):
+    """
+    Renders a batch of plot jobs and returns the file names
+    """
+    
+    fnames = [render_line_plot(job) for job in jobs]
+    
+    return(fnames)
+
+
+def make_batches(jobs, batch_size):
+    """
+    Yields the jobs in batches of batch_size jobs, as tasks for
+    parallel.imap_tasks()
+    """
+    
+    jobs = iter(jobs)
+    while True:
+        batch = list(itertools.islice(jobs, batch_size))
+        if len(batch) == 0:
+            return
+        yield((batch,))
+
+
+def render_plots(jobs, n_workers=1, batch_size=10):
+    """
+    Renders the plot jobs, which can be any iterable, e.g. a generator.
+    The jobs are sent to n_workers processes (None or 0 = number of CPUs)
+    in batches of batch_size jobs. Only a few batches are in memory at
+    a time. Returns the number of rendered figures.
+    """
+    
+    n_figures = 0
+    batches = make_batches(jobs, batch_size)
+    for fnames in parallel.imap_tasks(render_line_plots, batches, n_workers):
+        n_figures += len(fnames)
+        for fname in fnames:
+            instrumentation.record_output(fname)
+    
+    return(n_figures)
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Reads the hourly building physical test year data directly from the
+.prn files of the Finnish Meteorological Institute.
+
+The .prn files have one or more header rows and 13 fixed-width data
+columns: time step, year, month, day, hour, Te, RHe_water, ws, wd,
+Rglob, Rdif, Rbeam and precip. This is the case both for the files in
+the folder input/originals and the renamed files in the folder input.
+See input/Description_of_input_data.md for the descriptions of the
+variables.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import io
+import os
+import numpy as np
+import pandas as pd
+
+
+# Names of the data columns, the first five are the time columns
+prn_col_names = ['t', 'year', 'month', 'day', 'hour', \
+                 'Te', 'RHe_water', 'ws', 'wd', \
+                 'Rglob', 'Rdif', 'Rbeam', 'precip']
+
+# Columns that are used in the calculations, in the same order as in the
+# xlsx file bf_test_years_2020-04-20.xlsx
+data_col_names = prn_col_names[5:]
+
+# The renamed files in the folder input
+prn_fnames = {'jok2004': 'jok2004.prn', \
+              'jok2030': 'jok2030.prn', \
+              'jok2050': 'jok2050.prn', \
+              'jok2100': 'jok2100.prn', \
+              'van2007': 'van2007.prn', \
+              'van2030': 'van2030.prn', \
+              'van2050': 'van2050.prn', \
+              'van2100': 'van2100.prn'}
+
+# The files as they were downloaded from the FMI website
+prn_fnames_originals = {'jok2004': 'originals/Jokioinen-04.prn', \
+                        'jok2030': 'originals/Jokioinen-04_A2-2030.prn', \
+                        'jok2050': 'originals/Jokioinen-04_A2-2050.prn', \
+                        'jok2100': 'originals/Jokioinen-04_A2-2100.prn', \
+                        'van2007': 'originals/Vantaa-07.prn', \
+                        'van2030': 'originals/Vantaa-07_A2-2030.prn', \
+                        'van2050': 'originals/Vantaa-07_A2-2050.prn', \
+                        'van2100': 'originals/Vantaa-07_A2-2100.prn'}
+
+
+def count_header_lines(contents):
+    """
+    Returns the number of header rows in the beginning of the file,
+    i.e. the rows before the first row that starts with a number
+    """
+    
+    n_header = 0
+    for line in contents.splitlines():
+        tokens = line.split()
+        if len(tokens) > 0:
+            try:
+                float(tokens[0])
+                break
+            except ValueError:
+                pass
+        n_header += 1
+    
+    return(n_header)
+
+
+def remove_leap_days(X):
+    """
+    Removes the leap day (Feb 29th) from each year that has 366 days.
+    
+    The leap day is removed by position, i.e. the hours 1416-1439 from the
+    beginning of the year, because the day column is not reliable in all
+    files (Jokioinen 2004 has two hours of Feb 29th marked as Feb 28th).
+    The year is taken from the year column.
+    """
+    
+    years = X[:, 1]
+    idx_year_starts = np.flatnonzero(np.diff(years, prepend=np.nan) != 0)
+    year_lengths = np.diff(np.append(idx_year_starts, len(years)))
+    
+    idx_remove = [np.arange(59*24, 60*24) + idx_start \
+                  for idx_start, n in zip(idx_year_starts, year_lengths) \
+                  if n == 366*24]
+    
+    if len(idx_remove) > 0:
+        X = np.delete(X, np.concatenate(idx_remove), axis=0)
+    
+    return(X)
+
+
+def get_time_index(X, remove_leap_day=True):
+    """
+    Returns a pandas DatetimeIndex for the rows of the array read with
+    read_prn(). The rows are hourly and contiguous from the time of the
+    first row, because the day column is shifted by two hours in the
+    files. If remove_leap_day is True, Feb 29th is skipped in the same
+    way as in remove_leap_days().
+    """
+    
+    n_steps = X.shape[0]
+    t_start = pd.Timestamp(year=int(X[0, 1]), month=int(X[0, 2]), \
+                           day=int(X[0, 3]), hour=int(X[0, 4]))
+    
+    if remove_leap_day:
+        n_leap_days_max = n_steps // 8760 + 1
+        time_index = pd.date_range(t_start, periods=n_steps+24*n_leap_days_max, \
+                                   freq='h')
+        is_leap_day = (time_index.month == 2) & (time_index.day == 29)
+        time_index = time_index[~is_leap_day][0:n_steps]
+    else:
+        time_index = pd.date_range(t_start, periods=n_steps, freq='h')
+    
+    return(time_index)
+
+
+def read_prn(fname, remove_leap_day=True):
+    """
+    Reads one FMI .prn file into a float array with the 13 columns
+    listed in prn_col_names.
+    
+    If remove_leap_day is True, Feb 29th is removed from leap years,
+    which is the same as what was done manually for the xlsx file.
+    The number of rows has to be an integer multiple of 24.
+    """
+    
+    with open(fname, 'rb') as f:
+        contents = f.read()
+    
+    n_header = count_header_lines(contents)
+    
+    X = np.loadtxt(io.BytesIO(contents), skiprows=n_header, \
+                   dtype=float, encoding='latin-1', ndmin=2)
+    
+    if X.shape[1] != len(prn_col_names):
+        raise ValueError('Expected ' + str(len(prn_col_names)) \
+                         + ' columns in ' + fname \
+                         + ', found ' + str(X.shape[1]))
+    
+    if remove_leap_day:
+        X = remove_leap_days(X)
+    
+    if X.shape[0] % 24 != 0:
+        raise ValueError('The number of data rows in ' + fname \
+                         + ' is not an integer multiple of 24: ' \
+                         + str(X.shape[0]))
+    
+    return(X)
+
+
+def read_test_year(fname, remove_leap_day=True, time_index=False):
+    """
+    Returns a pandas dataframe with the same columns as in the
+    xlsx file: Te, RHe_water, ws, wd, Rglob, Rdif, Rbeam and precip
+    
+    The file can also be a longer record, e.g. 30 years of hourly data.
+    If time_index is True, the dataframe is indexed with the real time
+    stamps (see get_time_index()), otherwise with 0...n_steps-1.
+    """
+    
+    X = read_prn(fname, remove_leap_day)
+    
+    data = pd.DataFrame(X[:, 5:], columns=data_col_names)
+    
+    if time_index:
+        data.index = get_time_index(X, remove_leap_day)
+    
+    return(data)
+
+
+def read_test_years(year_names=None, input_folder='./input', \
+                    originals=False, remove_leap_day=True, time_index=False):
+    """
+    Reads several test years and returns a dictionary of pandas dataframes,
+    similarly to pd.read_excel(fname, sheet_name=year_names)
+    """
+    
+    if originals:
+        fnames = prn_fnames_originals
+    else:
+        fnames = prn_fnames
+    
+    if year_names is None:
+        year_names = list(fnames.keys())
+    
+    data = {}
+    for year_name in year_names:
+        fname = os.path.join(input_folder, fnames[year_name])
+        data[year_name] = read_test_year(fname, remove_leap_day, time_index)
+    
+    return(data)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Psychrometric functions for LWrad.py and climate_files.py.
+
+The saturation vapour pressures are from the CIMO guide (WMO No. 8).
+The functions take numpy arrays (or pandas series) and return numpy
+arrays. The result can be written to an existing array with the "out"
+argument, and the functions that need an intermediate array take it as
+the "work" argument, so that the same buffers can be reused e.g. for the
+batches of an ensemble (see LWrad.get_half_hour_buffers()). The
+calculations are done in place in the output and work arrays, so they
+must not be the same arrays as the inputs or each other.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import numpy as np
+
+
+# Gas constant of water vapour, J/(kg K)
+Rw = 461.5
+
+
+def get_out(T, out=None):
+    # Returns the output array, a new one if out is None
+    if out is None:
+        out = np.empty(np.shape(T))
+    return(out)
+
+
+def pvsat_water(T, out=None):
+    """
+    Saturation vapour pressure over liquid water, Pa
+    T is the temperature, degC
+    """
+    
+    T = np.asarray(T, dtype=float)
+    out = get_out(T, out)
+    
+    # 611.2*exp(17.62*T/(243.12+T))
+    np.add(T, 243.12, out=out)
+    np.divide(T, out, out=out)
+    np.multiply(out, 17.62, out=out)
+    np.exp(out, out=out)
+    np.multiply(out, 611.2, out=out)
+    
+    return(out)
+
+
+def pvsat_ice(T, out=None):
+    """
+    Saturation vapour pressure over ice below 0 degC and over liquid
+    water above it, Pa
+    T is the temperature, degC
+    """
+    
+    T = np.asarray(T, dtype=float)
+    out = get_out(T, out)
+    
+    is_ice = T < 0
+    is_water = ~is_ice
+    
+    np.add(T, 243.12, out=out, where=is_water)
+    np.add(T, 272.62, out=out, where=is_ice)
+    np.divide(T, out, out=out)
+    np.multiply(out, 17.62, out=out, where=is_water)
+    np.multiply(out, 22.46, out=out, where=is_ice)
+    np.exp(out, out=out)
+    np.multiply(out, 611.2, out=out)
+    
+    return(out)
+
+
+def vapour_content(T, RH, out=None, work=None):
+    """
+    Water vapour content of air, kg/m3
+    T is the temperature, degC
+    RH is the relative humidity with respect to liquid water, %
+    The saturation vapour content is vapour_content(T, 100.0)
+    """
+    
+    T = np.asarray(T, dtype=float)
+    RH = np.asarray(RH, dtype=float)
+    out = pvsat_water(T, out)
+    work = get_out(T, work)
+    
+    np.multiply(out, RH, out=out)
+    np.divide(out, 100.0, out=out)
+    
+    # Rw*(273.15+T)
+    np.add(T, 273.15, out=work)
+    np.multiply(work, Rw, out=work)
+    np.divide(out, work, out=out)
+    
+    return(out)
+
+
+def dew_point(T, RH, out=None, work=None):
+    """
+    Dew point temperature, degC
+    T is the temperature, degC
+    RH is the relative humidity with respect to liquid water, %
+    
+    The constant 234.12 is used instead of 243.12 of pvsat_water(),
+    which is how the dew point has always been calculated in LWrad.py.
+    """
+    
+    T = np.asarray(T, dtype=float)
+    RH = np.asarray(RH, dtype=float)
+    out = get_out(T, out)
+    work = get_out(T, work)
+    
+    # x = ln(pv/611.2) = ln(RH/100) + 17.62*T/(234.12+T)
+    np.add(T, 234.12, out=out)
+    np.divide(T, out, out=out)
+    np.multiply(out, 17.62, out=out)
+    np.divide(RH, 100.0, out=work)
+    np.log(work, out=work)
+    np.add(out, work, out=out)
+    
+    # T_dew = 234.12*x/(17.62-x)
+    np.subtract(17.62, out, out=work)
+    np.multiply(out, 234.12, out=out)
+    np.divide(out, work, out=out)
+    
+    return(out)
+
+
+def rh_water_to_ice(T, RH_water, out=None, work=None):
+    """
+    Converts the relative humidity with respect to liquid water to
+    relative humidity with respect to ice (below 0 degC), %
+    """
+    
+    T = np.asarray(T, dtype=float)
+    out = pvsat_water(T, out)
+    
+    np.divide(out, pvsat_ice(T, work), out=out)
+    np.multiply(out, np.asarray(RH_water, dtype=float), out=out)
+    
+    return(out)
+
+
+def rh_ice_to_water(T, RH_ice, out=None, work=None):
+    """
+    Converts the relative humidity with respect to ice (below 0 degC)
+    to relative humidity with respect to liquid water, %
+    """
+    
+    T = np.asarray(T, dtype=float)
+    out = pvsat_ice(T, out)
+    
+    np.divide(out, pvsat_water(T, work), out=out)
+    np.multiply(out, np.asarray(RH_ice, dtype=float), out=out)
+    
+    return(out)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Semi-empirical models for the effective sky emissivity.
+
+The models are collected to the dictionary "models", from the model name
+to a function that calculates the emissivity from the shared intermediate
+variables (see calc_intermediates()). All models are calculated in one
+pass with calc_emissivities(), which returns a (n_models, n_steps) array.
+The model that is used in LWrad.py is 'Mundt-Petersen'.
+
+References:
+Brunt D 1932, Notes on radiation in the atmosphere, Quarterly Journal of
+the Royal Meteorological Society 58, pp. 389-420
+Swinbank W C 1963, Long-wave radiation from clear skies, Quarterly
+Journal of the Royal Meteorological Society 89, pp. 339-348
+Berdahl P & Martin M 1984, Emissivity of clear skies, Solar Energy 32,
+pp. 663-664
+Clark G & Allen C 1978, The estimation of atmospheric radiation for
+clear and cloudy skies, Proc. 2nd National Passive Solar Conference
+(the clear and cloudy sky models in ASHRAE Fundamentals and EnergyPlus)
+Kasten F & Czeplak G 1980, Solar and terrestrial radiation dependent on
+the amount and type of cloud, Solar Energy 24, pp. 177-189
+Mundt-Petersen S & Wallentén P 2014, see README.md
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import numpy as np
+
+
+# Clearness index of a clear sky, which is used to estimate the cloud cover
+K_t_clear = 0.75
+
+
+def calc_intermediates(T_air, T_dew, K_t):
+    """
+    Returns a dictionary of the variables that are shared by the models
+    
+    T_air is the air temperature, K
+    T_dew is the dew point temperature, degC, from LWrad.calc_T_dew()
+    K_t is the clearness index, -
+    """
+    
+    T_air = np.asarray(T_air, dtype=float)
+    T_dew = np.asarray(T_dew, dtype=float)
+    K_t = np.asarray(K_t, dtype=float)
+    
+    # Water vapour pressure, hPa, with the same constants that were used
+    # in LWrad.calc_T_dew()
+    p_v = 6.112 * np.exp((17.62*T_dew) / (234.12+T_dew))
+    
+    # Cloud cover (0...1) from the clearness index, Kasten & Czeplak:
+    # K_t/K_t_clear = 1 - 0.75*N**3.4
+    K_t_ratio = np.clip(K_t / K_t_clear, 0.0, 1.0)
+    cloud_cover = np.minimum(((1.0 - K_t_ratio) / 0.75)**(1/3.4), 1.0)
+    
+    v = {'T_air': T_air, \
+         'T_dew': T_dew, \
+         'K_t': K_t, \
+         'p_v': p_v, \
+         'cloud_cover': cloud_cover}
+    
+    return(v)
+
+
+def emissivity_mundt_petersen(T_dew, T_air, K_t):
+    # Mundt-Petersen & Wallentén (2014), all sky conditions
+    epsilon = 1.5357 \
+                + 0.5981*(T_dew/100) \
+                - 0.5687*(T_air/273.15) \
+                - 0.2799*K_t
+    return(epsilon)
+
+
+def emissivity_brunt(v):
+    # Brunt (1932), clear sky, vapour pressure in hPa
+    return(0.52 + 0.065*np.sqrt(v['p_v']))
+
+
+def emissivity_swinbank(v):
+    # Swinbank (1963), clear sky, air temperature only
+    return(9.365e-6 * v['T_air']**2)
+
+
+def emissivity_berdahl_martin(v):
+    # Berdahl & Martin (1984), clear sky, without the diurnal and
+    # air pressure corrections
+    x = v['T_dew'] / 100
+    return(0.711 + 0.56*x + 0.73*x**2)
+
+
+def emissivity_ashrae_clear(v):
+    # Clark & Allen (1978), clear sky
+    return(0.787 + 0.764*np.log((v['T_dew'] + 273.15) / 273.0))
+
+
+def emissivity_ashrae_cloudy(v):
+    # Clark & Allen (1978), cloud cover N in tenths
+    N = 10.0 * v['cloud_cover']
+    return(emissivity_ashrae_clear(v) \
+           * (1.0 + 0.0224*N - 0.0035*N**2 + 0.00028*N**3))
+
+
+models = {'Mundt-Petersen': lambda v: emissivity_mundt_petersen( \
+                                        v['T_dew'], v['T_air'], v['K_t']), \
+          'Brunt': emissivity_brunt, \
+          'Swinbank': emissivity_swinbank, \
+          'Berdahl-Martin': emissivity_berdahl_martin, \
+          'ASHRAE clear': emissivity_ashrae_clear, \
+          'ASHRAE cloudy': emissivity_ashrae_cloudy}
+
+
+def calc_emissivities(T_air, T_dew, K_t, model_names=None, out=None):
+    """
+    Calculates the effective sky emissivity with several models and
+    returns a (n_models, n_steps) array. The rows are in the order of
+    model_names, which is by default all the models in "models".
+    out is an optional array of the same shape for the results.
+    """
+    
+    if model_names is None:
+        model_names = list(models.keys())
+    
+    unknown = [x for x in model_names if x not in models]
+    if len(unknown) > 0:
+        raise ValueError('Unknown sky emissivity model(s): ' \
+                         + ', '.join(unknown))
+    
+    v = calc_intermediates(T_air, T_dew, K_t)
+    
+    if out is None:
+        out = np.empty((len(model_names), v['T_air'].size))
+    
+    for idx, model_name in enumerate(model_names):
+        out[idx, :] = models[model_name](v)
+    
+    return(out)
+
+
+def calc_LWdn(epsilon_sky, T_air, sigma_SB=5.67e-8):
+    """
+    Returns the downward longwave radiation, W/m2, for each row of
+    epsilon_sky, which can be the output of calc_emissivities()
+    """
+    
+    return(np.asarray(epsilon_sky) * (sigma_SB * np.asarray(T_air)**4))
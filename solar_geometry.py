@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Solar geometry for hourly data, with a memory cache.
+
+The declination, equation of time, apparent solar time, hour angle,
+eccentricity factor and the extraterrestrial solar radiation to a
+horizontal surface depend only on the location and the time axis, not on
+the weather data. Test years of the same station (e.g. jok2004, jok2030,
+jok2050 and jok2100) therefore share the same solar geometry. The results
+are kept in a least recently used (LRU) cache keyed by (latitude,
+longitude, time axis), and the cached arrays are read-only.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import collections
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+# Solar constant, W/m2
+I_sc = 1367.0
+
+# Maximum number of cached locations and time axes
+cache_size = 32
+
+_cache = collections.OrderedDict()
+cache_info = {'hits': 0, 'misses': 0}
+
+
+def calc_hour_of_year(n_steps, time_index=None):
+    """
+    Returns the time from the beginning of the year (h), the length of
+    the year (h) and the clock hour for each time step.
+    
+    If time_index (pandas DatetimeIndex) is not given, the data is assumed
+    to start from Jan 1st 00:00 and each year is assumed to be 8760 hours.
+    """
+    
+    if time_index is None:
+        t_year = np.arange(n_steps) % 8760
+        year_hours = 8760.0
+        clock_hour = np.arange(n_steps) % 24
+    
+    else:
+        year_start = pd.to_datetime(time_index.year.astype(str), format='%Y')
+        t_year = np.asarray((time_index - year_start) / pd.Timedelta(hours=1))
+        year_hours = np.where(time_index.is_leap_year, 8784.0, 8760.0)
+        clock_hour = np.asarray(time_index.hour)
+    
+    return(t_year, year_hours, clock_hour)
+
+
+def get_time_axis_key(n_steps, time_index=None):
+    # Hashable description of the time axis
+    
+    if time_index is None:
+        return(('hours', n_steps))
+    
+    h = hashlib.sha256(np.ascontiguousarray(time_index.asi8).tobytes())
+    
+    return(('index', n_steps, h.hexdigest()))
+
+
+def calc_solar_geometry(latitude, longitude, n_steps, time_index=None, \
+                        time_zone=2.0):
+    """
+    Calculates the solar geometry without the cache, see get_solar_geometry()
+    
+    latitude, longitude and time_zone can also be (n_stations, 1) arrays,
+    and then the results are (n_stations, n_steps) arrays, see
+    LWrad.calc_stations()
+    """
+    
+    latitude_rad = latitude * (np.pi/180)
+    
+    t_year, year_hours, clock_hour = calc_hour_of_year(n_steps, time_index)
+    t = t_year + 0.5
+    
+    # Declination angle
+    declination_rad = 23.45 * (np.pi/180) \
+                        * np.sin(2*np.pi * (t-1944)/year_hours)
+    
+    # Time of day
+    CL = clock_hour + 0.5
+    
+    # Equation of time
+    Gamma = 2*np.pi * (t/year_hours)
+    dummy1 = 0.0075 \
+            + 0.1868*np.cos(Gamma) \
+            - 3.2077*np.sin(Gamma) \
+            - 1.4615*np.cos(2*Gamma) \
+            -4.089*np.sin(2*Gamma)
+    ET = 2.2918*dummy1
+    
+    # Apparent solar time
+    AST = CL + ET/60.0 + (longitude-15.0*time_zone)/15.0
+    
+    # Hour angle
+    omega_rad = (np.pi/180) * 15 * (AST - 12.0)
+    
+    # Eccentricity factor
+    r = 1 + 0.033 * np.cos(2*np.pi*(t-3*24)/year_hours)
+    
+    # Solar radiation to horizontal surface without atmosphere
+    dummy2 = np.cos(latitude_rad) \
+            * np.cos(declination_rad) \
+            * np.cos(omega_rad) \
+            + np.sin(latitude_rad) * np.sin(declination_rad)
+    I_0 = r * I_sc * dummy2
+    
+    geometry = {'year_hours': year_hours, \
+                'declination_rad': declination_rad, \
+                'CL': CL, \
+                'Gamma': Gamma, \
+                'ET': ET, \
+                'AST': AST, \
+                'omega_rad': omega_rad, \
+                'r': r, \
+                'I_0': I_0}
+    
+    return(geometry)
+
+
+def get_solar_geometry(latitude, longitude, n_steps, time_index=None, \
+                       time_zone=2.0):
+    """
+    Returns a dictionary of the hourly solar geometry arrays, which are
+    read from the cache if the same location and time axis have been
+    calculated before. The time stamps are the middle points of the hours,
+    i.e. 00:30, 01:30, etc, because the measured solar radiation is the
+    mean flux from the previous hour.
+    
+    latitude and longitude are in degrees, North and East are positive
+    time_zone is the time zone of the data, h from UTC, see stations.py
+    time_index is a pandas DatetimeIndex or None, see calc_hour_of_year()
+    """
+    
+    key = (float(latitude), float(longitude), float(time_zone), \
+           get_time_axis_key(n_steps, time_index))
+    
+    if key in _cache:
+        cache_info['hits'] += 1
+        _cache.move_to_end(key)
+        return(_cache[key])
+    
+    cache_info['misses'] += 1
+    
+    geometry = calc_solar_geometry(latitude, longitude, n_steps, time_index, \
+                                   time_zone)
+    for x in geometry.values():
+        if isinstance(x, np.ndarray):
+            x.flags.writeable = False
+    
+    _cache[key] = geometry
+    while len(_cache) > cache_size:
+        _cache.popitem(last=False)
+    
+    return(geometry)
+
+
+def clear_cache():
+    # Empties the cache and resets the statistics
+    _cache.clear()
+    cache_info['hits'] = 0
+    cache_info['misses'] = 0
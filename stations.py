@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of the weather stations.
+
+Each station has a name, which is also the prefix of the names of its
+test years (e.g. 'jok' -> jok2004, jok2030, ...), the latitude and
+longitude (deg, North and East are positive), the altitude (m above sea
+level) and the time zone of the data (h from UTC). All stages look the
+location up from here, e.g. LWrad.py for the solar geometry and
+climate_files.py for the headers of the WUFI files.
+
+More stations, e.g. the grid points of the Finnish Meteorological
+Institute, can be added with add_station() or read from a csv file with
+the columns name, latitude, longitude, altitude and time_zone with
+read_stations().
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import pandas as pd
+
+
+# jok as in Jokioinen, van as in Vantaa, hol as in Holzkirchen
+stations = {'jok': {'longitude': 23.50, \
+                    'latitude': 60.81, \
+                    'altitude': 104, \
+                    'time_zone': 2.0}, \
+            'van': {'longitude': 24.96, \
+                    'latitude': 60.33, \
+                    'altitude': 51, \
+                    'time_zone': 2.0}, \
+            'hol': {'longitude': 11.70, \
+                    'latitude': 47.88, \
+                    'altitude': 680, \
+                    'time_zone': 1.0}}
+
+
+def add_station(name, latitude, longitude, altitude, time_zone=2.0):
+    """
+    Adds a station to the registry, or replaces the station with the
+    same name
+    """
+    
+    stations[name] = {'longitude': float(longitude), \
+                      'latitude': float(latitude), \
+                      'altitude': float(altitude), \
+                      'time_zone': float(time_zone)}
+    
+    return(stations[name])
+
+
+def read_stations(fname):
+    """
+    Adds the stations of a csv file to the registry and returns their
+    names
+    """
+    
+    df = pd.read_csv(fname, dtype={'name': str})
+    
+    for row in df.itertuples(index=False):
+        add_station(row.name, row.latitude, row.longitude, row.altitude, \
+                    row.time_zone)
+    
+    return(list(df.loc[:, 'name']))
+
+
+def get_station_name(year_name):
+    """
+    Returns the name of the station of a test year: the year name itself,
+    if it is in the registry, otherwise the longest station name that the
+    year name starts with, e.g. 'jok2004' -> 'jok'
+    """
+    
+    if year_name in stations:
+        return(year_name)
+    
+    names = [name for name in stations.keys() if year_name.startswith(name)]
+    if len(names) == 0:
+        raise KeyError('Unknown station of the test year: ' + year_name)
+    
+    return(max(names, key=len))
+
+
+def get_station(year_name):
+    # Returns the station dictionary of a test year, see get_station_name()
+    return(stations[get_station_name(year_name)])
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Background writer threads for the output files.
+
+The text files of a test year (csv, Delphin 5, Delphin 6 and WUFI) are
+written by a pool of writer threads, so that the calculation of the next
+test year is not waiting for the disk:
+
+    with writer_pool.WriterPool(n_threads=2):
+        ...
+        writer_pool.submit(fname, writers.write_ccd, fname, header, x)
+
+submit() calls func(*args) in a writer thread of the pool that is open
+in this process, or directly if no pool is open. The jobs wait in a
+queue of max_pending jobs. When the queue is full, submit() blocks until
+a writer thread has taken the next job, so the data of at most
+max_pending files is kept in memory at a time.
+
+If a job raises an exception, the remaining jobs are not written and an
+OSError with the file name is raised in the calling thread, with the
+exception as its cause, by the next submit() or at the end of the
+with-statement, at the latest. The with-statement ends only after all
+files have been written.
+
+The written files are recorded to the stages that were running when the
+job was submitted, see instrumentation.py. The files are formatted and
+written in the background, so the wall time of e.g. the stage write_csv
+is only the time of preparing and queueing the data.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import collections
+import os
+import queue
+import threading
+
+import instrumentation
+
+
+# Maximum number of jobs waiting in the queue
+max_pending_default = 16
+
+# The pool that is open in this process, see get_pool()
+_active = []
+
+
+class WriterPool():
+    """
+    Writes files in n_threads background threads, see the module
+    docstring
+    """
+    
+    def __init__(self, n_threads=2, max_pending=max_pending_default):
+    
+        self.n_threads = max(1, int(n_threads))
+        self.max_pending = max(1, int(max_pending))
+        self.pid = os.getpid()
+        
+        self._queue = queue.Queue(maxsize=self.max_pending)
+        self._threads = []
+        self._completed = collections.deque()
+        self._error = None
+        self._error_lock = threading.Lock()
+    
+    
+    def __enter__(self):
+        self.start()
+        _active.append(self)
+        return(self)
+    
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active.remove(self)
+        # An exception of the caller is not replaced by a write error
+        self.close(cancel=exc_type is not None, raise_error=exc_type is None)
+        return(False)
+    
+    
+    def start(self):
+        for idx in range(self.n_threads):
+            thread = threading.Thread(target=self._work, daemon=True, \
+                                      name='writer_' + str(idx))
+            thread.start()
+            self._threads.append(thread)
+    
+    
+    def _work(self):
+        # Runs the jobs of the queue until the sentinel None
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                fname, records, func, args = job
+                if self._error is not None:
+                    continue
+                try:
+                    func(*args)
+                except Exception as e:
+                    with self._error_lock:
+                        if self._error is None:
+                            self._error = (fname, e)
+                    continue
+                self._completed.append((fname, records))
+            finally:
+                self._queue.task_done()
+    
+    
+    def _record_completed(self):
+        # Adds the written files to the stages, in the calling thread
+        while len(self._completed) > 0:
+            fname, records = self._completed.popleft()
+            instrumentation.record_output(fname, records)
+    
+    
+    def raise_error(self):
+        """
+        Raises the exception of the first failed job, if any, as the
+        cause of an OSError with the name of the file
+        """
+        
+        if self._error is not None:
+            fname, e = self._error
+            if fname is None:
+                raise e
+            raise OSError('Writing failed: ' + str(fname)) from e
+    
+    
+    def submit(self, fname, func, *args):
+        """
+        Adds the job func(*args), which writes the file fname, to the
+        queue. Blocks, if the queue is full.
+        """
+        
+        self.raise_error()
+        self._record_completed()
+        
+        self._queue.put((fname, instrumentation.get_running_stages(), \
+                         func, args))
+    
+    
+    def wait(self):
+        """
+        Waits until all submitted files have been written
+        """
+        
+        self._queue.join()
+        self._record_completed()
+        self.raise_error()
+    
+    
+    def close(self, cancel=False, raise_error=True):
+        """
+        Waits for the submitted files and stops the threads. If cancel
+        is True, the jobs that have not been started are dropped.
+        """
+        
+        if cancel:
+            with self._error_lock:
+                if self._error is None:
+                    self._error = (None, RuntimeError('Writing cancelled'))
+        
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        
+        self._record_completed()
+        if raise_error:
+            self.raise_error()
+
+
+def get_pool():
+    """
+    Returns the pool that is open in this process, or None. The pool of a
+    parent process is not used in a forked worker process.
+    """
+    
+    if len(_active) > 0 and _active[-1].pid == os.getpid():
+        return(_active[-1])
+    return(None)
+
+
+def submit(fname, func, *args):
+    """
+    Writes the file fname with func(*args) in the open pool, or directly
+    if no pool is open in this process
+    """
+    
+    pool = get_pool()
+    
+    if pool is None:
+        func(*args)
+        instrumentation.record_output(fname)
+    else:
+        pool.submit(fname, func, *args)
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Writers for the climate data files.
+
+The data rows of a file are formatted with one string formatting
+operation using a template. In the Delphin files, the time columns are
+already filled in the template. The templates are cached, so each one
+is created only once for each number of time steps and number format.
+Each file is written with one buffered write call.
+
+Long series, e.g. 30-year records, are formatted and written in chunks
+of chunk_size time steps, so that the memory use does not depend on the
+length of the series. A test year is written as one chunk.
+
+If the file name ends with .gz or .zst, the file is compressed while it
+is written, see compressed_io.py. The read_* functions read the files
+back to numpy arrays.
+
+For the current status of code and license information, see:
+https://github.com/anssilaukkarinen/bfty
+
+"""
+
+import functools
+import numpy as np
+
+import compressed_io
+
+
+# Number of time steps that are formatted at a time
+chunk_size = 8784
+
+
+def write_csv(fname, header, x, number_format='%.2f'):
+    """
+    Writes a csv file of the output folder csv: the header row and the
+    rows 'time step (h) value', e.g. '0  -3.21'
+    """
+    
+    X = np.column_stack((np.arange(len(x)), x))
+    with compressed_io.open_text(fname, 'w') as f:
+        np.savetxt(f, X, fmt=('%-2d', number_format), header=header, \
+                   comments='')
+
+
+def read_csv(fname):
+    """
+    Reads a file of write_csv(). Returns the header without the time
+    column and the values.
+    """
+    
+    with compressed_io.open_text(fname, 'r') as f:
+        header = f.readline().rstrip('\n')
+        x = np.loadtxt(f, usecols=1, ndmin=1)
+    
+    return(header.split(None, 1)[1], x)
+
+
+@functools.lru_cache(maxsize=64)
+def get_ccd_template(n_steps, number_format='%.2f', t_start=0):
+    """
+    Returns the template for the data rows of a Delphin .ccd file,
+    e.g. '0    00:00:00 %.2f\\n1    01:00:00 %.2f\\n...'
+    The time columns are: day (left aligned, width 4) and hh:00:00
+    t_start is the time step (h) of the first row
+    """
+    
+    t = np.arange(t_start, t_start + n_steps)
+    hours = t % 24
+    days = (t - hours) // 24
+    
+    line_end = ' ' + number_format + '\n'
+    template = ''.join(['{:<4d} {:02d}:00:00'.format(day, hour) + line_end \
+                        for day, hour in zip(days.tolist(), hours.tolist())])
+    
+    return(template)
+
+
+def format_ccd_rows(x, number_format='%.2f', t_start=0):
+    """
+    Returns the data rows of a Delphin .ccd file as one string.
+    The output is the same as when each row is formatted with
+    '{:<4d} {:02d}:00:00 {:.2f}'.format(day, hour, val)
+    """
+    
+    x = np.asarray(x, dtype=float)
+    template = get_ccd_template(len(x), number_format, t_start)
+    
+    return(template % tuple(x.tolist()))
+
+
+def write_ccd(fname, header, x, number_format='%.2f'):
+    """
+    Writes a Delphin 5 or Delphin 6 climate data file (.ccd)
+    
+    fname is the name of the output file
+    header is the first row of the file, e.g. 'TEMPER C' in Delphin 5
+    or 'Temperature C' in Delphin 6
+    x is the hourly data, starting from Jan 1st 00:00
+    number_format is '%.2f' for most variables and '%.2e' for WDR
+    """
+    
+    x = np.asarray(x, dtype=float)
+    
+    with compressed_io.open_text(fname, 'w') as f:
+        f.write(header + '\n')
+        for t_start in range(0, len(x), chunk_size):
+            f.write(format_ccd_rows(x[t_start:t_start+chunk_size], \
+                                    number_format, t_start))
+
+
+def read_ccd(fname):
+    """
+    Reads a file of write_ccd(). Returns the header and the values.
+    """
+    
+    with compressed_io.open_text(fname, 'r') as f:
+        header = f.readline().rstrip('\n')
+        x = np.loadtxt(f, usecols=2, ndmin=1)
+    
+    return(header, x)
+
+
+@functools.lru_cache(maxsize=16)
+def get_wac_template(n_steps, n_cols, number_format='%.2f'):
+    """
+    Returns the template for the data rows of a WUFI .wac file,
+    i.e. n_steps rows with n_cols tab separated values
+    """
+    
+    row = '\t'.join([number_format]*n_cols) + '\n'
+    
+    return(row * n_steps)
+
+
+def get_wac_header(title, description, station, col_names, n_steps, \
+                   time_step=1):
+    """
+    Returns the header rows of a WUFI .wac file (WUFI_WAC_02 format)
+    
+    title is e.g. 'Jokioinen 2004'
+    description is e.g. 'A Finnish Building physical test year'
+    station is a dictionary with the keys 'longitude' (deg, East is
+    positive), 'latitude' (deg, North is positive), 'altitude' (m above 
+    mean sea level) and 'time_zone' (h from UTC, East is positive)
+    col_names are the WUFI keywords of the data columns, e.g. TA, HREL
+    """
+    
+    lines = ['WUFI®_WAC_02', \
+             "10\tLine Offset to 'Number of Data Columns'", \
+             title, \
+             description, \
+             '{:.2f}\tLongitude [°]; East is positive'.format(station['longitude']), \
+             '{:.2f}\tLatitude [°]; North is positive'.format(station['latitude']), \
+             '{:d}\tHeightAMSL [m]'.format(int(round(station['altitude']))), \
+             '{:.1f}\tTime Zone [h from UTC]; East is positive'.format(station['time_zone']), \
+             '{:d}\tTime Step [h]'.format(time_step), \
+             '{:d}\tNumber of DataLines'.format(n_steps), \
+             '{:d}\tNumber of DataColumns'.format(len(col_names)), \
+             '\t'.join(col_names)]
+    
+    return('\n'.join(lines) + '\n')
+
+
+def write_wac(fname, columns, station, title, \
+              description='A Finnish Building physical test year', \
+              number_format='%.2f'):
+    """
+    Writes a WUFI climate file (.wac)
+    
+    fname is the name of the output file
+    columns is a dictionary from the WUFI keywords to the hourly data,
+    e.g. {'TA': Te, 'HREL': RHe/100, ...}, in the order of the columns
+    station, title and description are explained in get_wac_header()
+    
+    The file is written with the Windows "ANSI" code page cp1252.
+    """
+    
+    col_names = list(columns.keys())
+    X = np.column_stack([np.asarray(columns[key], dtype=float) \
+                         for key in col_names])
+    n_steps, n_cols = X.shape
+    
+    with compressed_io.open_text(fname, 'w', encoding='cp1252') as f:
+        f.write(get_wac_header(title, description, station, col_names, \
+                               n_steps))
+        for t_start in range(0, n_steps, chunk_size):
+            X_chunk = X[t_start:t_start+chunk_size, :]
+            f.write(get_wac_template(X_chunk.shape[0], n_cols, number_format) \
+                    % tuple(X_chunk.ravel().tolist()))
+
+
+def read_wac(fname):
+    """
+    Reads a file of write_wac(). Returns the header rows (list) and a
+    dictionary from the WUFI keywords to the hourly data.
+    """
+    
+    with compressed_io.open_text(fname, 'r', encoding='cp1252') as f:
+        header = [f.readline().rstrip('\n') for idx in range(12)]
+        X = np.loadtxt(f, delimiter='\t', ndmin=2)
+    
+    col_names = header[-1].split('\t')
+    columns = {key: X[:, idx] for idx, key in enumerate(col_names)}
+    
+    return(header, columns)